@@ -0,0 +1,344 @@
+"""本地模拟的 Confluence 服务器，供基准测试使用
+
+实现爬虫用到的几个接口：
+- /rest/api/content/{id}                       页面详情（JSON）
+- /rest/api/content/{id}/child/page            子页面列表（JSON，start/limit 分页）
+- /pages/viewpage.action?pageId=               页面HTML，包含PDF导出链接
+- /plugins/pagetree/naturalchildren.action     页面树插件的子页面列表（HTML）
+- /spaces/flyingpdf/pdfpageexport.action       PDF导出
+- /__stats__                                   服务器端的请求统计（JSON）
+
+每类接口可以单独设置延迟和抖动，并按比例随机返回 504。
+单独运行: python -m benchmarks.fake_confluence --port 8090 --depth 3 --fanout 5
+"""
+import re
+import sys
+import json
+import time
+import random
+import argparse
+import threading
+from collections import deque
+from socketserver import ThreadingMixIn
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from urllib.parse import urlparse, parse_qs
+
+CONTENT_PATTERN = re.compile(r'^/rest/api/content/(\d+)$')
+CHILDREN_PATTERN = re.compile(r'^/rest/api/content/(\d+)/child/page$')
+
+ENDPOINTS = ('rest', 'children', 'viewpage', 'naturalchildren', 'pdf_export')
+
+# 合成页面森林的形状，见 PageForest.generate
+SHAPES = ('balanced', 'wide', 'deep', 'skewed')
+
+
+class PageForest:
+    """模拟的页面森林：每个根页面对应一个空间"""
+
+    def __init__(self, first_id=100000):
+        self.next_id = first_id
+        self.children = {}
+        self.space = {}
+        self.roots = []
+
+    def __len__(self):
+        return len(self.space)
+
+    def add_page(self, parent_id=None, space=None):
+        page_id = self.next_id
+        self.next_id += 1
+        self.children[page_id] = []
+        if parent_id is None:
+            self.roots.append(page_id)
+            self.space[page_id] = space or f"SP{len(self.roots)}"
+        else:
+            self.children[parent_id].append(page_id)
+            self.space[page_id] = self.space[parent_id]
+        return page_id
+
+    def version(self, page_id):
+        return page_id % 7 + 1
+
+    @classmethod
+    def build(cls, roots=3, depth=3, fanout=5, fanout_min=None, seed=0):
+        """生成 roots 棵树，每个页面有 fanout_min 到 fanout 个子页面，最深到 depth 层"""
+        rng = random.Random(seed)
+        fanout_min = fanout if fanout_min is None else fanout_min
+        forest = cls()
+        level = [forest.add_page() for _ in range(roots)]
+        for _ in range(depth):
+            next_level = []
+            for parent_id in level:
+                for _ in range(rng.randint(fanout_min, fanout)):
+                    next_level.append(forest.add_page(parent_id))
+            level = next_level
+        return forest
+
+    @classmethod
+    def generate(cls, shape, pages, roots=3, fanout=10, seed=0):
+        """生成共 pages 个页面的合成森林
+
+        - balanced: 按层展开，每个页面 fanout 个子页面
+        - wide: 所有页面都是根页面的直接子页面，子页面列表需要大量分页
+        - deep: 每个页面通常只有一个子页面，形成很深的链
+        - skewed: 按子页面数成比例挑选父页面（优先连接），少数页面拥有大量子页面
+        """
+        if shape not in SHAPES:
+            raise ValueError(f"未知的页面树形状: {shape}")
+        rng = random.Random(seed)
+        forest = cls()
+        for _ in range(roots):
+            forest.add_page()
+
+        if shape == 'skewed':
+            # 每个页面初始占一个名额，每多一个子页面再多占一个
+            weighted = list(forest.roots)
+            while len(forest) < pages:
+                parent_id = rng.choice(weighted)
+                weighted.append(parent_id)
+                weighted.append(forest.add_page(parent_id))
+            return forest
+
+        wide_fanout = -(-(pages - roots) // roots)
+        queue = deque(forest.roots)
+        while queue and len(forest) < pages:
+            parent_id = queue.popleft()
+            if shape == 'wide':
+                count = wide_fanout
+            elif shape == 'deep':
+                count = 2 if rng.random() < 0.05 else 1
+            else:
+                count = fanout
+            for _ in range(min(count, pages - len(forest))):
+                queue.append(forest.add_page(parent_id))
+        return forest
+
+    def depth(self):
+        """森林的最大深度（根页面深度为 0）"""
+        deepest = 0
+        level = list(self.roots)
+        while level:
+            level = [child_id for page_id in level for child_id in self.children[page_id]]
+            if level:
+                deepest += 1
+        return deepest
+
+
+class FakeConfluenceServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address, forest, latency=None, jitter=0.0, error_rate=0.0,
+                 pdf_size=64 * 1024, seed=0):
+        super().__init__(address, FakeConfluenceHandler)
+        self.forest = forest
+        # {endpoint: 秒}，未设置的接口没有延迟
+        self.latency = latency or {}
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.pdf_body = b'%PDF-1.4\n' + b'0' * max(pdf_size - 9, 0)
+        self.rng = random.Random(seed)
+        self.lock = threading.Lock()
+        self.requests = {endpoint: 0 for endpoint in ENDPOINTS}
+        self.injected_errors = 0
+        self.not_found = 0
+
+    @property
+    def base_url(self):
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def delay(self, endpoint):
+        """按接口类型模拟延迟，返回是否注入 504"""
+        with self.lock:
+            self.requests[endpoint] += 1
+            jitter = self.rng.uniform(-self.jitter, self.jitter) if self.jitter else 0.0
+            fail = self.error_rate and self.rng.random() < self.error_rate
+            if fail:
+                self.injected_errors += 1
+        wait = self.latency.get(endpoint, 0.0) * (1 + jitter)
+        if wait > 0:
+            time.sleep(wait)
+        return fail
+
+    def stats(self):
+        with self.lock:
+            return {
+                'pages': len(self.forest),
+                'requests': dict(self.requests),
+                'injected_errors': self.injected_errors,
+                'not_found': self.not_found
+            }
+
+
+class FakeConfluenceHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, format, *args):
+        pass
+
+    def send_body(self, status, body, content_type):
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def send_json(self, data, status=200):
+        self.send_body(status, json.dumps(data, ensure_ascii=False).encode('utf-8'), 'application/json')
+
+    def send_html(self, html, status=200):
+        self.send_body(status, html.encode('utf-8'), 'text/html;charset=UTF-8')
+
+    def not_found(self):
+        with self.server.lock:
+            self.server.not_found += 1
+        self.send_json({'statusCode': 404, 'message': 'No content found'}, status=404)
+
+    def page_json(self, page_id, expand):
+        forest = self.server.forest
+        data = {
+            'id': str(page_id),
+            'type': 'page',
+            'status': 'current',
+            'title': f"页面 {page_id}",
+            'space': {'key': forest.space[page_id]},
+            'version': {
+                'number': forest.version(page_id),
+                'by': {'displayName': '基准测试'},
+                'when': '2024-01-01T00:00:00.000+08:00'
+            },
+            '_links': {'webui': f"/pages/viewpage.action?pageId={page_id}"}
+        }
+        if 'children.page' in expand:
+            data['children'] = {'page': {'size': len(forest.children[page_id])}}
+        if 'body.view' in expand:
+            data['body'] = {'view': {'value': f"<p>页面 {page_id} 的内容</p>"}}
+        return data
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        query = {key: values[0] for key, values in parse_qs(url.query).items()}
+        forest = self.server.forest
+
+        if url.path == '/__stats__':
+            self.send_json(self.server.stats())
+            return
+
+        children_match = CHILDREN_PATTERN.match(url.path)
+        content_match = CONTENT_PATTERN.match(url.path)
+        match = children_match or content_match
+        if children_match:
+            endpoint = 'children'
+        elif content_match:
+            endpoint = 'rest'
+        elif url.path == '/pages/viewpage.action':
+            endpoint = 'viewpage'
+        elif url.path == '/plugins/pagetree/naturalchildren.action':
+            endpoint = 'naturalchildren'
+        elif url.path == '/spaces/flyingpdf/pdfpageexport.action':
+            endpoint = 'pdf_export'
+        else:
+            self.not_found()
+            return
+
+        if self.server.delay(endpoint):
+            self.send_html('<html><body>504 Gateway Time-out</body></html>', status=504)
+            return
+
+        page_id = int(match.group(1) if match else query.get('pageId', 0))
+        if page_id not in forest.children:
+            self.not_found()
+            return
+
+        if endpoint == 'children':
+            start = int(query.get('start', 0))
+            limit = int(query.get('limit', 25))
+            children = forest.children[page_id]
+            expand = query.get('expand', '')
+            data = {
+                'results': [
+                    dict(self.page_json(child_id, expand), extensions={'position': start + index})
+                    for index, child_id in enumerate(children[start:start + limit])
+                ],
+                'start': start,
+                'limit': limit,
+                'size': len(children[start:start + limit]),
+                '_links': {'base': self.server.base_url}
+            }
+            if start + limit < len(children):
+                data['_links']['next'] = (
+                    f"/rest/api/content/{page_id}/child/page?expand={expand}"
+                    f"&limit={limit}&start={start + limit}"
+                )
+            self.send_json(data)
+        elif endpoint == 'rest':
+            self.send_json(self.page_json(page_id, query.get('expand', '')))
+        elif endpoint == 'viewpage':
+            self.send_html(
+                f'<html><head><meta name="ajs-page-title" content="页面 {page_id}"></head><body>'
+                f'<a id="action-export-pdf-link" href="/spaces/flyingpdf/pdfpageexport.action?pageId={page_id}">'
+                f'导出为PDF</a></body></html>'
+            )
+        elif endpoint == 'naturalchildren':
+            items = ''.join(
+                f'<li><a href="/pages/viewpage.action?pageId={child_id}">页面 {child_id}</a></li>'
+                for child_id in forest.children[page_id]
+            )
+            self.send_html(f'<ul><li><a href="/pages/viewpage.action?pageId={page_id}">页面 {page_id}</a>'
+                           f'<ul>{items}</ul></li></ul>')
+        else:
+            self.send_body(200, self.server.pdf_body, 'application/pdf')
+
+
+def add_server_arguments(parser):
+    """模拟服务器的命令行参数，基准测试脚本共用"""
+    parser.add_argument('--roots', type=int, default=2, help='根页面（空间）数量')
+    parser.add_argument('--depth', type=int, default=2, help='页面树深度')
+    parser.add_argument('--fanout', type=int, default=4, help='每个页面最多的子页面数')
+    parser.add_argument('--fanout-min', type=int, default=None, help='每个页面最少的子页面数，默认等于 fanout')
+    parser.add_argument('--shape', choices=SHAPES, help='按形状生成合成森林（配合 --pages），不指定时按 depth/fanout 生成')
+    parser.add_argument('--pages', type=int, default=10000, help='合成森林的页面总数')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--latency', type=float, default=20, help='REST 和页面接口的延迟（毫秒）')
+    parser.add_argument('--pdf-latency', type=float, default=200, help='PDF导出的延迟（毫秒）')
+    parser.add_argument('--jitter', type=float, default=0.2, help='延迟的随机抖动比例')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='随机返回 504 的比例')
+    parser.add_argument('--pdf-size', type=int, default=64 * 1024, help='PDF文件大小（字节）')
+
+
+def create_server(args, host='127.0.0.1', port=0):
+    """按命令行参数生成页面森林并创建服务器"""
+    if args.shape:
+        forest = PageForest.generate(args.shape, args.pages, args.roots, args.fanout, args.seed)
+    else:
+        forest = PageForest.build(args.roots, args.depth, args.fanout, args.fanout_min, args.seed)
+    latency = {endpoint: args.latency / 1000 for endpoint in ENDPOINTS}
+    latency['pdf_export'] = args.pdf_latency / 1000
+    return FakeConfluenceServer(
+        (host, port), forest, latency=latency, jitter=args.jitter,
+        error_rate=args.error_rate, pdf_size=args.pdf_size, seed=args.seed
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description='本地模拟的 Confluence 服务器')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=0, help='监听端口，0 表示随机端口')
+    add_server_arguments(parser)
+    args = parser.parse_args()
+
+    server = create_server(args, args.host, args.port)
+    # 第一行输出服务器地址和页面数，供基准测试脚本读取
+    print(json.dumps({'base_url': server.base_url, 'pages': len(server.forest),
+                      'roots': server.forest.roots}), flush=True)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
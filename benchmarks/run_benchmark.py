@@ -0,0 +1,220 @@
+"""离线基准测试：用本地模拟服务器驱动页面树爬虫和PDF爬虫
+
+在子进程中启动 benchmarks.fake_confluence，把 DIRS 指向临时工作目录后，
+用编排器运行爬虫（不写数据库），最后汇总吞吐量、各接口延迟的 p50/p95 和峰值内存。
+
+示例:
+    python -m benchmarks.run_benchmark --mode stream --depth 3 --fanout 6 --error-rate 0.02
+    python -m benchmarks.run_benchmark --mode tree -s CONCURRENT_REQUESTS=16 -s DOWNLOAD_DELAY=0
+"""
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import resource
+import tempfile
+import subprocess
+from datetime import datetime
+from urllib.request import urlopen
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_ROOT)
+os.environ.setdefault('SCRAPY_SETTINGS_MODULE', 'confluence.settings')
+
+from benchmarks.fake_confluence import add_server_arguments  # noqa: E402
+
+# 模拟服务器不校验会话，任意cookie即可
+BENCHMARK_COOKIES = [{'name': 'JSESSIONID', 'value': 'benchmark'}]
+
+
+def start_server(args):
+    """在子进程中启动模拟服务器，返回 (进程, 服务器信息)"""
+    command = [sys.executable, '-m', 'benchmarks.fake_confluence']
+    for name in ('roots', 'depth', 'fanout', 'fanout_min', 'shape', 'pages', 'seed', 'latency',
+                 'pdf_latency', 'jitter', 'error_rate', 'pdf_size'):
+        value = getattr(args, name)
+        if value is not None:
+            command += [f"--{name.replace('_', '-')}", str(value)]
+    process = subprocess.Popen(command, cwd=REPO_ROOT, stdout=subprocess.PIPE, universal_newlines=True)
+    line = process.stdout.readline()
+    if not line:
+        process.wait()
+        raise RuntimeError(f"模拟服务器启动失败，退出码: {process.returncode}")
+    return process, json.loads(line)
+
+
+def prepare_workdir(workdir, roots):
+    """把 DIRS 指向工作目录，并写入父页面ID文件"""
+    from confluence.config import DIRS, FILES
+    # 原地修改，已导入 DIRS 的模块也会使用新的目录
+    DIRS.update({
+        'pdf_dir': os.path.join(workdir, 'PDF_document'),
+        'records_dir': os.path.join(workdir, 'records'),
+        'logs_dir': os.path.join(workdir, 'logs')
+    })
+    for path in DIRS.values():
+        os.makedirs(path, exist_ok=True)
+    with open(os.path.join(DIRS['records_dir'], FILES['father_page_ids']), 'w', encoding='utf-8') as f:
+        for index, page_id in enumerate(roots, 1):
+            f.write(f"{page_id} 部门{index} D{index:02d}\n")
+
+
+def build_settings(args, workdir):
+    """项目配置上叠加基准测试的覆盖项，优先级高于爬虫的 custom_settings"""
+    from scrapy.utils.project import get_project_settings
+    settings = get_project_settings()
+    settings.setdict({
+        'ITEM_PIPELINES': {},
+        'LOG_FILE': os.path.join(workdir, 'logs', 'benchmark.log'),
+        'LOG_LEVEL': args.log_level,
+        'COOKIES_DEBUG': False
+    }, priority='cmdline')
+    for override in args.set:
+        name, _, value = override.partition('=')
+        settings.set(name.strip(), value.strip(), priority='cmdline')
+    return settings
+
+
+def run_crawl(args, base_url, workdir):
+    """按模式运行爬虫，返回编排器结果和耗时"""
+    from confluence.config import DIRS, FILES
+    from confluence.spiders.orchestrator import CrawlOrchestrator, CrawlStage
+    from confluence.utils.page_queue import PageHandoffQueue
+
+    orchestrator = CrawlOrchestrator(total_timeout=args.timeout, settings=build_settings(args, workdir))
+    orchestrator.cookies = BENCHMARK_COOKIES
+    page_queue = None
+
+    if args.mode == 'stream':
+        page_queue = PageHandoffQueue(spool_path=os.path.join(DIRS['records_dir'], 'page_handoff.spool'))
+        orchestrator.add_concurrent_stages(
+            CrawlStage('confluence_page_tree', on_finish=page_queue.close,
+                       page_queue=page_queue, base_url=base_url),
+            CrawlStage('confluence', allow_failure=True, page_queue=page_queue, base_url=base_url)
+        )
+    else:
+        orchestrator.add_stage('confluence_page_tree', base_url=base_url)
+        if args.mode == 'sequential':
+            orchestrator.add_stage(
+                'confluence',
+                prepare=lambda: {'page_ids_file': os.path.join(DIRS['records_dir'], FILES['all_page_ids'])},
+                allow_failure=True,
+                base_url=base_url
+            )
+
+    start = time.monotonic()
+    try:
+        success = orchestrator.run()
+    finally:
+        if page_queue is not None:
+            page_queue.cleanup()
+    return success, orchestrator.results, time.monotonic() - start
+
+
+def peak_rss_mb():
+    """本进程的峰值常驻内存（MB），不包括模拟服务器子进程"""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux 下单位为 KB，macOS 下为字节
+    return peak / (1024 * 1024) if sys.platform == 'darwin' else peak / 1024
+
+
+def summarize(args, server_info, server_stats, success, results, elapsed):
+    """汇总爬取结果和指标"""
+    from confluence.config import DIRS, FILES
+    from confluence.utils.page_ledger import PageLedger
+    from confluence.utils.metrics import get_registry
+
+    metrics = get_registry().to_dict()
+    run_seconds = {
+        gauge['labels']['spider']: gauge['value']
+        for gauge in metrics['gauges'] if gauge['name'] == 'run_seconds'
+    }
+    discovered = len(PageLedger(os.path.join(DIRS['records_dir'], FILES['all_page_ids'])).load())
+    exported = len([name for name in os.listdir(DIRS['pdf_dir']) if name.endswith('.pdf')])
+
+    def rate(count, spider):
+        seconds = run_seconds.get(spider) or elapsed
+        return round(count / seconds, 2) if seconds else 0.0
+
+    return {
+        'timestamp': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+        'mode': args.mode,
+        'success': success,
+        'results': results,
+        'settings': args.set,
+        'server': dict(server_stats, base_url=server_info['base_url']),
+        'elapsed_seconds': round(elapsed, 3),
+        'run_seconds': run_seconds,
+        'pages_total': server_info['pages'],
+        'pages_discovered': discovered,
+        'pages_exported': exported,
+        'tree_pages_per_second': rate(discovered, 'confluence_page_tree'),
+        'export_pages_per_second': rate(exported, 'confluence'),
+        'peak_rss_mb': round(peak_rss_mb(), 1),
+        'latency': [
+            {
+                'spider': histogram['labels'].get('spider', ''),
+                'endpoint': histogram['labels'].get('endpoint', ''),
+                'count': histogram['count'],
+                'p50_ms': round(histogram['p50'] * 1000, 1),
+                'p95_ms': round(histogram['p95'] * 1000, 1),
+                'max_ms': round(histogram['max'] * 1000, 1)
+            }
+            for histogram in metrics['histograms'] if histogram['name'] == 'request_latency_seconds'
+        ],
+        'retries': sum(
+            gauge['value'] for gauge in metrics['gauges'] if gauge['name'] == 'retries_total')
+    }
+
+
+def print_report(report):
+    print(f"模式: {report['mode']}  结果: {report['results']}  总耗时: {report['elapsed_seconds']:.1f} 秒")
+    print(f"页面: 共 {report['pages_total']}，发现 {report['pages_discovered']}，导出 {report['pages_exported']}")
+    print(f"吞吐量: 页面树 {report['tree_pages_per_second']} 页/秒，PDF导出 {report['export_pages_per_second']} 页/秒")
+    print(f"峰值内存: {report['peak_rss_mb']} MB  重试: {report['retries']}  "
+          f"注入504: {report['server']['injected_errors']}")
+    print(f"{'爬虫':<22}{'接口':<18}{'请求数':>8}{'p50(ms)':>10}{'p95(ms)':>10}{'max(ms)':>10}")
+    for row in sorted(report['latency'], key=lambda row: (row['spider'], row['endpoint'])):
+        print(f"{row['spider']:<22}{row['endpoint']:<18}{row['count']:>8}"
+              f"{row['p50_ms']:>10}{row['p95_ms']:>10}{row['max_ms']:>10}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='用本地模拟服务器对爬虫做基准测试')
+    parser.add_argument('--mode', choices=('tree', 'sequential', 'stream'), default='stream',
+                        help='tree: 只运行页面树爬虫；sequential: 先页面树后PDF；stream: 两者流式并发')
+    add_server_arguments(parser)
+    parser.add_argument('-s', '--set', action='append', default=[], metavar='NAME=VALUE',
+                        help='覆盖 Scrapy 配置，例如 -s DOWNLOAD_DELAY=0，可重复')
+    parser.add_argument('--timeout', type=int, default=3600, help='整体超时（秒）')
+    parser.add_argument('--workdir', help='工作目录，默认使用临时目录并在结束后删除')
+    parser.add_argument('--output', help='把结果追加写入 JSON Lines 文件')
+    parser.add_argument('--log-level', default='INFO', help='写入工作目录 logs/benchmark.log 的日志级别')
+    args = parser.parse_args()
+
+    workdir = args.workdir or tempfile.mkdtemp(prefix='confluence_benchmark_')
+    server, server_info = start_server(args)
+    try:
+        print(f"模拟服务器已启动: {server_info['base_url']}，共 {server_info['pages']} 个页面", flush=True)
+        prepare_workdir(workdir, server_info['roots'])
+        success, results, elapsed = run_crawl(args, server_info['base_url'], workdir)
+        with urlopen(f"{server_info['base_url']}/__stats__") as response:
+            server_stats = json.loads(response.read().decode('utf-8'))
+        report = summarize(args, server_info, server_stats, success, results, elapsed)
+    finally:
+        server.terminate()
+        server.wait()
+        if not args.workdir:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    print_report(report)
+    if args.output:
+        with open(args.output, 'a', encoding='utf-8') as f:
+            f.write(json.dumps(report, ensure_ascii=False) + '\n')
+    return 0 if report['success'] else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,241 @@
+"""大规模页面树的规模测试
+
+生成合成页面森林（balanced/wide/deep/skewed），在进程内直接测量各环节的耗时和内存峰值：
+- discovery:    展开队列按层遍历，登记页面并记录父子关系（与爬虫使用同一套数据结构，不经过网络）
+- ledger:       all_page_ids.txt 账本的追加、压缩和加载，以及 page_tree.tsv 的保存和加载
+- diff:         增量更新时新旧页面ID的集合差
+- db_upsert:    按管道的批量大小写入数据库临时表（需要 --db 和 confluence/config.py）
+
+经过 Scrapy 和 HTTP 的端到端页面树发现用 run_benchmark 测量，例如:
+    python -m benchmarks.run_benchmark --mode tree --shape skewed --pages 100000 -s DOWNLOAD_DELAY=0
+
+示例:
+    python -m benchmarks.scale_test --shape all --pages 100000
+    python -m benchmarks.scale_test --shape wide --pages 200000 --db --output scale.jsonl
+"""
+import os
+import sys
+import json
+import time
+import random
+import shutil
+import argparse
+import resource
+import tempfile
+import threading
+import tracemalloc
+from contextlib import contextmanager
+from datetime import datetime
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_ROOT)
+
+from benchmarks.fake_confluence import PageForest, SHAPES  # noqa: E402
+from confluence.utils.page_frontier import PageFrontier, walk_frontier  # noqa: E402
+from confluence.utils.page_ledger import PageLedger  # noqa: E402
+from confluence.utils.page_registry import PageRegistry  # noqa: E402
+from confluence.utils.page_tree_store import PageTreeStore  # noqa: E402
+
+
+class StageRecorder:
+    """记录每个阶段的耗时和 Python 内存分配峰值"""
+
+    def __init__(self, trace_memory=True):
+        self.trace_memory = trace_memory
+        self.stages = []
+
+    @contextmanager
+    def stage(self, name, **info):
+        if self.trace_memory:
+            tracemalloc.start()
+        start = time.perf_counter()
+        record = dict(info, stage=name)
+        try:
+            yield record
+        finally:
+            record['seconds'] = round(time.perf_counter() - start, 3)
+            if self.trace_memory:
+                record['peak_mb'] = round(tracemalloc.get_traced_memory()[1] / 1024 / 1024, 1)
+                tracemalloc.stop()
+            self.stages.append(record)
+
+
+def department_of(index):
+    """根页面序号对应的部门和代码"""
+    return f"部门{index}", f"D{index:03d}"
+
+
+def run_discovery(recorder, forest, workdir, args):
+    """用展开队列遍历合成森林，返回 (页面登记表, 页面树)"""
+    pages = PageRegistry()
+    tree_store = PageTreeStore(os.path.join(workdir, 'page_tree.tsv'))
+    lock = threading.Lock()
+
+    def expand(entry):
+        page_id = int(entry.page_id)
+        children = forest.children[page_id]
+        with lock:
+            tree_store.record_children(page_id, [
+                (child_id, position, forest.version(child_id)) for position, child_id in enumerate(children)
+            ])
+            for child_id in children:
+                pages.add(child_id, entry.department, entry.code)
+        return [(child_id, forest.space[child_id]) for child_id in children]
+
+    with recorder.stage('discovery') as record:
+        frontier = PageFrontier(
+            max_depth=args.max_depth,
+            max_in_memory=args.frontier_memory,
+            spool_path=os.path.join(workdir, 'page_tree_frontier.spool')
+        )
+        for index, root_id in enumerate(forest.roots, 1):
+            department, code = department_of(index)
+            pages.add(root_id, department, code)
+            tree_store.set_root(root_id)
+            frontier.push(root_id, department, code, 0, index, forest.space[root_id])
+        record['expanded'] = walk_frontier(frontier, expand, workers=args.workers)
+        record['pages'] = len(pages)
+        record['depth_limited'] = frontier.depth_limited
+        frontier.cleanup()
+    return pages, tree_store
+
+
+def run_persistence(recorder, pages, tree_store, workdir):
+    """页面ID账本和页面树文件的读写"""
+    ledger = PageLedger(os.path.join(workdir, 'all_page_ids.txt'), compact_threshold=len(pages) + 1)
+    with recorder.stage('ledger_append', pages=len(pages)):
+        for page_id, department, code in pages:
+            ledger.append(page_id, department, code)
+        ledger.flush()
+    with recorder.stage('ledger_load_journal') as record:
+        record['pages'] = len(PageLedger(ledger.snapshot_path).load())
+    with recorder.stage('ledger_compact', pages=len(pages)):
+        ledger.compact(pages)
+    with recorder.stage('ledger_load_snapshot') as record:
+        record['pages'] = len(PageLedger(ledger.snapshot_path).load())
+        record['bytes'] = os.path.getsize(ledger.snapshot_path)
+
+    with recorder.stage('tree_store_save', pages=len(tree_store)):
+        tree_store.save()
+    with recorder.stage('tree_store_load') as record:
+        record['pages'] = len(PageTreeStore(tree_store.path).load())
+
+
+def run_diff(recorder, pages, args):
+    """模拟增量更新：旧记录缺少 change_ratio 比例的页面，计算新增页面"""
+    rng = random.Random(args.seed)
+    removed = {page_id for page_id in pages.id_view() if rng.random() < args.change_ratio}
+    old_pages = PageRegistry(page for page in pages if int(page[0]) not in removed)
+    with recorder.stage('diff', new=len(pages), old=len(old_pages)) as record:
+        record['added'] = len(pages.difference(old_pages))
+
+
+def run_db_upsert(recorder, pages, args):
+    """按管道的批量大小把页面写入临时表，不影响 confluence_pages 中的数据"""
+    from confluence.pipelines import PAGE_UPSERT_SQL, page_values
+    from confluence.utils.db import get_pool, close_pool
+
+    table = 'confluence_pages_scale_test'
+    now = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+    try:
+        with get_pool().connection() as conn:
+            with conn.cursor() as cursor:
+                cursor.execute(f"CREATE TEMPORARY TABLE {table} LIKE confluence_pages")
+                sql = PAGE_UPSERT_SQL.format(table=table)
+                with recorder.stage('db_upsert', pages=len(pages), batch=args.db_batch) as record:
+                    batch = []
+                    for page_id, department, code in pages:
+                        batch.append(page_values({
+                            'page_id': page_id,
+                            'title': f"页面 {page_id}",
+                            'author': '规模测试',
+                            'last_modified': now,
+                            'url': f"/pages/viewpage.action?pageId={page_id}",
+                            'department': department,
+                            'code': code,
+                            'crawled_time': now
+                        }))
+                        if len(batch) >= args.db_batch:
+                            cursor.executemany(sql, batch)
+                            conn.commit()
+                            batch = []
+                    if batch:
+                        cursor.executemany(sql, batch)
+                        conn.commit()
+                    cursor.execute(f"SELECT COUNT(*) FROM {table}")
+                    record['rows'] = cursor.fetchone()[0]
+                cursor.execute(f"DROP TEMPORARY TABLE {table}")
+    finally:
+        close_pool()
+
+
+def run_shape(shape, args):
+    """对一种形状运行全部阶段，返回结果"""
+    workdir = tempfile.mkdtemp(prefix=f"confluence_scale_{shape}_", dir=args.workdir)
+    recorder = StageRecorder(trace_memory=not args.no_trace_memory)
+    try:
+        with recorder.stage('generate') as record:
+            forest = PageForest.generate(shape, args.pages, args.roots, args.fanout, args.seed)
+            record['pages'] = len(forest)
+        pages, tree_store = run_discovery(recorder, forest, workdir, args)
+        del forest
+        run_persistence(recorder, pages, tree_store, workdir)
+        run_diff(recorder, pages, args)
+        if args.db:
+            run_db_upsert(recorder, pages, args)
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return {
+        'timestamp': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+        'shape': shape,
+        'pages': args.pages,
+        'roots': args.roots,
+        'stages': recorder.stages,
+        # 进程级峰值，多种形状依次运行时只增不减
+        'peak_rss_mb': round(peak / (1024 * 1024) if sys.platform == 'darwin' else peak / 1024, 1)
+    }
+
+
+def print_report(report):
+    print(f"\n形状: {report['shape']}  页面数: {report['pages']}  根页面: {report['roots']}  "
+          f"进程峰值内存: {report['peak_rss_mb']} MB")
+    print(f"{'阶段':<22}{'耗时(秒)':>10}{'峰值(MB)':>10}  说明")
+    for stage in report['stages']:
+        extra = ', '.join(
+            f"{key}={value}" for key, value in stage.items() if key not in ('stage', 'seconds', 'peak_mb'))
+        print(f"{stage['stage']:<22}{stage['seconds']:>10}{stage.get('peak_mb', '-'):>10}  {extra}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='合成大规模页面树的规模测试')
+    parser.add_argument('--shape', choices=SHAPES + ('all',), default='all')
+    parser.add_argument('--pages', type=int, default=100000)
+    parser.add_argument('--roots', type=int, default=20, help='根页面（部门）数量')
+    parser.add_argument('--fanout', type=int, default=10, help='balanced 形状的子页面数')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--max-depth', type=int, default=None, help='展开深度上限，默认不限制')
+    parser.add_argument('--frontier-memory', type=int, default=10000, help='展开队列在内存中保留的页面数')
+    parser.add_argument('--workers', type=int, default=8, help='遍历线程数')
+    parser.add_argument('--change-ratio', type=float, default=0.05, help='增量比较时新增页面的比例')
+    parser.add_argument('--db', action='store_true', help='测量数据库批量写入（写入临时表）')
+    parser.add_argument('--db-batch', type=int, default=10, help='每批写入的页面数，默认与管道一致')
+    parser.add_argument('--no-trace-memory', action='store_true',
+                        help='不跟踪内存分配（tracemalloc 会使耗时偏高）')
+    parser.add_argument('--workdir', help='临时文件所在目录')
+    parser.add_argument('--output', help='把结果追加写入 JSON Lines 文件')
+    args = parser.parse_args()
+
+    shapes = SHAPES if args.shape == 'all' else (args.shape,)
+    for shape in shapes:
+        report = run_shape(shape, args)
+        print_report(report)
+        if args.output:
+            with open(args.output, 'a', encoding='utf-8') as f:
+                f.write(json.dumps(report, ensure_ascii=False) + '\n')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -8,6 +8,7 @@ project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 sys.path.insert(0, project_root)
 
 from confluence.config import DB_CONFIG
+from confluence.utils.update_summary import SUMMARY_TABLE, CREATE_SUMMARY_SQL, BACKFILL_SUMMARY_SQL
 
 def init_db():
     """初始化数据库表"""
@@ -37,12 +38,47 @@ def init_db():
             department VARCHAR(100),
             code VARCHAR(50),
             crawled_time DATETIME,
+            run_id VARCHAR(32) NULL,
+            is_deleted TINYINT(1) NOT NULL DEFAULT 0,
+            deleted_at DATETIME NULL,
             created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
+            INDEX idx_last_modified (last_modified)
         ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4;
         """
         
         cursor.execute(create_table_sql)
+        
+        # 旧表补充删除标记字段
+        cursor.execute("SHOW COLUMNS FROM confluence_pages LIKE 'is_deleted'")
+        if not cursor.fetchone():
+            cursor.execute(
+                "ALTER TABLE confluence_pages "
+                "ADD COLUMN is_deleted TINYINT(1) NOT NULL DEFAULT 0 AFTER crawled_time, "
+                "ADD COLUMN deleted_at DATETIME NULL AFTER is_deleted"
+            )
+            print("已为confluence_pages表添加删除标记字段")
+        
+        # 旧表补充运行ID字段（最后一次写入该页面的运行）
+        cursor.execute("SHOW COLUMNS FROM confluence_pages LIKE 'run_id'")
+        if not cursor.fetchone():
+            cursor.execute("ALTER TABLE confluence_pages ADD COLUMN run_id VARCHAR(32) NULL AFTER crawled_time")
+            print("已为confluence_pages表添加运行ID字段")
+        
+        # 旧表补充更新时间索引，报表按时间范围查询
+        cursor.execute("SHOW INDEX FROM confluence_pages WHERE Key_name = 'idx_last_modified'")
+        if not cursor.fetchone():
+            cursor.execute("ALTER TABLE confluence_pages ADD INDEX idx_last_modified (last_modified)")
+            print("已为confluence_pages表添加更新时间索引")
+        
+        # 按小时、部门汇总的更新次数，由管道写入页面时累加；新建时从页面表补齐历史数据
+        cursor.execute(f"SHOW TABLES LIKE '{SUMMARY_TABLE}'")
+        summary_exists = cursor.fetchone() is not None
+        cursor.execute(CREATE_SUMMARY_SQL)
+        if not summary_exists:
+            cursor.execute(BACKFILL_SUMMARY_SQL)
+            print(f"已创建{SUMMARY_TABLE}表并从页面表补齐 {cursor.rowcount} 条汇总")
+        
         conn.commit()
         print("数据库表初始化成功")
         
@@ -51,7 +51,8 @@ def main(mode='hourly'):
             
         # 获取更新
         logger.info("获取页面更新")
-        updates = spider.get_page_updates(start_time)
+        # 每小时模式从上次成功查询的时间开始，避免两次运行之间漏掉更新
+        updates = spider.get_page_updates(start_time, use_watermark=(mode == 'hourly'))
         
         # 发送邮件
         if mode == 'hourly':
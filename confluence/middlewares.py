@@ -3,11 +3,16 @@
 # See documentation in:
 # https://docs.scrapy.org/en/latest/topics/spider-middleware.html
 
+import os
+import time
 from scrapy import signals
 
 # useful for handling different item types with a single interface
 from itemadapter import is_item, ItemAdapter
 
+from .config import DIRS
+from .utils.metrics import get_registry, endpoint_class
+
 
 class ConfluenceSpiderMiddleware:
     # Not all methods need to be defined. If a method is not defined,
@@ -101,3 +106,72 @@ class ConfluenceDownloaderMiddleware:
 
     def spider_opened(self, spider):
         spider.logger.info("Spider opened: %s" % spider.name)
+
+
+class CrawlMetricsMiddleware:
+    """记录每个下载请求的延迟、响应字节数和状态码
+
+    按接口类型（rest/naturalchildren/viewpage/pdf_export/other）分组。优先级设为 950，
+    位于重试中间件之后、靠近下载器，因此每次重试都单独计一次延迟。
+    同时在请求第一次真正下载时记录 trace_start（epoch 秒），爬虫的追踪 span 从这里算起，
+    不包含请求在调度器中排队和 DOWNLOAD_DELAY 等待的时间；重试、分页等沿用原 meta 的后续请求
+    保留第一次的值，span 覆盖整个操作。
+    爬虫结束时汇总重试次数，并把全部指标写入 logs/metrics 目录。
+    """
+
+    def __init__(self, crawler):
+        self.crawler = crawler
+        self.metrics = get_registry()
+        self.opened_at = None
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        middleware = cls(crawler)
+        crawler.signals.connect(middleware.spider_opened, signal=signals.spider_opened)
+        crawler.signals.connect(middleware.spider_closed, signal=signals.spider_closed)
+        return middleware
+
+    def spider_opened(self, spider):
+        self.opened_at = time.monotonic()
+
+    def process_request(self, request, spider):
+        request.meta['metrics_start'] = time.monotonic()
+        request.meta.setdefault('trace_start', time.time())
+        return None
+
+    def process_response(self, request, response, spider):
+        endpoint = endpoint_class(request.url)
+        start = request.meta.pop('metrics_start', None)
+        if start is not None:
+            self.metrics.observe('request_latency_seconds', time.monotonic() - start,
+                                 spider=spider.name, endpoint=endpoint)
+        self.metrics.inc('responses_total', spider=spider.name, endpoint=endpoint,
+                         status=f"{response.status // 100}xx")
+        self.metrics.inc('response_bytes_total', len(response.body),
+                         spider=spider.name, endpoint=endpoint)
+        return response
+
+    def process_exception(self, request, exception, spider):
+        endpoint = endpoint_class(request.url)
+        start = request.meta.pop('metrics_start', None)
+        if start is not None:
+            self.metrics.observe('request_latency_seconds', time.monotonic() - start,
+                                 spider=spider.name, endpoint=endpoint)
+        self.metrics.inc('request_exceptions_total', spider=spider.name, endpoint=endpoint,
+                         exception=type(exception).__name__)
+        return None
+
+    def spider_closed(self, spider, reason):
+        stats = self.crawler.stats
+        self.metrics.set('retries_total', stats.get_value('retry/count', 0), spider=spider.name)
+        self.metrics.set('retries_exhausted_total', stats.get_value('retry/max_reached', 0),
+                         spider=spider.name)
+        self.metrics.set('items_scraped_total', stats.get_value('item_scraped_count', 0),
+                         spider=spider.name)
+        if self.opened_at is not None:
+            self.metrics.set('run_seconds', round(time.monotonic() - self.opened_at, 3),
+                             spider=spider.name)
+        try:
+            self.metrics.write(os.path.join(DIRS['logs_dir'], 'metrics'))
+        except Exception as e:
+            spider.logger.error(f"写入指标文件失败: {str(e)}")
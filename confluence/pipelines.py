@@ -7,8 +7,47 @@
 # useful for handling different item types with a single interface
 from itemadapter import ItemAdapter
 import logging
-import pymysql
-from .config import DB_CONFIG
+from .utils.db import get_pool
+from .utils.metrics import get_registry
+from .utils.tracing import get_run_id, get_tracer
+from .utils.update_summary import changed_items, record_updates
+
+# 页面记录的批量写入语句，{table} 为表名（规模测试写入临时表）
+PAGE_UPSERT_SQL = """
+    INSERT INTO {table}
+    (page_id, title, author, last_modified, micro_link, pdf_link, url, department, code, crawled_time, run_id)
+    VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
+    ON DUPLICATE KEY UPDATE
+    title=VALUES(title),
+    author=VALUES(author),
+    last_modified=VALUES(last_modified),
+    micro_link=VALUES(micro_link),
+    pdf_link=VALUES(pdf_link),
+    url=VALUES(url),
+    department=VALUES(department),
+    code=VALUES(code),
+    crawled_time=VALUES(crawled_time),
+    run_id=VALUES(run_id),
+    is_deleted=0,
+    deleted_at=NULL
+"""
+
+
+def page_values(item, run_id=None):
+    """PAGE_UPSERT_SQL 的参数，run_id 为最后一次写入该页面的运行ID"""
+    return (
+        item['page_id'],
+        item['title'],
+        item['author'],
+        item['last_modified'],
+        item.get('micro_link', ''),
+        item.get('pdf_link', ''),
+        item['url'],
+        item['department'],
+        item['code'],
+        item['crawled_time'],
+        run_id
+    )
 
 
 class ConfluencePipeline:
@@ -16,22 +55,17 @@ class ConfluencePipeline:
         self.logger = logging.getLogger('confluence_pipeline')
         self.items_buffer = []
         self.buffer_size = 10
+        self.pool = None
         self.conn = None
         self.cursor = None
         
     def open_spider(self, spider):
-        """爬虫启动时连接数据库"""
+        """爬虫启动时从共享连接池获取数据库连接"""
         try:
-            self.conn = pymysql.connect(
-                host=DB_CONFIG['host'],
-                user=DB_CONFIG['user'],
-                password=DB_CONFIG['password'],
-                database=DB_CONFIG['database'],
-                port=DB_CONFIG['port'],
-                charset=DB_CONFIG['charset']
-            )
+            self.pool = get_pool()
+            self.conn = self.pool.acquire()
             self.cursor = self.conn.cursor()
-            self.logger.info("数据库连接成功")
+            self.logger.info("已从连接池获取数据库连接")
         except Exception as e:
             self.logger.error(f"数据库连接失败: {str(e)}")
             raise e
@@ -46,8 +80,10 @@ class ConfluencePipeline:
             if self.cursor:
                 self.cursor.close()
             if self.conn:
-                self.conn.close()
-                self.logger.info("数据库连接已关闭")
+                # 归还给连接池，由编排器在整个运行结束时统一关闭
+                self.pool.release(self.conn)
+                self.conn = None
+                self.logger.info("数据库连接已归还连接池")
         except Exception as e:
             self.logger.error(f"关闭数据库连接失败: {str(e)}")
             
@@ -76,40 +112,20 @@ class ConfluencePipeline:
             self.logger.info(f"开始批量写入数据库，数据条数: {len(self.items_buffer)}")
             
             # 批量插入数据
-            sql = """
-                INSERT INTO confluence_pages 
-                (page_id, title, author, last_modified, micro_link, pdf_link, url, department, code, crawled_time)
-                VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
-                ON DUPLICATE KEY UPDATE
-                title=VALUES(title),
-                author=VALUES(author),
-                last_modified=VALUES(last_modified),
-                micro_link=VALUES(micro_link),
-                pdf_link=VALUES(pdf_link),
-                url=VALUES(url),
-                department=VALUES(department),
-                code=VALUES(code),
-                crawled_time=VALUES(crawled_time)
-            """
-            
-            values = [
-                (
-                    item['page_id'],
-                    item['title'],
-                    item['author'],
-                    item['last_modified'],
-                    item.get('micro_link', ''),
-                    item.get('pdf_link', ''),
-                    item['url'],
-                    item['department'],
-                    item['code'],
-                    item['crawled_time']
-                )
-                for item in self.items_buffer
-            ]
+            run_id = get_run_id()
+            values = [page_values(item, run_id) for item in self.items_buffer]
             
-            self.cursor.executemany(sql, values)
-            self.conn.commit()
+            metrics = get_registry()
+            with metrics.timer('db_flush_seconds'), \
+                    get_tracer().span('db_write', rows=len(values),
+                                      page_ids=[str(item['page_id']) for item in self.items_buffer]):
+                # 新增或更新时间变化的页面计入按小时、部门汇总的更新次数，与页面在同一事务中提交
+                changed = changed_items(self.cursor, self.items_buffer)
+                self.cursor.executemany(PAGE_UPSERT_SQL.format(table='confluence_pages'), values)
+                record_updates(self.cursor, changed)
+                self.conn.commit()
+            metrics.inc('db_rows_written_total', len(values))
+            metrics.inc('db_updates_recorded_total', len(changed))
             
             self.logger.info(f"数据库写入成功: {len(self.items_buffer)} 条数据")
             for item in self.items_buffer:
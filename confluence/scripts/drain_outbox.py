@@ -0,0 +1,52 @@
+"""发送邮件发件箱（records/email_outbox.sqlite3）中到期的邮件
+
+爬取进程只把邮件写入发件箱并在有限时间内尝试发送，未发出或发送失败的邮件由本脚本定时重试。
+
+用法:
+    python -m confluence.scripts.drain_outbox                 # 发送到期的邮件
+    python -m confluence.scripts.drain_outbox --status        # 只查看各状态的邮件数
+    python -m confluence.scripts.drain_outbox --retry-failed  # 把已放弃的邮件重新放回队列后发送
+"""
+import os
+import sys
+import time
+import logging
+import argparse
+
+project_root = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, project_root)
+
+from confluence.utils.outbox import Outbox, drain, outbox_settings  # noqa: E402
+from confluence.utils.tracing import install_log_run_id  # noqa: E402
+
+
+def main():
+    parser = argparse.ArgumentParser(description='发送邮件发件箱中到期的邮件')
+    parser.add_argument('--status', action='store_true', help='只输出各状态的邮件数')
+    parser.add_argument('--retry-failed', action='store_true', help='重新发送已超过重试次数的邮件')
+    parser.add_argument('--max-seconds', type=float, default=None, help='本轮发送的时间上限')
+    args = parser.parse_args()
+
+    install_log_run_id()
+    logging.basicConfig(
+        level=logging.INFO,
+        format='[%(asctime)s] [%(run_id)s] %(name)s - %(levelname)s - %(message)s',
+        datefmt='%Y-%m-%d %H:%M:%S',
+        stream=sys.stdout
+    )
+
+    with Outbox() as outbox:
+        if args.status:
+            counts = outbox.counts()
+            for status in ('pending', 'failed', 'sent'):
+                print(f"{status:<10}{counts.get(status, 0):>8}")
+            return 0
+        if args.retry_failed:
+            logging.getLogger('outbox').info(f"重新放回队列: {outbox.retry_failed()} 封邮件")
+        deadline = time.time() + args.max_seconds if args.max_seconds else None
+        stats = drain(outbox, deadline=deadline, settings=outbox_settings())
+    return 0 if stats['failed'] == 0 else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
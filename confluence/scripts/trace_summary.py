@@ -0,0 +1,149 @@
+"""汇总追踪文件（logs/traces/trace_<run_id>.jsonl）
+
+按阶段统计次数、失败数和耗时分位数，并列出总耗时最长的页面及其各阶段耗时。
+
+用法:
+    python -m confluence.scripts.trace_summary                 # 最近一次运行
+    python -m confluence.scripts.trace_summary --run-id <ID> --top 30
+    python -m confluence.scripts.trace_summary logs/traces/trace_xxx.jsonl --json
+"""
+import os
+import sys
+import glob
+import argparse
+from collections import defaultdict
+
+project_root = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, project_root)
+
+from confluence.utils import jsonutil  # noqa: E402
+
+# 页面级阶段的顺序，其他 span（stage/run）只参与阶段统计
+PAGE_STAGES = ('discovery', 'metadata', 'export', 'db_write')
+
+
+def find_trace_file(run_id=None):
+    """按运行ID查找追踪文件，未指定时取最近修改的一个"""
+    from confluence.config import DIRS
+    trace_dir = os.path.join(DIRS['logs_dir'], 'traces')
+    if run_id:
+        path = os.path.join(trace_dir, f"trace_{run_id}.jsonl")
+        return path if os.path.exists(path) else None
+    paths = glob.glob(os.path.join(trace_dir, 'trace_*.jsonl'))
+    return max(paths, key=os.path.getmtime) if paths else None
+
+
+def load_spans(path):
+    """读取追踪文件，跳过损坏的行（例如进程被强制终止时写了一半）"""
+    spans = []
+    with open(path, 'rb') as f:
+        for line in f:
+            try:
+                spans.append(jsonutil.loads(line))
+            except jsonutil.JSONDecodeError:
+                continue
+    return spans
+
+
+def percentile(sorted_values, q):
+    if not sorted_values:
+        return 0.0
+    return sorted_values[min(int(q * len(sorted_values)), len(sorted_values) - 1)]
+
+
+def summarize_stages(spans):
+    """按 span 名称统计次数、失败数、总耗时和分位数"""
+    durations = defaultdict(list)
+    errors = defaultdict(int)
+    for span in spans:
+        durations[span['name']].append(span['duration_ms'])
+        if span.get('status') != 'ok':
+            errors[span['name']] += 1
+    summary = []
+    for name, values in durations.items():
+        values.sort()
+        summary.append({
+            'stage': name,
+            'count': len(values),
+            'errors': errors[name],
+            'total_s': round(sum(values) / 1000, 1),
+            'p50_ms': percentile(values, 0.5),
+            'p95_ms': percentile(values, 0.95),
+            'max_ms': values[-1]
+        })
+    order = {name: index for index, name in enumerate(PAGE_STAGES)}
+    return sorted(summary, key=lambda row: (order.get(row['stage'], len(order)), row['stage']))
+
+
+def summarize_pages(spans):
+    """每个页面各阶段的耗时；批量写库的耗时平均分摊到批次中的页面"""
+    pages = defaultdict(lambda: defaultdict(float))
+    failed = defaultdict(set)
+    for span in spans:
+        name = span['name']
+        if name not in PAGE_STAGES:
+            continue
+        if name == 'db_write':
+            page_ids = span.get('page_ids') or []
+            for page_id in page_ids:
+                pages[page_id][name] += span['duration_ms'] / len(page_ids)
+            continue
+        page_id = span.get('page_id')
+        if page_id is None:
+            continue
+        pages[page_id][name] += span['duration_ms']
+        if span.get('status') != 'ok':
+            failed[page_id].add(name)
+    rows = []
+    for page_id, stages in pages.items():
+        row = {'page_id': page_id, 'total_ms': round(sum(stages.values()), 1)}
+        row.update({stage: round(stages.get(stage, 0.0), 1) for stage in PAGE_STAGES})
+        row['failed'] = sorted(failed.get(page_id, ()))
+        rows.append(row)
+    rows.sort(key=lambda row: row['total_ms'], reverse=True)
+    return rows
+
+
+def print_summary(path, spans, stage_rows, page_rows, top):
+    run_ids = sorted({span.get('run_id') for span in spans if span.get('run_id')})
+    print(f"追踪文件: {path}")
+    print(f"运行ID: {', '.join(run_ids) or '-'}  span 数: {len(spans)}  页面数: {len(page_rows)}\n")
+
+    print(f"{'阶段':<12}{'次数':>8}{'失败':>8}{'总耗时(s)':>12}{'p50(ms)':>10}{'p95(ms)':>10}{'max(ms)':>10}")
+    for row in stage_rows:
+        print(f"{row['stage']:<12}{row['count']:>8}{row['errors']:>8}{row['total_s']:>12}"
+              f"{row['p50_ms']:>10}{row['p95_ms']:>10}{row['max_ms']:>10}")
+
+    print(f"\n耗时最长的 {min(top, len(page_rows))} 个页面（毫秒）:")
+    print(f"{'页面ID':<14}{'合计':>10}" + ''.join(f"{stage:>12}" for stage in PAGE_STAGES) + "  失败阶段")
+    for row in page_rows[:top]:
+        print(f"{row['page_id']:<14}{row['total_ms']:>10}"
+              + ''.join(f"{row[stage]:>12}" for stage in PAGE_STAGES)
+              + f"  {','.join(row['failed'])}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='汇总爬取追踪文件中最慢的页面和阶段')
+    parser.add_argument('path', nargs='?', help='追踪文件路径，默认取 logs/traces 下最近的文件')
+    parser.add_argument('--run-id', help='按运行ID查找追踪文件')
+    parser.add_argument('--top', type=int, default=20, help='列出耗时最长的页面数')
+    parser.add_argument('--json', action='store_true', help='以JSON输出')
+    args = parser.parse_args()
+
+    path = args.path or find_trace_file(args.run_id)
+    if not path or not os.path.exists(path):
+        print("未找到追踪文件")
+        return 1
+
+    spans = load_spans(path)
+    stage_rows = summarize_stages(spans)
+    page_rows = summarize_pages(spans)
+    if args.json:
+        print(jsonutil.dumps({'path': path, 'stages': stage_rows, 'pages': page_rows[:args.top]}).decode('utf-8'))
+    else:
+        print_summary(path, spans, stage_rows, page_rows, args.top)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,8 +1,11 @@
 import os
+import asyncio
 import requests
 import logging
+from concurrent.futures import ThreadPoolExecutor
 from ..config import CONFLUENCE_CONFIG, DIRS, FILES
 from ..utils.selenium_login import get_cookies
+from ..utils.rest_client import ConfluenceRestClient
 import pickle
 from selenium import webdriver
 from selenium.webdriver.chrome.options import Options
@@ -11,6 +14,10 @@ from selenium.webdriver.support.ui import WebDriverWait
 from selenium.webdriver.support import expected_conditions as EC
 import time
 
+PAGE_VALID = 'valid'
+PAGE_NO_PERMISSION = 'no_permission'
+PAGE_MISSING = 'missing'
+
 def setup_logging():
     """配置日志"""
     logger = logging.getLogger('validate_page_ids')
@@ -168,15 +175,125 @@ def validate_page_with_selenium(driver, page_id, base_url):
         logger.error(f"验证页面时出错: {str(e)}")
         return False
 
-def validate_page_ids():
-    """验证页面ID的有效性"""
-    logger = setup_logging()
+def classify_page(client, page_id):
+    """通过REST接口判断页面状态，返回 valid / no_permission / missing，无法判断时返回 None"""
+    logger = logging.getLogger('validate_page_ids')
+    try:
+        response = client.get_content(page_id)
+        if response.status_code == 200:
+            return PAGE_VALID
+        if response.status_code == 403:
+            return PAGE_NO_PERMISSION
+        if response.status_code == 404:
+            # Confluence 对无权限的页面同样返回404，通过页面地址的跳转区分
+            view = client.get('/pages/viewpage.action', params={'pageId': page_id}, allow_redirects=False)
+            location = view.headers.get('Location', '')
+            if view.status_code in (301, 302) and 'permissionViolation=true' in location:
+                return PAGE_NO_PERMISSION
+            if view.status_code == 404:
+                return PAGE_MISSING
+        # 401、跳转到登录页或其他状态码交给Selenium处理
+        logger.info(f"无法通过接口判断页面 {page_id} 的状态，状态码: {response.status_code}")
+        return None
+    except requests.RequestException as e:
+        logger.warning(f"接口验证页面 {page_id} 失败: {str(e)}")
+        return None
+
+async def classify_pages(client, page_ids, concurrency):
+    """并发验证页面，最多同时进行 concurrency 个请求"""
+    logger = logging.getLogger('validate_page_ids')
+    loop = asyncio.get_event_loop()
+    semaphore = asyncio.Semaphore(concurrency)
+    executor = ThreadPoolExecutor(max_workers=concurrency)
+    total = len(page_ids)
+    finished = 0
+
+    async def check(page_id):
+        nonlocal finished
+        async with semaphore:
+            result = await loop.run_in_executor(executor, classify_page, client, page_id)
+        finished += 1
+        if finished % 100 == 0 or finished == total:
+            logger.info(f"接口验证进度: {finished}/{total}")
+        return result
+
+    try:
+        results = await asyncio.gather(*(check(page_id) for page_id in page_ids))
+    finally:
+        executor.shutdown(wait=False)
+    return dict(zip(page_ids, results))
+
+def validate_pages_http(page_ids, concurrency=16, cookies=None):
+    """通过REST接口验证一批页面ID，返回 {page_id: 状态}
+
+    先用批量 CQL 查询确认存在的页面，只有查询结果中没有的页面才逐个区分无权限和不存在。
+    """
+    logger = logging.getLogger('validate_page_ids')
+    client = ConfluenceRestClient(cookies=cookies, pool_size=concurrency)
+    loop = asyncio.new_event_loop()
+    try:
+        results = {}
+        try:
+            statuses = client.batch_lookup(page_ids, concurrency=min(concurrency, 4))
+            for page_id in page_ids:
+                status = statuses[int(page_id)].status
+                if status == 'current':
+                    results[page_id] = PAGE_VALID
+                elif status != 'missing':
+                    # 已移入回收站或草稿等状态
+                    results[page_id] = PAGE_MISSING
+        except (requests.RequestException, ValueError) as e:
+            logger.warning(f"批量查询失败，改为逐个验证: {str(e)}")
+        
+        remaining = [page_id for page_id in page_ids if page_id not in results]
+        logger.info(f"批量查询确定 {len(results)} 个页面，{len(remaining)} 个需要逐个验证")
+        if remaining:
+            asyncio.set_event_loop(loop)
+            results.update(loop.run_until_complete(classify_pages(client, remaining, concurrency)))
+        return results
+    finally:
+        loop.close()
+        client.close()
+
+def validate_pages_selenium(page_ids):
+    """逐个使用Selenium验证接口无法判断的页面"""
+    logger = logging.getLogger('validate_page_ids')
+    results = {}
     driver = None
+    try:
+        for index, page_id in enumerate(page_ids, 1):
+            if driver is None:
+                driver = setup_driver()
+            logger.info(f"Selenium验证第 {index}/{len(page_ids)} 个页面: {page_id}")
+            result = validate_page_with_selenium(driver, page_id, CONFLUENCE_CONFIG['base_url'])
+            if result is True:
+                results[page_id] = PAGE_VALID
+            elif result == "no_permission":
+                results[page_id] = PAGE_NO_PERMISSION
+            else:
+                results[page_id] = PAGE_MISSING
+                
+            # 每验证5个页面重启一次浏览器，避免内存泄漏
+            if index % 5 == 0:
+                logger.info("重启浏览器以释放内存...")
+                driver.quit()
+                driver = None
+    finally:
+        if driver:
+            try:
+                driver.quit()
+            except:
+                pass
+    return results
+
+def validate_page_ids(concurrency=16):
+    """验证页面ID的有效性
+
+    先通过REST接口并发验证，只有接口无法判断的页面才使用Selenium逐个验证。
+    """
+    logger = setup_logging()
     
     try:
-        # 设置Chrome驱动
-        driver = setup_driver()
-        
         # 读取父页面ID文件
         father_ids_path = os.path.join(DIRS['records_dir'], FILES['father_page_ids'])
         if not os.path.exists(father_ids_path):
@@ -187,44 +304,44 @@ def validate_page_ids():
         invalid_pages = []
         no_permission_pages = []
         
-        # 读取并验证每个页面ID
+        entries = []
         with open(father_ids_path, 'r', encoding='utf-8') as f:
-            lines = f.readlines()
-            total_pages = len(lines)
-            
-            for index, line in enumerate(lines, 1):
+            for line in f:
                 line = line.strip()
                 if not line:
                     continue
-                    
                 parts = line.split()
                 if len(parts) >= 3:
-                    page_id, department, code = parts[:3]
-                    
-                    logger.info(f"正在验证第 {index}/{total_pages} 个页面...")
-                    
-                    # 验证页面是否存在
-                    url = f"{CONFLUENCE_CONFIG['base_url']}/pages/viewpage.action?pageId={page_id}"
-                    logger.info(f"验证页面: {url}")
-                    
-                    result = validate_page_with_selenium(driver, page_id, CONFLUENCE_CONFIG['base_url'])
-                    if result is True:
-                        valid_pages.append(line)
-                        logger.info(f"页面有效: {line}")
-                    elif result == "no_permission":
-                        no_permission_pages.append(line)
-                        logger.warning(f"无权限访问: {line}")
-                    else:
-                        invalid_pages.append(line)
-                        logger.warning(f"页面无效: {line}")
-                        
-                    # 每验证5个页面重启一次浏览器，避免内存泄漏
-                    if index % 5 == 0:
-                        logger.info("重启浏览器以释放内存...")
-                        driver.quit()
-                        driver = setup_driver()
+                    entries.append((parts[0], line))
                 else:
                     logger.error(f"无效的行格式: {line}")
+        logger.info(f"共读取到 {len(entries)} 个待验证页面")
+        
+        # 刷新cookies，失败时仍尝试使用已有的cookies
+        if not get_cookies(CONFLUENCE_CONFIG['base_url'], CONFLUENCE_CONFIG['username'], CONFLUENCE_CONFIG['password']):
+            logger.warning("获取cookies失败，使用已保存的cookies")
+        
+        page_ids = list(dict.fromkeys(page_id for page_id, _ in entries))
+        start_time = time.time()
+        results = validate_pages_http(page_ids, concurrency=concurrency)
+        unresolved = [page_id for page_id in page_ids if results.get(page_id) is None]
+        logger.info(
+            f"接口验证完成，耗时 {time.time() - start_time:.1f} 秒，"
+            f"{len(page_ids) - len(unresolved)} 个已确定，{len(unresolved)} 个需要Selenium验证"
+        )
+        if unresolved:
+            results.update(validate_pages_selenium(unresolved))
+        
+        for page_id, line in entries:
+            result = results.get(page_id)
+            if result == PAGE_VALID:
+                valid_pages.append(line)
+            elif result == PAGE_NO_PERMISSION:
+                no_permission_pages.append(line)
+                logger.warning(f"无权限访问: {line}")
+            else:
+                invalid_pages.append(line)
+                logger.warning(f"页面无效: {line}")
                     
         if valid_pages or no_permission_pages:
             # 备份原文件
@@ -265,13 +382,6 @@ def validate_page_ids():
     except Exception as e:
         logger.error(f"验证页面ID时出错: {str(e)}")
         return False
-        
-    finally:
-        if driver:
-            try:
-                driver.quit()
-            except:
-                pass
 
 if __name__ == "__main__":
-    validate_page_ids() 
\ No newline at end of file
+    validate_page_ids()
\ No newline at end of file
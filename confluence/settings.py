@@ -29,6 +29,8 @@ DOWNLOAD_DELAY = 1
 # See https://docs.scrapy.org/en/latest/topics/downloader-middleware.html
 DOWNLOADER_MIDDLEWARES = {
    'scrapy.downloadermiddlewares.useragent.UserAgentMiddleware': None,
+   # 请求延迟、字节数和状态码指标，位于重试中间件(550)之后，每次重试单独计时
+   'confluence.middlewares.CrawlMetricsMiddleware': 950,
 }
 
 # Configure item pipelines
@@ -1,28 +1,34 @@
-import requests
 import pickle
 import os
 import logging
 import scrapy
+from scrapy import signals
+from scrapy.exceptions import DontCloseSpider
 from ..config import CONFLUENCE_CONFIG, DIRS, FILES
+from ..utils.page_ledger import PageLedger
+from ..utils.page_registry import PageRegistry
+from ..utils.page_tree_store import PageTreeStore
+from ..utils.page_frontier import PageFrontier, walk_frontier
+from ..utils.rest_client import ConfluenceRestClient
+from ..utils import jsonutil
+from ..utils.cache_store import CompressedCacheStore
+from ..utils.metrics import get_registry
+from ..utils.tracing import get_tracer
 import time
-import json
-from datetime import datetime, timedelta
+from datetime import datetime
 import glob
 import re
+from concurrent.futures import ThreadPoolExecutor
 
-def parse_iso_datetime(iso_string):
-    """解析ISO格式的时间字符串（兼容Python 3.6）"""
-    try:
-        # 处理带毫秒的情况
-        if '.' in iso_string:
-            main_time, ms = iso_string.split('.')
-            ms = ms.replace('Z', '').ljust(6, '0')
-            return datetime.strptime(f"{main_time}.{ms}", "%Y-%m-%dT%H:%M:%S.%f")
-        # 处理不带毫秒的情况
-        return datetime.strptime(iso_string.replace('Z', ''), "%Y-%m-%dT%H:%M:%S")
-    except Exception:
-        # 如果解析失败，返回一个很旧的时间，强制更新缓存
-        return datetime(2000, 1, 1)
+PAGE_ID_PATTERN = re.compile(r'pageId=(\d+)')
+
+def parse_version_when(when):
+    """解析 version.when（如 2024-01-02T03:04:05.678+08:00），返回本地时间（兼容Python 3.6）"""
+    value = when.replace('Z', '+00:00')
+    if len(value) > 6 and value[-6] in '+-' and value[-3] == ':':
+        value = value[:-3] + value[-2:]
+    fmt = '%Y-%m-%dT%H:%M:%S.%f%z' if '.' in value else '%Y-%m-%dT%H:%M:%S%z'
+    return datetime.strptime(value, fmt).astimezone().replace(tzinfo=None)
 
 class ConfluencePageTreeSpider(scrapy.Spider):
     name = 'confluence_page_tree'
@@ -50,255 +56,256 @@ class ConfluencePageTreeSpider(scrapy.Spider):
         },
         'LOG_LEVEL': 'INFO',
         'LOG_FILE': os.path.join(DIRS['logs_dir'], 'update_confluence.log'),
-        'LOG_FORMAT': '%(asctime)s - %(levelname)s - %(message)s'
+        'LOG_FORMAT': '%(asctime)s - %(levelname)s - [%(run_id)s] %(message)s'
     }
     
-    def __init__(self, base_url=None, cookies=None, *args, **kwargs):
+    def __init__(self, base_url=None, cookies=None, page_queue=None,
+                 max_depth=5, max_pages_per_space=None, frontier_limit=16, *args, **kwargs):
         """初始化爬虫"""
         super().__init__(*args, **kwargs)
         self.base_url = base_url or CONFLUENCE_CONFIG['base_url']
-        self.all_pages = set()
+        # 由编排器传入时复用同一次登录的cookies，否则在启动时读取cookies文件
+        self.cookies = cookies
+        # 流式模式下，新发现的页面立即交给PDF爬虫处理
+        self.page_queue = page_queue
+        # 本次运行实际发现的页面；历史记录单独保存，用于判断哪些页面已被删除
+        self.all_pages = PageRegistry()
+        self.known_pages = PageRegistry()
         self.processed_count = 0
         self.start_time = None
         self.last_log_time = None
         self.last_processed_count = 0
         # 修改缓存目录到固定位置
         self.cache_dir = os.path.join(DIRS['records_dir'], 'page_tree_cache')
-        self.cache = {}
+        self.cache = None
         self.cache_expire_days = 7
-        self.max_cache_entries = 10000  # 最大缓存条目数
-        self.cache_chunk_size = 1000    # 每次加载的缓存数量
+        self.cache_memory_budget = 64 * 1024 * 1024   # 内存中解压后的缓存上限
+        self.cache_disk_budget = 512 * 1024 * 1024    # 磁盘上有效缓存数据上限
+        self.cache_compact_interval = 600             # 后台压缩检查间隔（秒）
         self.no_permission_pages = set() # 记录无权限的页面
+        # 页面ID记录采用追加式账本，进度保存只追加新增记录
+        self.ledger = PageLedger(os.path.join(DIRS['records_dir'], FILES['all_page_ids']))
+        self.progress_interval = 100  # 每处理多少个页面保存一次进度
+        # 持久化的父子关系，用于整体移动或删除子树；每次运行都完整遍历，
+        # 直接子页面的版本和数量不变并不代表更深层的页面没有新增、删除或移动
+        self.tree_store = PageTreeStore(os.path.join(DIRS['records_dir'], 'page_tree.tsv')).load()
+        # 按页面ID去重：同一页面可能从多个父页面或REST/naturalchildren两条路径到达，
+        # 已展开或正在请求子页面的页面不再重复展开
+        self.visited_pages = set()
+        self.in_flight_pages = set()
+        self.coalesced_requests = 0
+        # 子页面展开失败（限流、超时、解析出错等）且没有从其他路径成功展开的页面，
+        # 其子树本次未被遍历，不能据此判断子树中的页面已被删除
+        self.failed_expansions = set()
+        # 广度优先展开队列：调度器中最多只有 frontier_limit 个子页面请求，其余在队列中等待，
+        # 超出内存上限的部分溢写到文件；max_depth 为空或负数时不限制深度。
+        # 队列（会清空溢写文件）和缓存（会启动后台压缩）在 start_requests 中才创建，
+        # 只调用 get_page_updates 等程序化接口时不影响正在运行的完整爬取
+        self.max_depth = int(max_depth) if max_depth not in (None, '') and int(max_depth) >= 0 else None
+        self.max_pages_per_space = int(max_pages_per_space) if max_pages_per_space else None
+        self.frontier_limit = int(frontier_limit)
+        self.frontier = None
+        self.request_cookies = None
+        self.rest_client = None
+        self.total_parent_pages = 0
         
-        # 加载历史记录和缓存
+        # 加载历史记录
         self.load_history()
-        self.init_cache()
-        
-    def init_cache(self):
-        """初始化缓存系统"""
-        try:
-            if not os.path.exists(self.cache_dir):
-                os.makedirs(self.cache_dir)
-                return
-                
-            # 创建缓存索引文件
-            self.index_file = os.path.join(self.cache_dir, 'cache_index.json')
-            if not os.path.exists(self.index_file):
-                self.create_cache_index()
-                
-            # 初始化空缓存
-            self.cache = {}
-            self.cache_stats = {
-                'total_entries': 0,
-                'loaded_chunks': set(),
-                'last_cleanup': datetime.now()
-            }
-            
-            # 加载缓存索引
-            self.load_cache_index()
-            
-        except Exception as e:
-            self.logger.error(f"初始化缓存系统失败: {str(e)}")
-            self.cache = {}
-            
-    def create_cache_index(self):
-        """创建缓存索引"""
-        try:
-            # 扫描所有缓存文件
-            cache_files = glob.glob(os.path.join(self.cache_dir, 'cache_chunk_*.json'))
-            index_data = {
-                'chunks': {},
-                'total_entries': 0,
-                'last_cleanup': datetime.now().isoformat()
-            }
-            
-            for cache_file in cache_files:
-                chunk_id = int(re.search(r'cache_chunk_(\d+).json', cache_file).group(1))
-                with open(cache_file, 'r', encoding='utf-8') as f:
-                    chunk_data = json.load(f)
-                    index_data['chunks'][str(chunk_id)] = {
-                        'count': len(chunk_data),
-                        'last_modified': datetime.now().isoformat()
-                    }
-                    index_data['total_entries'] += len(chunk_data)
-                    
-            with open(self.index_file, 'w', encoding='utf-8') as f:
-                json.dump(index_data, f, ensure_ascii=False, indent=2)
-                
-        except Exception as e:
-            self.logger.error(f"创建缓存索引失败: {str(e)}")
-            
-    def load_cache_index(self):
-        """加载缓存索引"""
-        try:
-            with open(self.index_file, 'r', encoding='utf-8') as f:
-                self.cache_index = json.load(f)
-                self.cache_stats['total_entries'] = self.cache_index['total_entries']
-                self.cache_stats['last_cleanup'] = parse_iso_datetime(self.cache_index['last_cleanup'])
-        except Exception as e:
-            self.logger.error(f"加载缓存索引失败: {str(e)}")
-            self.cache_index = {'chunks': {}, 'total_entries': 0}
-            
-    def load_cache_chunk(self, chunk_id):
-        """加载指定的缓存块"""
-        try:
-            if chunk_id in self.cache_stats['loaded_chunks']:
-                return True
-                
-            chunk_file = os.path.join(self.cache_dir, f'cache_chunk_{chunk_id}.json')
-            if not os.path.exists(chunk_file):
-                return False
-                
-            with open(chunk_file, 'r', encoding='utf-8') as f:
-                chunk_data = json.load(f)
-                
-            # 过滤过期的缓存条目
-            current_time = datetime.now()
-            valid_entries = {
-                k: v for k, v in chunk_data.items()
-                if parse_iso_datetime(v['timestamp']) + timedelta(days=self.cache_expire_days) > current_time
-            }
-            
-            self.cache.update(valid_entries)
-            self.cache_stats['loaded_chunks'].add(chunk_id)
-            
-            # 如果缓存大小超过限制，清理最旧的块
-            while len(self.cache) > self.max_cache_entries:
-                oldest_chunk = min(self.cache_stats['loaded_chunks'])
-                self.unload_cache_chunk(oldest_chunk)
-                
-            return True
-            
-        except Exception as e:
-            self.logger.error(f"加载缓存块 {chunk_id} 失败: {str(e)}")
-            return False
-            
-    def unload_cache_chunk(self, chunk_id):
-        """卸载指定的缓存块"""
-        try:
-            chunk_file = os.path.join(self.cache_dir, f'cache_chunk_{chunk_id}.json')
-            if chunk_id in self.cache_stats['loaded_chunks']:
-                # 获取该块中的所有键
-                keys_to_remove = [k for k in self.cache.keys() if self.get_chunk_id(k) == chunk_id]
-                for k in keys_to_remove:
-                    del self.cache[k]
-                self.cache_stats['loaded_chunks'].remove(chunk_id)
-                
-        except Exception as e:
-            self.logger.error(f"卸载缓存块 {chunk_id} 失败: {str(e)}")
-            
-    def get_chunk_id(self, key):
-        """根据键获取块ID"""
-        # 使用简单的哈希函数将键映射到块ID
-        return hash(key) % (self.max_cache_entries // self.cache_chunk_size)
         
-    def get_cache(self, url):
-        """获取缓存数据"""
-        chunk_id = self.get_chunk_id(url)
-        
-        # 如果需要的块未加载，则加载它
-        if chunk_id not in self.cache_stats['loaded_chunks']:
-            self.load_cache_chunk(chunk_id)
-            
-        return self.cache.get(url)
-        
-    def set_cache(self, url, data):
-        """设置缓存数据"""
-        chunk_id = self.get_chunk_id(url)
-        
-        # 确保相应的块已加载
-        if chunk_id not in self.cache_stats['loaded_chunks']:
-            self.load_cache_chunk(chunk_id)
-            
-        self.cache[url] = {
-            'data': data,
-            'timestamp': datetime.now().isoformat()
-        }
-        
-        # 如果缓存大小超过限制，清理最旧的块
-        while len(self.cache) > self.max_cache_entries:
-            oldest_chunk = min(self.cache_stats['loaded_chunks'])
-            self.unload_cache_chunk(oldest_chunk)
-
     def load_history(self):
         """加载历史页面ID记录"""
         try:
-            history_file = os.path.join(DIRS['records_dir'], FILES['all_page_ids'])
-            if os.path.exists(history_file):
-                with open(history_file, 'r', encoding='utf-8') as f:
-                    for line in f:
-                        parts = line.strip().split('\t')
-                        if len(parts) >= 3:
-                            page_id, department, code = parts[:3]
-                            self.all_pages.add((page_id, department, code))
-                self.logger.info(f"已加载 {len(self.all_pages)} 个历史页面ID记录")
+            self.known_pages = self.ledger.load()
+            if self.known_pages:
+                self.logger.info(f"已加载 {len(self.known_pages)} 个历史页面ID记录")
         except Exception as e:
             self.logger.error(f"加载历史记录失败: {str(e)}")
-            self.all_pages = set()
+            self.known_pages = PageRegistry()
 
-    def load_cache(self):
-        """加载缓存数据"""
+    def init_cache(self):
+        """初始化压缩缓存，旧版本的JSON缓存文件不再使用，直接删除"""
         try:
-            if not os.path.exists(self.cache_dir):
-                os.makedirs(self.cache_dir)
-                return
-                
-            cache_file = os.path.join(self.cache_dir, 'page_tree_cache.json')
-            if os.path.exists(cache_file):
-                with open(cache_file, 'r', encoding='utf-8') as f:
-                    cache_data = json.load(f)
-                    # 检查并清理过期缓存
-                    current_time = datetime.now()
-                    self.cache = {
-                        k: v for k, v in cache_data.items()
-                        if parse_iso_datetime(v['timestamp']) + timedelta(days=self.cache_expire_days) > current_time
-                    }
-                self.logger.info(f"已加载 {len(self.cache)} 条缓存记录")
+            self.cache = CompressedCacheStore(
+                self.cache_dir,
+                ttl=self.cache_expire_days * 86400,
+                memory_budget=self.cache_memory_budget,
+                disk_budget=self.cache_disk_budget
+            )
+            self.cache.start_background_compaction(self.cache_compact_interval)
+            self.logger.info(f"已加载缓存索引，共 {len(self.cache)} 条记录")
         except Exception as e:
-            self.logger.error(f"加载缓存失败: {str(e)}")
-            self.cache = {}
+            self.logger.error(f"初始化缓存系统失败: {str(e)}")
+            self.cache = None
+            return
+        for legacy_file in glob.glob(os.path.join(self.cache_dir, '*.json')):
+            try:
+                os.remove(legacy_file)
+            except OSError:
+                pass
             
     def save_cache(self):
-        """保存缓存数据"""
+        """把缓存写入磁盘"""
         try:
-            cache_file = os.path.join(self.cache_dir, 'page_tree_cache.json')
-            with open(cache_file, 'w', encoding='utf-8') as f:
-                json.dump(self.cache, f, ensure_ascii=False, indent=2)
-            self.logger.info(f"已保存 {len(self.cache)} 条缓存记录")
+            if self.cache is not None:
+                self.cache.flush()
+                self.logger.info(f"已保存 {len(self.cache)} 条缓存记录")
         except Exception as e:
             self.logger.error(f"保存缓存失败: {str(e)}")
             
     def get_cache(self, url):
-        """获取缓存数据"""
-        cache_data = self.cache.get(url)
-        if cache_data:
-            cache_time = parse_iso_datetime(cache_data['timestamp'])
-            if cache_time + timedelta(days=self.cache_expire_days) > datetime.now():
-                return cache_data['data']
-        return None
+        """获取缓存数据，超过有效期的视为不存在"""
+        if self.cache is None:
+            return None
+        data = self.cache.get(url)
+        get_registry().inc('cache_lookups_total', spider=self.name,
+                           result='hit' if data is not None else 'miss')
+        return data
         
     def set_cache(self, url, data):
         """设置缓存数据"""
-        self.cache[url] = {
-            'data': data,
-            'timestamp': datetime.now().isoformat()
-        }
-        # 每100个新缓存保存一次
-        if len(self.cache) % 100 == 0:
-            self.save_cache()
+        if self.cache is None:
+            return
+        try:
+            self.cache.put(url, data)
+        except Exception as e:
+            self.logger.error(f"写入缓存失败: {str(e)}")
+
+    @classmethod
+    def from_crawler(cls, crawler, *args, **kwargs):
+        spider = super().from_crawler(crawler, *args, **kwargs)
+        crawler.signals.connect(spider.spider_idle, signal=signals.spider_idle)
+        return spider
+
+    def children_api_url(self, page_id, limit=200):
+        """子页面列表的REST地址"""
+        # 子页面列表只需要ID、版本和空间，不展开 body.view，避免传输和缓存整页HTML
+        expand = 'version,space,metadata.labels'
+        return f"{self.base_url}/rest/api/content/{page_id}/child/page?expand={expand}&limit={limit}"
 
-    def save_progress(self, force=False):
-        """保存进度到文件"""
+    def enqueue_child(self, page_id, department, code, depth, parent_index, space=''):
+        """把子页面放入展开队列，已展开或正在展开的页面直接合并"""
+        key = int(page_id)
+        if key in self.visited_pages or key in self.in_flight_pages:
+            self.coalesced_requests += 1
+            return False
+        return self.frontier.push(page_id, department, code, depth, parent_index, space)
+
+    def expansion_request(self, entry):
+        """展开一个页面的子页面列表的请求"""
+        return scrapy.Request(
+            url=self.children_api_url(entry.page_id),
+            headers={'Referer': f"{self.base_url}/pages/viewpage.action?pageId={entry.page_id}"},
+            cookies=self.request_cookies,
+            callback=self.parse,
+            errback=self.handle_error,
+            meta={
+                'parent_id': entry.page_id,
+                'department': entry.department,
+                'code': entry.code,
+                'depth': entry.depth,
+                'parent_index': entry.parent_index,
+                'space': entry.space
+            },
+            dont_filter=True
+        )
+
+    def drain_frontier(self):
+        """从展开队列补充请求，保持正在展开的页面数不超过 frontier_limit"""
+        while len(self.in_flight_pages) < self.frontier_limit:
+            entry = self.frontier.pop()
+            if entry is None:
+                return
+            if not self.claim_expansion(entry.page_id):
+                continue
+            cached_data = self.get_cache(self.children_api_url(entry.page_id))
+            if cached_data:
+                # 如果有缓存，直接处理缓存数据
+                yield from self.process_cached_data(
+                    cached_data, entry.page_id, entry.department, entry.code, entry.depth, entry.parent_index,
+                    entry.space)
+            else:
+                yield self.expansion_request(entry)
+
+    def spider_idle(self, spider):
+        """调度器空闲时从展开队列继续补充请求，确实调度了新请求时才阻止爬虫关闭"""
+        if self.in_flight_pages:
+            # 空闲时不应还有正在展开的页面，残留的登记说明某条路径没有释放，按失败处理
+            self.logger.warning(f"释放 {len(self.in_flight_pages)} 个未完成的展开登记")
+            for page_id in list(self.in_flight_pages):
+                self.finish_expansion(page_id, success=False)
+        if self.frontier is None or not len(self.frontier):
+            return
+        scheduled = 0
+        for request in self.drain_frontier():
+            self.crawler.engine.crawl(request)
+            scheduled += 1
+        if scheduled:
+            raise DontCloseSpider
+
+    @staticmethod
+    def result_position(result, default):
+        """子页面在父页面下的位置"""
+        position = (result.get('extensions') or {}).get('position')
+        return position if isinstance(position, int) else default
+
+    @staticmethod
+    def result_version(result):
+        return (result.get('version') or {}).get('number', -1)
+
+    def add_page(self, page_id, department, code):
+        """记录发现的页面，流式模式下同时放入交接队列"""
+        if self.all_pages.add(page_id, department, code) and \
+                (page_id, department, code) not in self.known_pages:
+            self.ledger.append(page_id, department, code)
+        if self.page_queue is not None:
+            self.page_queue.put(page_id, department, code)
+
+    def remove_page(self, page_id, department, code):
+        """移除无法访问的页面"""
+        found = self.all_pages.discard(page_id)
+        known = self.known_pages.discard(page_id)
+        if found or known:
+            self.ledger.remove(page_id, department, code)
+
+    def pages_to_persist(self, complete=False):
+        """需要写入快照的页面
+
+        完整遍历结束后只保留本次发现的页面，未发现的即视为已删除；
+        中途保存或异常结束时保留历史记录，避免误删尚未遍历到的页面。
+        """
+        if complete:
+            return self.all_pages
+        merged = PageRegistry(self.known_pages)
+        for page_id, department, code in self.all_pages:
+            merged.add(page_id, department, code)
+        return merged
+
+    def claim_expansion(self, page_id):
+        """登记即将展开子页面的页面，已展开或正在展开时返回 False"""
+        key = int(page_id)
+        if key in self.visited_pages or key in self.in_flight_pages:
+            self.coalesced_requests += 1
+            return False
+        self.in_flight_pages.add(key)
+        return True
+
+    def finish_expansion(self, page_id, success=True):
+        """页面的子页面请求完成；失败时释放登记，允许从其他路径重新展开"""
+        key = int(page_id)
+        self.in_flight_pages.discard(key)
+        if success:
+            self.visited_pages.add(key)
+            self.failed_expansions.discard(key)
+        else:
+            self.failed_expansions.add(key)
+
+    def save_progress(self, force=False, complete=False):
+        """保存进度到文件：追加新增记录，日志过长或 force 时才重写快照"""
         try:
-            output_path = os.path.join(DIRS['records_dir'], FILES['all_page_ids'])
-            temp_path = output_path + '.tmp'
-            
-            # 直接写入当前收集的页面ID
-            with open(temp_path, 'w', encoding='utf-8') as f:
-                for page_id, department, code in sorted(self.all_pages, key=lambda x: int(x[0])):
-                    f.write(f"{page_id}\t{department}\t{code}\n")
-                    
-            os.replace(temp_path, output_path)
+            if force or self.ledger.needs_compaction:
+                self.ledger.compact(self.pages_to_persist(complete))
+            else:
+                self.ledger.flush()
             self.logger.info(f"已保存进度，当前收集到 {len(self.all_pages)} 个页面ID")
             
         except Exception as e:
@@ -309,21 +316,31 @@ class ConfluencePageTreeSpider(scrapy.Spider):
         try:
             self.start_time = time.time()
             self.last_log_time = self.start_time
+            self.frontier = PageFrontier(
+                max_depth=self.max_depth,
+                max_pages_per_space=self.max_pages_per_space,
+                spool_path=os.path.join(DIRS['records_dir'], 'page_tree_frontier.spool')
+            )
+            self.init_cache()
             
             # 读取cookies
-            cookies_path = os.path.join("confluence", "cookies.pkl")
-            self.logger.info(f"读取cookies文件: {cookies_path}")
-            if not os.path.exists(cookies_path):
-                self.logger.error(f"cookies文件不存在: {cookies_path}")
-                from ..utils.selenium_login import get_cookies
-                if not get_cookies(self.base_url, CONFLUENCE_CONFIG['username'], CONFLUENCE_CONFIG['password']):
-                    self.logger.error("获取cookies失败")
-                    return
-                self.logger.info("成功重新获取cookies")
-                
-            with open(cookies_path, "rb") as f:
-                cookies = pickle.load(f)
-                self.logger.info(f"成功读取 {len(cookies)} 个cookies")
+            cookies = self.cookies
+            if cookies:
+                self.logger.info(f"使用编排器共享的 {len(cookies)} 个cookies")
+            else:
+                cookies_path = os.path.join("confluence", "cookies.pkl")
+                self.logger.info(f"读取cookies文件: {cookies_path}")
+                if not os.path.exists(cookies_path):
+                    self.logger.error(f"cookies文件不存在: {cookies_path}")
+                    from ..utils.selenium_login import get_cookies
+                    if not get_cookies(self.base_url, CONFLUENCE_CONFIG['username'], CONFLUENCE_CONFIG['password']):
+                        self.logger.error("获取cookies失败")
+                        return
+                    self.logger.info("成功重新获取cookies")
+                    
+                with open(cookies_path, "rb") as f:
+                    cookies = pickle.load(f)
+                    self.logger.info(f"成功读取 {len(cookies)} 个cookies")
             
             # 读取父页面ID文件
             father_ids_path = os.path.join(DIRS['records_dir'], FILES['father_page_ids'])
@@ -353,44 +370,26 @@ class ConfluencePageTreeSpider(scrapy.Spider):
                 self.logger.error("没有读取到任何父页面ID，请检查文件格式")
                 return
                 
-            # 生成请求
+            # 父页面作为深度 0 的页面放入展开队列
+            self.request_cookies = cookies
             for i, (parent_id, department, code) in enumerate(parent_pages, 1):
                 self.logger.info(f"处理父页面 {i}/{self.total_parent_pages} (ID: {parent_id})")
-                # 修改API URL格式
-                api_url = f"{self.base_url}/rest/api/content/{parent_id}/child/page?expand=version,space,body.view,metadata.labels"
                 
                 # 保存父页面信息
-                self.all_pages.add((parent_id, department, code))
-                
-                # 添加更多的请求头
-                headers = {
-                    'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36',
-                    'Accept': 'application/json, text/javascript, */*; q=0.01',
-                    'Accept-Language': 'zh-CN,zh;q=0.9,en;q=0.8',
-                    'X-Requested-With': 'XMLHttpRequest',
-                    'Referer': f"{self.base_url}/pages/viewpage.action?pageId={parent_id}"
-                }
-                
-                yield scrapy.Request(
-                    url=api_url,
-                    headers=headers,
-                    cookies=cookies,
-                    callback=self.parse,
-                    errback=self.handle_error,
-                    meta={
-                        'parent_id': parent_id,
-                        'department': department,
-                        'code': code,
-                        'depth': 0,
-                        'parent_index': i
-                    },
-                    dont_filter=True
-                )
+                self.add_page(parent_id, department, code)
+                self.tree_store.set_root(parent_id)
+                if not self.enqueue_child(parent_id, department, code, 0, i):
+                    self.logger.info(f"父页面 {parent_id} 已在队列中，跳过")
+            
+            yield from self.drain_frontier()
                 
         except Exception as e:
             self.logger.error(f"启动爬虫失败: {str(e)}")
 
     def parse(self, response):
+        # 子页面列表全部取完或交给下一页请求后置为 True；其他退出路径都要释放展开登记，
+        # 否则 in_flight_pages 中的名额泄漏，累计 frontier_limit 个后展开队列不再调度任何请求
+        handed_off = False
         try:
             self.logger.info(f"正在处理URL: {response.url}")
             self.logger.info(f"响应头: {response.headers}")
@@ -406,7 +405,8 @@ class ConfluencePageTreeSpider(scrapy.Spider):
                 self.logger.debug(f"使用缓存数据: {response.url}")
                 data = cached_data
             else:
-                data = json.loads(response.text)
+                # 直接解析响应字节，省去解码为字符串的一步
+                data = jsonutil.loads(response.body)
                 # 保存到缓存
                 self.set_cache(response.url, data)
 
@@ -416,39 +416,38 @@ class ConfluencePageTreeSpider(scrapy.Spider):
             code = response.meta['code']
             depth = response.meta.get('depth', 0)
             parent_index = response.meta.get('parent_index', 0)
+            start = response.meta.get('start', 0)
+            links = data.get('_links') or {}
             
             # 处理子页面
             child_count = len(results)
             if child_count > 0:
                 self.logger.info(f"父页面 {parent_index}/{self.total_parent_pages} (ID: {parent_id}) 在深度 {depth} 发现 {child_count} 个子页面")
             
+            collected = response.meta.get('collected', []) + [
+                (result['id'], self.result_position(result, start + index), self.result_version(result))
+                for index, result in enumerate(results)
+            ]
+            if links.get('next'):
+                # 子页面较多时分页返回，全部取完后再记录父子关系
+                yield response.request.replace(
+                    url=f"{links.get('base', self.base_url)}{links['next']}",
+                    meta=dict(response.meta, start=start + child_count, collected=collected)
+                )
+            else:
+                self.finish_expansion(parent_id)
+                self.tree_store.record_children(parent_id, collected)
+                get_tracer().emit('discovery', response.meta.get('trace_start'), parent_id,
+                                  source='rest', depth=depth, children=len(collected))
+            handed_off = True
+            
             for result in results:
                 page_id = str(result['id'])
-                self.all_pages.add((page_id, department, code))
-                              
-                if depth < 5:
-                    api_url = f"{self.base_url}/rest/api/content/{page_id}/child/page?expand=version,space,body.view,metadata.labels"
-                    # 检查缓存
-                    cached_data = self.get_cache(api_url)
-                    if cached_data:
-                        # 如果有缓存，直接处理缓存数据
-                        yield from self.process_cached_data(cached_data, page_id, department, code, depth + 1, parent_index)
-                    else:
-                        # 如果没有缓存，发起请求
-                        yield scrapy.Request(
-                            url=api_url,
-                            cookies=response.request.cookies,
-                            callback=self.parse,
-                            meta={
-                                'parent_id': page_id,
-                                'department': department,
-                                'code': code,
-                                'depth': depth + 1,
-                                'parent_index': parent_index
-                            },
-                            dont_filter=True,
-                            errback=self.handle_error
-                        )
+                self.add_page(page_id, department, code)
+                space = (result.get('space') or {}).get('key', '')
+                self.enqueue_child(page_id, department, code, depth + 1, parent_index, space)
+            
+            yield from self.drain_frontier()
             
             # 更新处理计数
             self.processed_count += 1
@@ -469,137 +468,143 @@ class ConfluencePageTreeSpider(scrapy.Spider):
                 self.last_log_time = current_time
                 self.last_processed_count = self.processed_count
                 
-        except json.JSONDecodeError:
+            # 定期保存进度（只追加新增记录）
+            if self.processed_count % self.progress_interval == 0:
+                self.save_progress()
+                
+        except jsonutil.JSONDecodeError:
             self.logger.error(f"解析响应失败: {response.text[:200]}")
         except Exception as e:
             self.logger.error(f"处理页面时出错: {str(e)}")
-            
-    def process_cached_data(self, data, parent_id, department, code, depth, parent_index):
-        """处理缓存数据"""
+        finally:
+            if not handed_off:
+                parent_id = response.meta['parent_id']
+                self.finish_expansion(parent_id, success=False)
+                get_tracer().emit('discovery', response.meta.get('trace_start'), parent_id,
+                                  status='error', source='rest', depth=response.meta.get('depth', 0))
+            
+    def natural_children_url(self, page_id):
+        """页面树插件的子页面列表地址（HTML）"""
+        return (
+            f"{self.base_url}/plugins/pagetree/naturalchildren.action?decorator=none&excerpt=false"
+            f"&sort=position&reverse=false&disableLinks=false&expandCurrent=true&hasRoot=true"
+            f"&pageId={page_id}&treeId=0&startDepth=0"
+        )
+
+    def refresh_cookies(self):
+        """重新登录并读取cookies，失败时返回 None"""
         try:
-            # 读取cookies
-            cookies_path = os.path.join("confluence", "cookies.pkl")
-            if not os.path.exists(cookies_path):
-                self.logger.error("cookies文件不存在，尝试重新获取")
-                from ..utils.selenium_login import get_cookies
-                if not get_cookies(self.base_url, CONFLUENCE_CONFIG['username'], CONFLUENCE_CONFIG['password']):
-                    self.logger.error("获取cookies失败")
-                    return []
-                self.logger.info("成功重新获取cookies")
-                
-            with open(cookies_path, "rb") as f:
-                cookies_list = pickle.load(f)
-                cookies = {cookie['name']: cookie['value'] for cookie in cookies_list}
-            
-            # 添加必要的请求头
-            headers = {
-                'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/131.0.0.0 Safari/537.36',
-                'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,image/avif,image/webp,image/apng,*/*;q=0.8,application/signed-exchange;v=b3;q=0.7',
-                'Accept-Language': 'zh-CN,zh;q=0.9,en;q=0.8',
-                'Connection': 'keep-alive',
-                'Upgrade-Insecure-Requests': '1',
-                'Cache-Control': 'max-age=0',
-                'Sec-Fetch-Site': 'same-origin',
-                'Sec-Fetch-Mode': 'navigate',
-                'Sec-Fetch-User': '?1',
-                'Sec-Fetch-Dest': 'document',
-                'sec-ch-ua': '"Not_A Brand";v="8", "Chromium";v="120", "Google Chrome";v="120"',
-                'sec-ch-ua-mobile': '?0',
-                'sec-ch-ua-platform': '"Windows"'
-            }
-            
-            # 先访问父页面
-            view_url = f"{self.base_url}/pages/viewpage.action?pageId={parent_id}"
-            try:
-                response = requests.get(view_url, cookies=cookies, headers=headers, timeout=10, allow_redirects=False)
-                if response.status_code == 302:
-                    location = response.headers.get('Location', '')
-                    if 'login' in location:
-                        self.logger.error("会话已过期，尝试重新获取cookies")
-                        if get_cookies(self.base_url, CONFLUENCE_CONFIG['username'], CONFLUENCE_CONFIG['password']):
-                            self.logger.info("成功重新获取cookies")
-                            with open(cookies_path, "rb") as f:
-                                cookies_list = pickle.load(f)
-                                cookies = {cookie['name']: cookie['value'] for cookie in cookies_list}
-                            response = requests.get(view_url, cookies=cookies, headers=headers, timeout=10)
-                    else:
-                        self.logger.error(f"重定向到未知页面: {location}")
-                        return []
-                elif response.status_code == 404:
-                    self.logger.warning(
-                        f"页面不存在或无访问权限: 父页面 {parent_index}/{self.total_parent_pages} "
-                        f"(ID: {parent_id})，深度: {depth}，部门: {department}，代码: {code}"
-                    )
-                    if (parent_id, department, code) in self.all_pages:
-                        self.all_pages.remove((parent_id, department, code))
-                    return []
-                elif response.status_code != 200:
-                    self.logger.error(f"访问页面时出现未知错误: {response.status_code}")
-                    return []
-                
-                # 获取子页面列表
-                children_url = f"{self.base_url}/plugins/pagetree/naturalchildren.action?decorator=none&excerpt=false&sort=position&reverse=false&disableLinks=false&expandCurrent=true&hasRoot=true&pageId={parent_id}&treeId=0&startDepth=0"
-                headers.update({
-                    'Accept': '*/*',
-                    'X-Requested-With': 'XMLHttpRequest',
-                    'Referer': view_url
-                })
-                
-                try:
-                    response = requests.get(children_url, cookies=cookies, headers=headers, timeout=10)
-                    if response.status_code != 200:
-                        self.logger.error(f"获取子页面列表失败: {response.status_code}")
-                        return []
-                        
-                    # 解析HTML获取子页面ID
-                    from bs4 import BeautifulSoup
-                    soup = BeautifulSoup(response.text, 'html.parser')
-                    child_links = soup.select('a[href*="pageId="]')
-                    child_ids = []
-                    for link in child_links:
-                        href = link.get('href', '')
-                        if 'pageId=' in href:
-                            page_id = href.split('pageId=')[-1].split('&')[0]
-                            child_ids.append(page_id)
-                            
-                    # 处理每个子页面
-                    for page_id in child_ids:
-                        self.all_pages.add((page_id, department, code))
-                        
-                        if depth < 5:
-                            # 递归处理子页面
-                            child_url = f"{self.base_url}/plugins/pagetree/naturalchildren.action?decorator=none&excerpt=false&sort=position&reverse=false&disableLinks=false&expandCurrent=true&hasRoot=true&pageId={page_id}&treeId=0&startDepth=0"
-                            cached_data = self.get_cache(child_url)
-                            if cached_data:
-                                yield from self.process_cached_data(cached_data, page_id, department, code, depth + 1, parent_index)
-                            else:
-                                yield scrapy.Request(
-                                    url=child_url,
-                                    cookies=cookies,
-                                    headers=headers,
-                                    callback=self.parse,
-                                    meta={
-                                        'parent_id': page_id,
-                                        'department': department,
-                                        'code': code,
-                                        'depth': depth + 1,
-                                        'parent_index': parent_index
-                                    },
-                                    dont_filter=True,
-                                    errback=self.handle_error
-                                )
-                            
-                except Exception as e:
-                    self.logger.error(f"获取子页面列表时出错: {str(e)}")
-                    return []
-                    
-            except Exception as e:
-                self.logger.error(f"访问页面时出错: {str(e)}")
-                return []
-                
+            from ..utils.selenium_login import get_cookies
+            if not get_cookies(self.base_url, CONFLUENCE_CONFIG['username'], CONFLUENCE_CONFIG['password']):
+                self.logger.error("获取cookies失败")
+                return None
+            with open(os.path.join("confluence", "cookies.pkl"), "rb") as f:
+                self.request_cookies = pickle.load(f)
+            self.logger.info("成功重新获取cookies")
+            return self.request_cookies
         except Exception as e:
-            self.logger.error(f"处理缓存数据时出错: {str(e)}")
-            return []
+            self.logger.error(f"重新获取cookies失败: {str(e)}")
+            return None
+
+    def process_cached_data(self, data, parent_id, department, code, depth, parent_index, space=''):
+        """子页面列表已缓存时，改为通过页面树插件获取子页面
+
+        先访问页面本身确认会话和访问权限，再请求 naturalchildren.action，
+        两步都作为普通的 Scrapy 请求调度，不阻塞其他页面的展开。
+        """
+        meta = {
+            'parent_id': parent_id,
+            'department': department,
+            'code': code,
+            'depth': depth,
+            'parent_index': parent_index,
+            'space': space,
+            # 需要自己判断是否跳转到登录页
+            'dont_redirect': True,
+            'handle_httpstatus_list': [301, 302]
+        }
+        return [scrapy.Request(
+            url=f"{self.base_url}/pages/viewpage.action?pageId={parent_id}",
+            headers={'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,*/*;q=0.8'},
+            cookies=self.request_cookies,
+            callback=self.parse_view_page,
+            errback=self.handle_error,
+            meta=meta,
+            dont_filter=True
+        )]
+
+    def parse_view_page(self, response):
+        """页面可以访问后，请求页面树插件的子页面列表"""
+        parent_id = response.meta['parent_id']
+        if response.status in (301, 302):
+            location = response.headers.get('Location', b'').decode('utf-8', 'ignore')
+            if 'login' in location and not response.meta.get('relogin'):
+                self.logger.error("会话已过期，尝试重新获取cookies")
+                cookies = self.refresh_cookies()
+                if cookies:
+                    yield response.request.replace(
+                        cookies=cookies, meta=dict(response.meta, relogin=True))
+                    return
+            self.logger.error(f"页面 {parent_id} 重定向到: {location}")
+            self.finish_expansion(parent_id, success=False)
+            get_tracer().emit('discovery', response.meta.get('trace_start'), parent_id,
+                              status='redirect', source='naturalchildren', depth=response.meta.get('depth', 0))
+            yield from self.drain_frontier()
+            return
+        
+        # trace_start 由下载中间件在页面请求下载时记录，沿用到子页面列表请求，span 覆盖两步
+        meta = {key: response.meta[key]
+                for key in ('parent_id', 'department', 'code', 'depth', 'parent_index', 'space', 'trace_start')
+                if key in response.meta}
+        yield scrapy.Request(
+            url=self.natural_children_url(parent_id),
+            headers={
+                'Accept': '*/*',
+                'X-Requested-With': 'XMLHttpRequest',
+                'Referer': response.url
+            },
+            cookies=response.request.cookies,
+            callback=self.parse_natural_children,
+            errback=self.handle_error,
+            meta=meta,
+            dont_filter=True
+        )
+
+    def parse_natural_children(self, response):
+        """解析页面树插件返回的HTML，子页面放入展开队列"""
+        parent_id = response.meta['parent_id']
+        department = response.meta['department']
+        code = response.meta['code']
+        depth = response.meta.get('depth', 0)
+        parent_index = response.meta.get('parent_index', 0)
+        # 页面树插件不返回空间，子页面与父页面属于同一空间
+        space = response.meta.get('space', '')
+        
+        try:
+            # 用 parsel（lxml）选择器提取子页面链接，去重并保持页面树中的顺序
+            child_ids = []
+            for href in response.css('a[href*="pageId="]::attr(href)').getall():
+                match = PAGE_ID_PATTERN.search(href)
+                if match and match.group(1) != str(parent_id):
+                    child_ids.append(match.group(1))
+            child_ids = list(dict.fromkeys(child_ids))
+            
+            self.tree_store.record_children(parent_id, [
+                (page_id, index, -1) for index, page_id in enumerate(child_ids)
+            ])
+            
+            for page_id in child_ids:
+                self.add_page(page_id, department, code)
+                # 子页面放入展开队列，按层继续展开
+                self.enqueue_child(page_id, department, code, depth + 1, parent_index, space)
+            self.finish_expansion(parent_id)
+            get_tracer().emit('discovery', response.meta.get('trace_start'), parent_id,
+                              source='naturalchildren', depth=depth, children=len(child_ids))
+        except Exception as e:
+            self.logger.error(f"解析子页面列表时出错: {parent_id}, {str(e)}")
+            self.finish_expansion(parent_id, success=False)
+        
+        yield from self.drain_frontier()
     
     def handle_error(self, failure):
         """处理请求错误"""
@@ -612,8 +617,22 @@ class ConfluencePageTreeSpider(scrapy.Spider):
         # 获取完整的URL
         url = failure.request.url
         
-        if hasattr(failure.value, 'response'):
+        status_code = failure.value.response.status if hasattr(failure.value, 'response') else None
+        if status_code != 401:
+            get_tracer().emit(
+                'discovery', failure.request.meta.get('trace_start'), parent_id,
+                status=f"http_{status_code}" if status_code else 'error',
+                depth=depth, error=type(failure.value).__name__
+            )
+        
+        if not hasattr(failure.value, 'response'):
+            # 超时、连接失败等：释放登记以便从其他路径重新展开
+            self.finish_expansion(parent_id, success=False)
+        else:
             status_code = failure.value.response.status
+            if status_code != 401:
+                # 403/404 的页面无需再从其他路径展开；其他错误释放登记以便重新展开
+                self.finish_expansion(parent_id, success=status_code in (403, 404))
             
             if status_code == 403:
                 # 记录无权限页面
@@ -625,8 +644,7 @@ class ConfluencePageTreeSpider(scrapy.Spider):
                 # 保存无权限页面记录
                 self.save_no_permission_pages()
                 # 从 all_pages 中移除
-                if (parent_id, department, code) in self.all_pages:
-                    self.all_pages.remove((parent_id, department, code))
+                self.remove_page(parent_id, department, code)
                 return
                 
             elif status_code == 404:
@@ -635,25 +653,17 @@ class ConfluencePageTreeSpider(scrapy.Spider):
                     f"(ID: {parent_id})，深度: {depth}，部门: {department}，代码: {code}"
                 )
                 # 从 all_pages 中移除
-                if (parent_id, department, code) in self.all_pages:
-                    self.all_pages.remove((parent_id, department, code))
+                self.remove_page(parent_id, department, code)
                 return
                 
             # 如果是认证相关错误，尝试重新获取cookie
             elif status_code == 401:
                 self.logger.error(f"认证失败，尝试重新获取cookies")
-                try:
-                    from ..utils.selenium_login import get_cookies
-                    if get_cookies(self.base_url, CONFLUENCE_CONFIG['username'], CONFLUENCE_CONFIG['password']):
-                        self.logger.info("成功重新获取cookies")
-                        # 重新读取cookies
-                        cookies_path = os.path.join("confluence", "cookies.pkl")
-                        with open(cookies_path, "rb") as f:
-                            cookies = pickle.load(f)
-                        # 重新发送请求
-                        return failure.request.replace(cookies=cookies)
-                except Exception as e:
-                    self.logger.error(f"重新获取cookies失败: {str(e)}")
+                cookies = self.refresh_cookies()
+                if cookies:
+                    # 重新发送请求
+                    return failure.request.replace(cookies=cookies)
+                self.finish_expansion(parent_id, success=False)
                     
             elif status_code in [429, 503]:  # 限流或服务暂时不可用
                 self.logger.warning(f"服务器限流或暂时不可用 (状态码: {status_code})，将在重试后继续")
@@ -697,19 +707,37 @@ class ConfluencePageTreeSpider(scrapy.Spider):
     def closed(self, reason):
         """爬虫关闭时的处理"""
         try:
-            # 保存最终的页面ID结果
-            output_path = os.path.join(DIRS['records_dir'], FILES['all_page_ids'])
-            temp_path = output_path + '.tmp'
-            
-            with open(temp_path, 'w', encoding='utf-8') as f:
-                for page_id, department, code in sorted(self.all_pages, key=lambda x: int(x[0])):
-                    f.write(f"{page_id}\t{department}\t{code}\n")
-            
-            os.replace(temp_path, output_path)
+            # 通知PDF爬虫页面发现已结束
+            if self.page_queue is not None:
+                self.page_queue.close()
+                
+            # 保存最终的页面ID结果（压缩为排序后的快照）
+            # 只有正常完成且所有页面都成功展开时才丢弃本次未发现的历史页面
+            self.crawler.stats.set_value('page_tree/failed_expansions', len(self.failed_expansions))
+            complete = reason == 'finished' and not self.failed_expansions
+            if self.failed_expansions:
+                self.logger.warning(
+                    f"{len(self.failed_expansions)} 个页面的子页面展开失败，本次遍历不完整，保留历史页面记录")
+            self.save_progress(force=True, complete=complete)
+            if complete and self.known_pages:
+                vanished = self.known_pages.difference(self.all_pages)
+                self.logger.info(f"本次未再发现的历史页面: {len(vanished)} 个")
             self.logger.info(f"已保存所有页面ID，总数: {len(self.all_pages)}")
             
+            # 保存页面树结构
+            self.tree_store.save()
+            if self.frontier is not None:
+                self.logger.info(f"展开队列: {self.frontier.stats()}")
+                self.frontier.cleanup()
+            
             # 保存最终的缓存
             self.save_cache()
+            if self.cache is not None:
+                self.cache.stop_background_compaction()
+                if self.cache.needs_compaction():
+                    self.cache.compact()
+                self.logger.info(f"缓存: {self.cache.stats()}")
+                self.cache.close()
             
             # 打印统计信息
             total_time = time.time() - self.start_time
@@ -722,135 +750,182 @@ class ConfluencePageTreeSpider(scrapy.Spider):
                 f"总运行时间: {hours:02d}:{minutes:02d}:{seconds:02d}\n"
                 f"处理页面数: {self.processed_count}\n"
                 f"唯一页面数: {len(self.all_pages)}\n"
-                f"缓存数量: {len(self.cache)}\n"
+                f"合并重复展开: {self.coalesced_requests}\n"
+                f"缓存数量: {len(self.cache) if self.cache is not None else 0}\n"
                 f"平均处理速度: {self.processed_count/total_time:.2f} 页/秒"
             )
         except Exception as e:
             self.logger.error(f"关闭爬虫时出错: {str(e)}")
 
+    def get_rest_client(self):
+        """程序化接口使用的共享REST客户端"""
+        if self.rest_client is None:
+            # main.py 传入的 cookies 可能只是登录结果，此时从cookies文件读取
+            cookies = self.cookies if isinstance(self.cookies, (list, dict)) else None
+            self.rest_client = ConfluenceRestClient(self.base_url, cookies=cookies)
+        return self.rest_client
+
     def get_page_info(self, page_id):
         """获取页面信息"""
         try:
             self.logger.info(f"获取页面信息: {page_id}")
-            api_url = f"{self.base_url}/rest/api/content/{page_id}?expand=version,space,body.view,metadata.labels"
-            self.logger.debug(f"API URL: {api_url}")
-            
-            response = self.session.get(api_url)
+            response = self.get_rest_client().get_content(page_id, expand='version,space,metadata.labels')
             if response.status_code == 200:
-                data = response.json()
+                data = jsonutil.loads(response.content)
                 self.logger.info(f"成功获取页面信息: {data.get('title', 'Unknown Title')}")
                 return data
             else:
                 self.logger.error(f"获取页面信息失败: HTTP {response.status_code}")
-                self.logger.error(f"响应内容: {response.text}")
                 return None
         except Exception as e:
             self.logger.error(f"获取页面信息异常: {str(e)}")
             return None
             
-    def get_child_pages(self, parent_id):
-        """获取子页面列表"""
+    def get_child_pages(self, parent_id, limit=200):
+        """获取子页面列表（按 start/limit 翻页取全）"""
+        client = self.get_rest_client()
+        results = []
+        start = 0
         try:
-            self.logger.info(f"获取子页面列表: {parent_id}")
-            api_url = f"{self.base_url}/rest/api/content/{parent_id}/child/page?expand=version"
-            self.logger.debug(f"API URL: {api_url}")
-            
-            response = self.session.get(api_url)
-            if response.status_code == 200:
-                data = response.json()
-                results = data.get('results', [])
-                self.logger.info(f"找到 {len(results)} 个子页面")
-                return results
-            else:
-                self.logger.error(f"获取子页面列表失败: HTTP {response.status_code}")
-                self.logger.error(f"响应内容: {response.text}")
-                return []
+            while True:
+                response = client.get(f"/rest/api/content/{parent_id}/child/page", params={
+                    'expand': 'version,space,metadata.labels',
+                    'start': start,
+                    'limit': limit
+                })
+                if response.status_code != 200:
+                    self.logger.error(f"获取子页面列表失败: {parent_id}, HTTP {response.status_code}")
+                    break
+                data = jsonutil.loads(response.content)
+                page_results = data.get('results', [])
+                results.extend(page_results)
+                # 服务器可能限制每页条数，只以 _links.next 判断是否还有下一页
+                if not page_results or not (data.get('_links') or {}).get('next'):
+                    break
+                start += len(page_results)
         except Exception as e:
-            self.logger.error(f"获取子页面列表异常: {str(e)}")
-            return []
+            self.logger.error(f"获取子页面列表异常: {parent_id}, {str(e)}")
+        return results
             
-    def get_all_pages(self, parent_ids):
-        """获取所有页面信息"""
+    def get_all_pages(self, parent_ids, workers=8):
+        """广度优先并发遍历父页面下的所有页面
+
+        使用与爬虫相同的深度和空间宽度限制；子页面信息直接取自子页面列表，
+        每个页面只需一次请求。
+        """
+        frontier = PageFrontier(max_depth=self.max_depth, max_pages_per_space=self.max_pages_per_space)
         all_pages = []
-        visited = set()
         
-        def traverse(page_id):
-            if page_id in visited:
-                self.logger.debug(f"页面已访问过: {page_id}")
-                return
-                
-            visited.add(page_id)
-            self.logger.info(f"遍历页面: {page_id}")
-            
-            # 获取页面信息
-            page_info = self.get_page_info(page_id)
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            root_pages = list(executor.map(self.get_page_info, parent_ids))
+        for parent_id, page_info in zip(parent_ids, root_pages):
             if page_info:
                 all_pages.append(page_info)
-                
-                # 获取子页面
-                child_pages = self.get_child_pages(page_id)
-                for child in child_pages:
-                    child_id = child['id']
-                    traverse(child_id)
+                frontier.push(parent_id, '', '', 0, space=(page_info.get('space') or {}).get('key', ''))
             else:
-                self.logger.warning(f"无法获取页面信息: {page_id}")
-                
-        # 遍历所有父页面
-        for parent_id in parent_ids:
-            self.logger.info(f"开始遍历父页面: {parent_id}")
-            traverse(parent_id)
-            
+                self.logger.warning(f"无法获取页面信息: {parent_id}")
+        
+        def expand(entry):
+            children = self.get_child_pages(entry.page_id)
+            all_pages.extend(children)
+            return [(child['id'], (child.get('space') or {}).get('key', '')) for child in children]
+        
+        walk_frontier(frontier, expand, workers=workers)
         self.logger.info(f"总共获取到 {len(all_pages)} 个页面")
         return all_pages
         
-    def get_page_updates(self, start_time=None):
-        """获取页面更新信息"""
+    def load_update_watermark(self):
+        """读取上次成功查询更新的时间"""
+        watermark_path = os.path.join(DIRS['records_dir'], 'page_updates.watermark')
+        try:
+            if os.path.exists(watermark_path):
+                with open(watermark_path, 'r', encoding='utf-8') as f:
+                    return datetime.strptime(f.read().strip(), '%Y-%m-%d %H:%M:%S')
+        except Exception as e:
+            self.logger.error(f"读取更新水位失败: {str(e)}")
+        return None
+
+    def save_update_watermark(self, watermark):
+        """保存本次查询时间，下次只查询此后的更新"""
+        watermark_path = os.path.join(DIRS['records_dir'], 'page_updates.watermark')
+        temp_path = watermark_path + '.tmp'
+        with open(temp_path, 'w', encoding='utf-8') as f:
+            f.write(watermark.strftime('%Y-%m-%d %H:%M:%S'))
+        os.replace(temp_path, watermark_path)
+
+    def get_page_updates(self, start_time=None, use_watermark=False, chunk_size=20, workers=8):
+        """获取页面更新信息，每条更新的字段与 update_summary.get_updates 返回的记录一致
+
+        按父页面分组，每组一条 CQL（父页面本身或其后代、且在开始时间后修改过），
+        多组查询共享一个连接池并发执行，不再遍历整棵页面树。
+        use_watermark 为 True 时从上次成功查询的时间开始（没有记录时使用 start_time），
+        查询成功后更新水位，相邻两次运行之间不会漏掉更新。
+        """
         try:
             self.logger.info("获取页面更新信息")
+            if use_watermark:
+                start_time = self.load_update_watermark() or start_time
             if start_time:
                 self.logger.info(f"开始时间: {start_time}")
+            query_time = datetime.now()
             
-            # 读取父页面ID
-            with open('records/all_father_page_ids.txt', 'r') as f:
-                parent_ids = [line.strip() for line in f if line.strip()]
+            # 读取父页面ID（每行第一列）
+            father_ids_path = os.path.join(DIRS['records_dir'], FILES['father_page_ids'])
+            with open(father_ids_path, 'r', encoding='utf-8') as f:
+                parent_ids = list(dict.fromkeys(line.split()[0] for line in f if line.strip()))
             self.logger.info(f"读取到 {len(parent_ids)} 个父页面ID")
             
-            # 获取所有页面
-            all_pages = self.get_all_pages(parent_ids)
+            client = self.get_rest_client()
+            chunks = [parent_ids[i:i + chunk_size] for i in range(0, len(parent_ids), chunk_size)]
+            
+            def search_chunk(chunk):
+                ids = ','.join(chunk)
+                cql = f"type = page and (id in ({ids}) or ancestor in ({ids}))"
+                if start_time:
+                    # CQL 只精确到分钟，秒级过滤在下面按 version.when 完成
+                    cql += f' and lastmodified >= "{start_time:%Y-%m-%d %H:%M}"'
+                return list(client.search(cql, expand='version,space,metadata.labels'))
+            
+            pages = {}
+            with ThreadPoolExecutor(max_workers=max(1, min(workers, len(chunks)))) as executor:
+                for results in executor.map(search_chunk, chunks):
+                    for page in results:
+                        pages[page['id']] = page
+            self.logger.info(f"{len(chunks)} 组查询共返回 {len(pages)} 个页面")
             
             # 过滤更新的页面
             updates = []
-            for page in all_pages:
+            for page in pages.values():
                 try:
-                    last_modified = datetime.fromisoformat(
-                        page['version']['when'].replace('Z', '+00:00'))
+                    last_modified = parse_version_when(page['version']['when'])
                     
                     if not start_time or last_modified > start_time:
+                        # 与数据库中的更新记录使用相同的字段（page_id/department/code），
+                        # 部门和代码取自页面登记表，新页面尚未登记时按部门标签推断
+                        record = self.known_pages.get(page['id'])
                         update = {
-                            'id': page['id'],
+                            'page_id': page['id'],
                             'title': page['title'],
                             'url': f"{self.base_url}/pages/viewpage.action?pageId={page['id']}",
                             'space': page['space']['name'],
                             'author': page['version']['by']['displayName'],
                             'last_modified': last_modified.strftime('%Y-%m-%d %H:%M:%S'),
-                            'department': next((label['name'] for label in 
+                            'department': record.department if record else next((label['name'] for label in 
                                 page['metadata']['labels']['results']
-                                if label['name'].startswith('部门/')), '未知')
+                                if label['name'].startswith('部门/')), '未知'),
+                            'code': record.code if record else ''
                         }
                         updates.append(update)
                         self.logger.info(f"找到更新: {update['title']}")
                 except Exception as e:
                     self.logger.error(f"处理页面更新信息异常: {str(e)}")
                     continue
-                    
+            
+            updates.sort(key=lambda update: update['last_modified'], reverse=True)
+            if use_watermark:
+                self.save_update_watermark(query_time)
             self.logger.info(f"总共找到 {len(updates)} 个更新")
             return updates
         except Exception as e:
             self.logger.error(f"获取页面更新信息异常: {str(e)}")
             return []
-
-
-
-
-
-
@@ -7,21 +7,18 @@ import queue
 import pickle
 import scrapy
 import pymysql
+from scrapy import signals
+from scrapy.exceptions import DontCloseSpider
 from datetime import datetime
 from concurrent.futures import ThreadPoolExecutor
-from selenium import webdriver
-from selenium.webdriver.chrome.options import Options
-from selenium.webdriver.common.by import By
-from selenium.webdriver.support.ui import WebDriverWait
-from selenium.webdriver.support import expected_conditions as EC
 from scrapy import Spider, Request
-import json
-from urllib.parse import urljoin
-import requests
+from urllib.parse import urljoin, urlparse
 
 from ..config import CONFLUENCE_CONFIG, DIRS, FILES, DB_CONFIG
 from ..utils.selenium_login import get_cookies
 from ..items import ConfluenceItem
+from ..utils import jsonutil
+from ..utils.tracing import get_tracer
 
 class ConfluenceSpider(Spider):
     name = 'confluence'
@@ -45,14 +42,24 @@ class ConfluenceSpider(Spider):
         },
         'LOG_LEVEL': 'INFO',
         'LOG_FILE': os.path.join(DIRS['logs_dir'], 'update_confluence.log'),
-        'LOG_FORMAT': '%(asctime)s - %(levelname)s - %(message)s',
+        'LOG_FORMAT': '%(asctime)s - %(levelname)s - [%(run_id)s] %(message)s',
         'LOG_ENABLED': True
     }
 
-    def __init__(self, page_ids_file=None, *args, **kwargs):
+    def __init__(self, page_ids_file=None, cookies=None, page_queue=None, feed_limit=16, base_url=None,
+                 *args, **kwargs):
         """初始化爬虫"""
         super().__init__(*args, **kwargs)
-        self.base_url = CONFLUENCE_CONFIG['base_url']
+        self.base_url = base_url or CONFLUENCE_CONFIG['base_url']
+        # 站外过滤以实际访问的地址为准（例如基准测试中的本地模拟服务器）
+        self.allowed_domains = [urlparse(self.base_url).hostname]
+        # 由编排器传入时复用同一次登录的cookies
+        self.cookies = cookies
+        # 流式模式下从页面树爬虫的交接队列中持续获取页面
+        self.page_queue = page_queue
+        self.feed_limit = int(feed_limit)
+        self.in_flight = 0
+        self.request_cookies = None
         self.download_dir = DIRS['pdf_dir']
         self.processed_count = 0
         self.start_time = None
@@ -79,42 +86,59 @@ class ConfluenceSpider(Spider):
                         self.page_ids.append((parts[0], parts[1], parts[2]))
             self.total_pages = len(self.page_ids)
             logging.info(f"从文件读取到 {self.total_pages} 个页面ID")
-            
-        # 初始化WebDriver
-        logging.info("正在初始化Chrome WebDriver...")
-        try:
-            chrome_options = Options()
-            chrome_options.add_argument('--headless')
-            chrome_options.add_argument('--no-sandbox')
-            chrome_options.add_argument('--disable-dev-shm-usage')
-            chrome_options.add_argument('--disable-gpu')
-            chrome_options.add_argument('--disable-software-rasterizer')
-            chrome_options.add_argument('--disable-extensions')
-            
-            # 配置下载设置
-            prefs = {
-                'download.default_directory': self.download_dir,
-                'download.prompt_for_download': False,
-                'download.directory_upgrade': True,
-                'safebrowsing.enabled': True,
-                'profile.default_content_settings.popups': 0,
-                'profile.content_settings.exceptions.automatic_downloads.*.setting': 1
-            }
-            chrome_options.add_experimental_option('prefs', prefs)
-            
-            self.driver = webdriver.Chrome(
-                executable_path='/opt/maxkb/chromedriver-linux64/chromedriver',
-                options=chrome_options
-            )
-            
-            # 设置页面加载超时
-            self.driver.set_page_load_timeout(30)
-            self.driver.implicitly_wait(10)
-            
-            logging.info("Chrome WebDriver初始化成功")
-        except Exception as e:
-            logging.error(f"初始化WebDriver失败: {str(e)}")
-            raise e
+
+    @classmethod
+    def from_crawler(cls, crawler, *args, **kwargs):
+        spider = super().from_crawler(crawler, *args, **kwargs)
+        crawler.signals.connect(spider.spider_idle, signal=signals.spider_idle)
+        return spider
+
+    def make_page_request(self, page_id, department, code, index, total, cookies):
+        """生成获取页面详情的请求"""
+        api_url = f"{self.base_url}/rest/api/content/{page_id}?expand=version,body.view,metadata.labels"
+        return scrapy.Request(
+            url=api_url,
+            cookies=cookies,
+            callback=self.parse_page,
+            errback=self.handle_error,
+            meta={
+                'page_id': page_id,
+                'department': department,
+                'code': code,
+                'index': index,
+                'total': total
+            },
+            dont_filter=True
+        )
+
+    def feed_from_queue(self):
+        """从交接队列补充请求，保持在途页面数不超过 feed_limit"""
+        if self.page_queue is None or self.request_cookies is None:
+            return
+        available = self.feed_limit - self.in_flight
+        if available <= 0:
+            return
+        for page_id, department, code in self.page_queue.get_batch(available):
+            self.total_pages += 1
+            self.in_flight += 1
+            logging.info(f"流式处理第 {self.total_pages} 个页面 (ID: {page_id})")
+            request = self.make_page_request(page_id, department, code, self.total_pages, 0, self.request_cookies)
+            self.crawler.engine.crawl(request)
+
+    def page_done(self):
+        """一个流式页面处理结束（成功或失败）"""
+        if self.page_queue is None:
+            return
+        self.in_flight = max(self.in_flight - 1, 0)
+        self.feed_from_queue()
+
+    def spider_idle(self, spider):
+        """空闲时继续从交接队列取页面，页面树爬虫结束且队列取空前不关闭"""
+        if self.page_queue is None:
+            return
+        self.feed_from_queue()
+        if not self.page_queue.drained or self.in_flight:
+            raise DontCloseSpider
 
     def start_requests(self):
         """开始请求"""
@@ -123,37 +147,34 @@ class ConfluenceSpider(Spider):
             self.last_log_time = self.start_time
             
             # 读取cookies
-            cookies_path = os.path.join("confluence", "cookies.pkl")
-            logging.info(f"读取cookies文件: {cookies_path}")
-            if not os.path.exists(cookies_path):
-                logging.error(f"cookies文件不存在: {cookies_path}")
+            cookies = self.cookies
+            if cookies:
+                logging.info(f"使用编排器共享的 {len(cookies)} 个cookies")
+            else:
+                cookies_path = os.path.join("confluence", "cookies.pkl")
+                logging.info(f"读取cookies文件: {cookies_path}")
+                if not os.path.exists(cookies_path):
+                    logging.error(f"cookies文件不存在: {cookies_path}")
+                    return
+                    
+                with open(cookies_path, "rb") as f:
+                    cookies = pickle.load(f)
+                    logging.info(f"成功读取 {len(cookies)} 个cookies")
+            
+            # 流式模式：页面由交接队列逐步提供
+            if self.page_queue is not None:
+                self.request_cookies = cookies
+                self.page_queue.add_listener(self.feed_from_queue)
+                self.feed_from_queue()
                 return
                 
-            with open(cookies_path, "rb") as f:
-                cookies = pickle.load(f)
-                logging.info(f"成功读取 {len(cookies)} 个cookies")
-            
             # 生成请求
             total_pages = len(self.page_ids)
             for i, (page_id, department, code) in enumerate(self.page_ids, 1):
                 logging.info(f"开始处理第 {i}/{total_pages} 个页面 (ID: {page_id})")
                 
                 # 获取页面详情
-                api_url = f"{self.base_url}/rest/api/content/{page_id}?expand=version,body.view,metadata.labels"
-                yield scrapy.Request(
-                    url=api_url,
-                    cookies=cookies,
-                    callback=self.parse_page,
-                    errback=self.handle_error,
-                    meta={
-                        'page_id': page_id,
-                        'department': department,
-                        'code': code,
-                        'index': i,
-                        'total': total_pages
-                    },
-                    dont_filter=True
-                )
+                yield self.make_page_request(page_id, department, code, i, total_pages, cookies)
                 
         except Exception as e:
             logging.error(f"启动爬虫失败: {str(e)}")
@@ -168,7 +189,7 @@ class ConfluenceSpider(Spider):
             logging.info(f"开始处理页面: ID={page_id}, 部门={department}, 代码={code}")
             
             # 解析API响应
-            data = json.loads(response.text)
+            data = jsonutil.loads(response.body)
             
             # 提取页面信息
             title = data.get('title', '')
@@ -203,6 +224,9 @@ class ConfluenceSpider(Spider):
             item['code'] = code
             item['crawled_time'] = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
             
+            get_tracer().emit('metadata', response.meta.get('trace_start'), page_id,
+                              department=department, code=code)
+            
             # 获取页面内容以下载PDF
             page_url = f"{self.base_url}/pages/viewpage.action?pageId={page_id}"
             yield scrapy.Request(
@@ -216,12 +240,16 @@ class ConfluenceSpider(Spider):
                     'code': code,
                     'item': item
                 },
+                errback=self.handle_error,
                 dont_filter=True
             )
             
         except Exception as e:
             logging.error(f"处理页面时出错: {str(e)}")
+            get_tracer().emit('metadata', response.meta.get('trace_start'), response.meta.get('page_id'),
+                              status='error', error=type(e).__name__)
             self.failed_pages.append((page_id, department, code))
+            self.page_done()
 
     def handle_error(self, failure):
         """处理请求错误"""
@@ -231,16 +259,17 @@ class ConfluenceSpider(Spider):
         index = failure.request.meta.get('index', 0)
         total = failure.request.meta.get('total', 0)
         logging.error(f"请求失败: {failure.value}, 页面 {index}/{total} (ID: {page_id})")
+        get_tracer().emit(
+            'export' if 'item' in failure.request.meta else 'metadata',
+            failure.request.meta.get('trace_start'), page_id, status='error',
+            error=type(failure.value).__name__
+        )
         self.failed_pages.append((page_id, department, code))
+        self.page_done()
     
     def closed(self, reason):
         """爬虫关闭时的处理"""
         try:
-            # 关闭WebDriver
-            if hasattr(self, 'driver'):
-                self.driver.quit()
-                logging.info("已关闭WebDriver")
-            
             # 打印统计信息
             if hasattr(self, 'total_pages') and hasattr(self, 'failed_pages'):
                 success_pages = self.total_pages - len(self.failed_pages)
@@ -336,7 +365,7 @@ class ConfluenceSpider(Spider):
             logging.error(f"写入失败日志出错: {str(e)}")
 
     def download_pdf(self, response):
-        """下载PDF文件"""
+        """从页面中提取PDF导出链接，交给 Scrapy 下载"""
         try:
             page_id = response.meta['page_id']
             title = response.meta['title']
@@ -359,50 +388,63 @@ class ConfluenceSpider(Spider):
                     logging.info(f"PDF文件已存在，跳过下载: {new_path}")
                     item['pdf_link'] = new_path
                 else:
-                    # 使用requests下载PDF
-                    try:
-                        cookies = {cookie['name']: cookie['value'] for cookie in response.request.cookies}
-                        headers = {
-                            'User-Agent': self.driver.execute_script('return navigator.userAgent;')
-                        }
-                        pdf_response = requests.get(pdf_url, cookies=cookies, headers=headers, stream=True)
-                        
-                        if pdf_response.status_code == 200:
-                            try:
-                                with open(new_path, 'wb') as f:
-                                    for chunk in pdf_response.iter_content(chunk_size=8192):
-                                        if chunk:
-                                            f.write(chunk)
-                                
-                                # 检查文件大小
-                                if os.path.getsize(new_path) < 1024:  # 小于1KB可能是错误页面
-                                    error_msg = "下载的文件过小，可能不是有效的PDF"
-                                    os.remove(new_path)  # 删除无效文件
-                                    raise Exception(error_msg)
-                                
-                                logging.info(f"PDF下载成功: {new_path}")
-                                item['pdf_link'] = new_path
-                            except Exception as e:
-                                error_msg = f"PDF文件写入失败: {str(e)}"
-                                self.log_failed_page(page_id, title, department, code, error_msg)
-                                self.failed_pages.append((page_id, department, code))
-                        else:
-                            error_msg = f"HTTP状态码: {pdf_response.status_code}"
-                            self.log_failed_page(page_id, title, department, code, error_msg)
-                            self.failed_pages.append((page_id, department, code))
-                    except Exception as e:
-                        error_msg = f"下载失败: {str(e)}"
-                        self.log_failed_page(page_id, title, department, code, error_msg)
-                        self.failed_pages.append((page_id, department, code))
+                    # 通过 Scrapy 异步下载，不阻塞 reactor（流式模式下页面树爬虫在同一个 reactor 中运行）；
+                    # 导出较大的PDF可能较慢，单独放宽下载超时
+                    yield scrapy.Request(
+                        url=pdf_url,
+                        cookies=response.request.cookies,
+                        callback=self.save_pdf,
+                        errback=self.handle_pdf_error,
+                        meta=dict(response.meta, pdf_path=new_path, download_timeout=300),
+                        dont_filter=True
+                    )
+                    return
             else:
                 error_msg = "未找到PDF下载链接"
                 self.log_failed_page(page_id, title, department, code, error_msg)
                 self.failed_pages.append((page_id, department, code))
             
-            yield item
+            yield self.finish_export(response.meta)
                 
         except Exception as e:
             error_msg = f"处理出错: {str(e)}"
             self.log_failed_page(page_id, title, department, code, error_msg)
             self.failed_pages.append((page_id, department, code))
+            self.page_done()
             yield item
+
+    def save_pdf(self, response):
+        """把下载的PDF写入文件"""
+        meta = response.meta
+        new_path = meta['pdf_path']
+        try:
+            # 小于1KB可能是错误页面
+            if len(response.body) < 1024:
+                raise Exception("下载的文件过小，可能不是有效的PDF")
+            with open(new_path, 'wb') as f:
+                f.write(response.body)
+            logging.info(f"PDF下载成功: {new_path}")
+            meta['item']['pdf_link'] = new_path
+        except Exception as e:
+            error_msg = f"PDF文件写入失败: {str(e)}"
+            self.log_failed_page(meta['page_id'], meta['title'], meta['department'], meta['code'], error_msg)
+            self.failed_pages.append((meta['page_id'], meta['department'], meta['code']))
+        yield self.finish_export(meta)
+
+    def handle_pdf_error(self, failure):
+        """PDF下载失败：记录失败页面，页面信息照常写入"""
+        meta = failure.request.meta
+        response = getattr(failure.value, 'response', None)
+        error_msg = f"HTTP状态码: {response.status}" if response is not None else f"下载失败: {failure.value}"
+        self.log_failed_page(meta['page_id'], meta['title'], meta['department'], meta['code'], error_msg)
+        self.failed_pages.append((meta['page_id'], meta['department'], meta['code']))
+        yield self.finish_export(meta)
+
+    def finish_export(self, meta):
+        """记录导出 span 并结束该页面，返回页面信息"""
+        item = meta['item']
+        get_tracer().emit('export', meta.get('trace_start'), meta['page_id'],
+                          status='ok' if item.get('pdf_link') else 'error',
+                          bytes=os.path.getsize(item['pdf_link']) if item.get('pdf_link') else 0)
+        self.page_done()
+        return item
@@ -1,12 +1,13 @@
 import os
 import logging
-from datetime import datetime
-from confluence.config import DIRS, FILES, DB_CONFIG, CONFLUENCE_CONFIG
-from confluence.utils.selenium_login import get_cookies
-from confluence.spiders.confluence_page_tree import ConfluencePageTreeSpider
-from confluence.spiders.full_update import run_spider_with_timeout
-import subprocess
-import pymysql
+from datetime import datetime, timedelta
+from confluence.config import DIRS, FILES
+from confluence.spiders.orchestrator import CrawlOrchestrator, CrawlStage
+from confluence.utils.page_queue import PageHandoffQueue
+from confluence.spiders.reconcile import reconcile_after_crawl
+from confluence.utils.page_ledger import PageLedger
+from confluence.utils.page_registry import PageRegistry
+from confluence.utils.update_summary import get_updates
 
 def setup_logging():
     """配置日志"""
@@ -23,7 +24,7 @@ def setup_logging():
     fh = logging.FileHandler(log_file, encoding='utf-8')
     fh.setLevel(logging.INFO)
     
-    formatter = logging.Formatter('[%(asctime)s] %(message)s', datefmt='%Y-%m-%d %H:%M:%S')
+    formatter = logging.Formatter('[%(asctime)s] [%(run_id)s] %(message)s', datefmt='%Y-%m-%d %H:%M:%S')
     fh.setFormatter(formatter)
     
     logger.addHandler(fh)
@@ -39,74 +40,97 @@ def get_page_ids(file_path):
         # 只取每行第一列（以制表符分隔）作为页面ID
         return {int(line.split('\t')[0]) for line in f if line.strip()}
 
-def perform_incremental_update():
+def perform_incremental_update(total_timeout=None, streaming=True):
     """执行增量更新"""
     logger = setup_logging()
+    page_queue = None
     
     try:
         # 获取旧的页面ID列表
         old_ids_file = os.path.join(DIRS['records_dir'], FILES['all_page_ids'])
         if os.path.exists(old_ids_file):
-            with open(old_ids_file, 'r', encoding='utf-8') as f:
-                # 只取每行第一列（以制表符分隔）作为页面ID
-                old_page_ids = {int(line.split('\t')[0]) for line in f if line.strip()}
-            logger.info(f"读取到 {len(old_page_ids)} 个旧页面ID")
+            # 通过账本加载，包括上次运行中断时尚未压缩的追加记录
+            old_pages = PageLedger(old_ids_file).load()
+            logger.info(f"读取到 {len(old_pages)} 个旧页面ID")
         else:
-            old_page_ids = set()
+            old_pages = PageRegistry()
             logger.info("未找到旧页面ID文件，将进行全量更新")
         
-        # 运行页面树爬虫获取最新的页面ID
-        logger.info("开始获取最新页面ID")
-        if not run_spider_with_timeout('confluence_page_tree', timeout=1800):
-            logger.error("获取页面ID失败")
-            return
+        update_ids_file = os.path.join(DIRS['records_dir'], 'update_page_ids.txt')
         
-        # 获取新的页面ID列表
-        new_ids_file = os.path.join(DIRS['records_dir'], FILES['all_page_ids'])
-        if not os.path.exists(new_ids_file):
-            logger.error("新页面ID文件不存在")
-            return
+        def prepare_pdf_stage():
+            """页面树爬取完成后，比较新旧页面ID，生成需要更新的页面列表"""
+            new_ids_file = os.path.join(DIRS['records_dir'], FILES['all_page_ids'])
+            if not os.path.exists(new_ids_file):
+                logger.error("新页面ID文件不存在")
+                return None
+                
+            new_pages = PageLedger(new_ids_file).load()
+            logger.info(f"获取到 {len(new_pages)} 个新页面ID")
             
-        with open(new_ids_file, 'r', encoding='utf-8') as f:
-            # 只取每行第一列（以制表符分隔）作为页面ID
-            new_page_ids = {int(line.split('\t')[0]) for line in f if line.strip()}
-        logger.info(f"获取到 {len(new_page_ids)} 个新页面ID")
-        
-        # 计算需要更新的页面ID
-        pages_to_update = new_page_ids - old_page_ids
-        logger.info(f"需要更新 {len(pages_to_update)} 个页面")
-        
-        if not pages_to_update:
-            logger.info("没有新增页面，无需更新")
-            return
+            # 计算需要更新的页面ID（整数键的集合差，结果为升序数组）
+            pages_to_update = new_pages.difference(old_pages)
+            logger.info(f"需要更新 {len(pages_to_update)} 个页面")
             
-        # 将需要更新的页面ID写入临时文件
-        update_ids_file = os.path.join(DIRS['records_dir'], 'update_page_ids.txt')
-        with open(update_ids_file, 'w') as f:
-            for page_id in sorted(pages_to_update):
-                f.write(f"{page_id}\n")
+            if not pages_to_update:
+                logger.info("没有新增页面，无需更新")
+                return None
                 
-        # 运行主爬虫下载新增页面的PDF
-        logger.info("开始下载新增页面的PDF")
-        success = run_spider_with_timeout(
-            'confluence',
-            timeout=7200,  # 2小时超时
-            page_ids_file=update_ids_file
-        )
+            # 将需要更新的页面写入临时文件（PDF爬虫需要部门和代码列）
+            with open(update_ids_file, 'w', encoding='utf-8') as f:
+                for page_id in pages_to_update:
+                    record = new_pages.get(page_id)
+                    department, code = record.department, record.code
+                    f.write(f"{page_id}\t{department}\t{code}\n")
+            
+            logger.info("开始下载新增页面的PDF")
+            return {'page_ids_file': update_ids_file}
+        
+        orchestrator = CrawlOrchestrator(total_timeout=total_timeout)
+        if streaming:
+            # 页面树发现与PDF导出同时运行：新发现的页面通过有界队列立即交给PDF爬虫
+            page_queue = PageHandoffQueue(
+                spool_path=os.path.join(DIRS['records_dir'], 'page_handoff.spool'),
+                exclude=old_pages
+            )
+            orchestrator.add_concurrent_stages(
+                CrawlStage('confluence_page_tree', timeout=1800, on_finish=page_queue.close,
+                           page_queue=page_queue),
+                CrawlStage('confluence', timeout=9000, allow_failure=True, page_queue=page_queue)
+            )
+        else:
+            # 页面树爬虫和PDF爬虫在同一进程内依次运行，共享登录和数据库连接池
+            orchestrator.add_stage('confluence_page_tree', timeout=1800)
+            orchestrator.add_stage(
+                'confluence',
+                timeout=7200,  # 2小时超时
+                prepare=prepare_pdf_stage,
+                allow_failure=True
+            )
+        
+        logger.info("开始获取最新页面ID")
+        success = orchestrator.run()
+        
+        # 页面树完整遍历后，清理已删除的页面并修正已移动的页面
+        reconcile_after_crawl(orchestrator)
         
         if not success:
-            logger.error("PDF下载失败")
+            logger.error(f"增量更新未完成: {orchestrator.results}")
         else:
-            logger.info("PDF下载完成")
+            logger.info("增量更新爬取完成")
+        return success
             
     except Exception as e:
         logger.error(f"增量更新失败: {str(e)}")
+        return False
         
     finally:
         # 清理临时文件
         update_ids_file = os.path.join(DIRS['records_dir'], 'update_page_ids.txt')
         if os.path.exists(update_ids_file):
             os.remove(update_ids_file)
+        if page_queue is not None:
+            page_queue.cleanup()
         
         logger.info("增量更新结束")
 
@@ -114,78 +138,19 @@ def get_daily_updates():
     """获取当天的更新内容"""
     logger = logging.getLogger('incremental_update')
     try:
-        # 连接数据库
-        logger.info("正在连接数据库获取每日更新...")
-        conn = pymysql.connect(
-            host=DB_CONFIG['host'],
-            user=DB_CONFIG['user'],
-            password=DB_CONFIG['password'],
-            database=DB_CONFIG['database'],
-            port=DB_CONFIG['port'],
-            charset=DB_CONFIG['charset']
-        )
-        
-        cursor = conn.cursor(pymysql.cursors.DictCursor)
-        
-        # 查询当天更新的页面
-        sql = """
-            SELECT page_id, title, author, last_modified, url, department, code
-            FROM confluence_pages
-            WHERE DATE(last_modified) = CURDATE()
-            ORDER BY last_modified DESC
-        """
-        
-        logger.info(f"执行SQL: {sql}")
-        cursor.execute(sql)
-        updates = cursor.fetchall()
-        logger.info(f"获取到 {len(updates)} 条更新")
-        
-        return updates
-        
+        start = datetime.now().replace(hour=0, minute=0, second=0, microsecond=0)
+        return get_updates(start, start + timedelta(days=1))
     except Exception as e:
         logger.error(f"获取每日更新失败: {str(e)}")
         return []
-        
-    finally:
-        if 'conn' in locals():
-            conn.close()
-            logger.info("数据库连接已关闭")
 
 def get_hourly_updates():
     """获取最近一小时的更新内容"""
     try:
-        # 连接数据库
-        conn = pymysql.connect(
-            host=DB_CONFIG['host'],
-            user=DB_CONFIG['user'],
-            password=DB_CONFIG['password'],
-            database=DB_CONFIG['database'],
-            port=DB_CONFIG['port'],
-            charset=DB_CONFIG['charset']
-        )
-        
-        cursor = conn.cursor(pymysql.cursors.DictCursor)
-        
-        # 查询最近一小时更新的页面
-        sql = """
-            SELECT page_id, title, author, last_modified, url, department, code
-            FROM confluence_pages
-            WHERE last_modified >= DATE_SUB(NOW(), INTERVAL 1 HOUR)
-            ORDER BY last_modified DESC
-        """
-        
-        cursor.execute(sql)
-        updates = cursor.fetchall()
-        
-        return updates
-        
+        return get_updates(datetime.now() - timedelta(hours=1))
     except Exception as e:
         logging.error(f"获取每小时更新失败: {str(e)}")
         return []
-        
-    finally:
-        if 'conn' in locals():
-            conn.close()
 
 if __name__ == "__main__":
     perform_incremental_update()
\ No newline at end of file
@@ -0,0 +1,278 @@
+import os
+import sys
+import argparse
+import pickle
+import time
+import logging
+from scrapy import signals
+from scrapy.crawler import CrawlerProcess
+from scrapy.utils.project import get_project_settings
+from twisted.internet import defer
+from twisted.python.failure import Failure
+from confluence.config import CONFLUENCE_CONFIG
+from confluence.utils.db import close_pool
+from confluence.utils.tracing import get_run_id, get_tracer, close_tracer
+from confluence.utils.profiling import profile_run, PROFILE_ENV, PROFILE_MODES
+
+logger = logging.getLogger('orchestrator')
+
+COOKIES_PATH = os.path.join("confluence", "cookies.pkl")
+
+
+class CrawlStage:
+    """编排器中的一个爬取阶段"""
+
+    def __init__(self, spider_name, timeout=None, prepare=None, allow_failure=False,
+                 on_finish=None, **spider_kwargs):
+        self.spider_name = spider_name
+        self.timeout = timeout
+        # prepare 在阶段开始前调用，返回额外的爬虫参数；返回 None 表示跳过该阶段
+        self.prepare = prepare
+        self.allow_failure = allow_failure
+        # on_finish 在爬虫结束后调用（无论成功与否），用于关闭交接队列等
+        self.on_finish = on_finish
+        self.spider_kwargs = spider_kwargs
+
+
+class CrawlOrchestrator:
+    """在同一个 CrawlerProcess 中按顺序运行多个爬虫
+
+    所有阶段共享一次登录获取的 cookies 和同一个数据库连接池，
+    阶段之间通过 deferred 串联，每个阶段和整个运行都有超时控制。
+    通过 add_concurrent_stages 添加的一组阶段会同时运行，例如页面树发现与PDF导出流式衔接。
+    """
+
+    def __init__(self, total_timeout=None, grace_period=60, settings=None):
+        self.total_timeout = total_timeout
+        self.grace_period = grace_period
+        self.settings = settings or get_project_settings()
+        self.stages = []
+        self.cookies = None
+        self.results = {}
+        # 各阶段爬虫结束时的 Scrapy 统计信息
+        self.stats = {}
+        self.success = True
+        self.process = None
+        self._stopping = False
+        self._deadline = None
+
+    def add_stage(self, spider_name, timeout=None, prepare=None, allow_failure=False,
+                  on_finish=None, **spider_kwargs):
+        """添加一个爬取阶段"""
+        self.stages.append([CrawlStage(spider_name, timeout, prepare, allow_failure, on_finish, **spider_kwargs)])
+        return self
+
+    def add_concurrent_stages(self, *stages):
+        """添加一组同时运行的阶段（CrawlStage 实例），全部结束后才进入下一组"""
+        self.stages.append(list(stages))
+        return self
+
+    def login(self):
+        """登录一次并缓存 cookies，供所有阶段共享"""
+        from confluence.utils.selenium_login import get_cookies
+        logger.info("获取 cookies")
+        if not get_cookies(
+            CONFLUENCE_CONFIG['base_url'],
+            CONFLUENCE_CONFIG['username'],
+            CONFLUENCE_CONFIG['password']
+        ):
+            logger.error("获取 cookies 失败")
+            return False
+
+        with open(COOKIES_PATH, "rb") as f:
+            self.cookies = pickle.load(f)
+        logger.info(f"成功读取 {len(self.cookies)} 个cookies")
+        return True
+
+    def run(self):
+        """运行所有阶段，阻塞直到完成、超时或被信号中断"""
+        if self.cookies is None and not self.login():
+            return False
+
+        from twisted.internet import reactor
+
+        logger.info(f"运行ID: {get_run_id()}")
+        run_start = time.time()
+        self.process = CrawlerProcess(self.settings)
+        if self.total_timeout:
+            self._deadline = reactor.callLater(self.total_timeout, self._on_total_timeout)
+
+        d = self._run_stages()
+        d.addBoth(self._finish)
+
+        try:
+            # 信号处理由 CrawlerProcess 安装：第一次 SIGINT/SIGTERM 优雅关闭，第二次强制退出
+            # 设置 CONFLUENCE_PROFILE 时在分析器中运行 reactor
+            with profile_run('crawl'):
+                self.process.start(stop_after_crawl=False)
+        finally:
+            close_pool()
+            get_tracer().emit('run', run_start, status='ok' if self.success and not self._stopping else 'error',
+                              results=self.results)
+            close_tracer()
+
+        return self.success and not self._stopping
+
+    @defer.inlineCallbacks
+    def _run_stages(self):
+        """依次运行各组阶段，同一组内的阶段并发运行"""
+        for index, group in enumerate(self.stages, 1):
+            names = ', '.join(stage.spider_name for stage in group)
+            if self._stopping:
+                logger.warning(f"运行已被中止，跳过阶段 {names}")
+                break
+
+            logger.info(f"开始阶段 {index}/{len(self.stages)}: {names}")
+            crawls = []
+            for stage in group:
+                kwargs = dict(stage.spider_kwargs)
+                if stage.prepare:
+                    extra = stage.prepare()
+                    if extra is None:
+                        logger.info(f"阶段 {index}/{len(self.stages)} ({stage.spider_name}) 无需运行，跳过")
+                        continue
+                    kwargs.update(extra)
+                crawls.append((stage, self._crawl(stage, kwargs)))
+
+            if not crawls:
+                continue
+
+            reasons = yield defer.gatherResults([d for _, d in crawls])
+
+            for (stage, _), reason in zip(crawls, reasons):
+                self.results[stage.spider_name] = reason
+                logger.info(f"阶段 {stage.spider_name} 结束，原因: {reason}")
+
+                if reason == 'shutdown':
+                    self._stopping = True
+                elif reason != 'finished':
+                    if stage.allow_failure:
+                        logger.warning(f"阶段 {stage.spider_name} 未正常完成，但继续执行")
+                    else:
+                        logger.error(f"阶段 {stage.spider_name} 失败，终止后续阶段")
+                        self.success = False
+
+            if not self.success:
+                break
+
+    def _crawl(self, stage, kwargs):
+        """启动单个爬虫，返回在爬虫关闭时以关闭原因触发的 deferred"""
+        from twisted.internet import reactor
+
+        crawler = self.process.create_crawler(stage.spider_name)
+        closed = {}
+
+        def on_spider_closed(spider, reason):
+            closed['reason'] = reason
+
+        # 信号分发器默认只保存处理函数的弱引用，局部函数会在爬虫关闭前被回收，必须保存强引用
+        crawler.signals.connect(on_spider_closed, signal=signals.spider_closed, weak=False)
+        kwargs.setdefault('cookies', self.cookies)
+        stage_start = time.time()
+
+        timer = None
+        if stage.timeout:
+            timer = reactor.callLater(stage.timeout, self._on_stage_timeout, crawler, stage)
+
+        def on_done(result):
+            if timer is not None and timer.active():
+                timer.cancel()
+            if stage.on_finish:
+                try:
+                    stage.on_finish()
+                except Exception as e:
+                    logger.error(f"阶段 {stage.spider_name} 结束回调出错: {str(e)}")
+            # 引擎关闭爬虫时同时把原因写入统计信息，信号未送达时以统计为准
+            finish_reason = crawler.stats.get_value('finish_reason') if crawler.stats else None
+            if isinstance(result, Failure):
+                logger.error(f"爬虫 {stage.spider_name} 运行出错: {result.getErrorMessage()}")
+                reason = closed.get('reason', finish_reason or 'error')
+            else:
+                reason = closed.get('reason', finish_reason or 'unknown')
+            self.stats[stage.spider_name] = crawler.stats.get_stats() if crawler.stats else {}
+            get_tracer().emit('stage', stage_start, status='ok' if reason == 'finished' else reason,
+                              spider=stage.spider_name)
+            return reason
+
+        d = self.process.crawl(crawler, **kwargs)
+        d.addBoth(on_done)
+        return d
+
+    def _on_stage_timeout(self, crawler, stage):
+        """阶段超时：先优雅关闭爬虫，宽限期后强制停止"""
+        logger.error(f"爬虫 {stage.spider_name} 执行超时（{stage.timeout}秒）")
+        if crawler.engine and crawler.spider:
+            crawler.engine.close_spider(crawler.spider, 'closespider_timeout')
+
+        from twisted.internet import reactor
+        reactor.callLater(self.grace_period, self._force_stop, crawler)
+
+    def _force_stop(self, crawler):
+        """宽限期结束后仍在运行的爬虫直接停止"""
+        if crawler.crawling:
+            logger.error("爬虫未能在宽限期内关闭，强制停止")
+            crawler.stop()
+
+    def _on_total_timeout(self):
+        """整体运行超时，停止所有爬虫"""
+        logger.error(f"整体运行超时（{self.total_timeout}秒），停止所有爬虫")
+        self._stopping = True
+        self.process.stop()
+
+    def _finish(self, result):
+        """所有阶段结束后停止 reactor"""
+        if isinstance(result, Failure):
+            logger.error(f"编排运行出错: {result.getErrorMessage()}")
+            self.success = False
+
+        if self._deadline is not None and self._deadline.active():
+            self._deadline.cancel()
+
+        from twisted.internet import reactor
+        try:
+            reactor.stop()
+        except RuntimeError:  # reactor 已经停止
+            pass
+
+
+def main(mode='full', profile=None):
+    """单进程完成初始化数据库、登录、爬取和邮件汇总，profile 为性能分析模式"""
+    if profile:
+        os.environ[PROFILE_ENV] = profile
+    logging.basicConfig(
+        level=logging.INFO,
+        format='[%(asctime)s] [%(run_id)s] %(name)s - %(levelname)s - %(message)s',
+        datefmt='%Y-%m-%d %H:%M:%S',
+        stream=sys.stdout
+    )
+
+    from confluence.init_db import init_db
+    init_db()
+
+    if mode == 'full':
+        from confluence.spiders.full_update import perform_full_update
+        success = perform_full_update()
+    else:
+        from confluence.spiders.incremental_update import perform_incremental_update
+        success = perform_incremental_update()
+
+    from confluence.utils.email_sender import send_daily_summary
+    from confluence.spiders.incremental_update import get_daily_updates
+    updates = get_daily_updates()
+    if updates:
+        send_daily_summary(updates)
+        logger.info("更新汇总邮件已加入发件箱")
+    else:
+        logger.info("没有需要汇总的更新")
+    close_pool()
+
+    return success
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='单进程运行全量或增量更新')
+    parser.add_argument('mode', nargs='?', default='full', choices=('full', 'incremental'))
+    parser.add_argument('--profile', nargs='?', const='cprofile', choices=PROFILE_MODES,
+                        help='在性能分析器中运行爬取，结果写入 logs/profiles（默认 cprofile）')
+    args = parser.parse_args()
+    sys.exit(0 if main(args.mode, args.profile) else 1)
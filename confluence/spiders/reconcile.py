@@ -0,0 +1,184 @@
+import os
+import re
+import glob
+import logging
+from confluence.config import DIRS, FILES
+from confluence.utils.db import get_pool
+from confluence.utils.page_ledger import PageLedger
+from confluence.utils.page_registry import PageRegistry
+from confluence.utils.page_tree_store import PageTreeStore
+from confluence.utils.rest_client import ConfluenceRestClient
+
+logger = logging.getLogger('reconcile')
+
+PDF_ID_PATTERN = re.compile(r'_(\d+)\.pdf$')
+
+
+def load_stored_pages(conn):
+    """从数据库读取当前未删除的页面"""
+    stored = PageRegistry()
+    with conn.cursor() as cursor:
+        cursor.execute("SELECT page_id, department, code FROM confluence_pages WHERE is_deleted = 0")
+        for page_id, department, code in cursor.fetchall():
+            if str(page_id).isdigit():
+                stored.add(page_id, department or '', code or '')
+    return stored
+
+
+def find_moved_pages(stored, live):
+    """两边都存在但部门或代码发生变化的页面"""
+    moved = []
+    for page_id in stored.id_view() & live.id_view():
+        old = stored.get(page_id)
+        new = live.get(page_id)
+        if (old.department, old.code) != (new.department, new.code):
+            moved.append((new.department, new.code, str(page_id)))
+    return moved
+
+
+def verify_missing_pages(page_ids):
+    """批量确认页面确实已不存在，排除仍然存在、只是本次未遍历到的页面"""
+    client = ConfluenceRestClient()
+    try:
+        statuses = client.batch_lookup(page_ids)
+    finally:
+        client.close()
+    confirmed = [page_id for page_id in page_ids if statuses[page_id].status != 'current']
+    still_exists = len(page_ids) - len(confirmed)
+    if still_exists:
+        logger.warning(f"{still_exists} 个页面未在页面树中发现但仍然存在，暂不标记删除")
+    return confirmed
+
+
+def mark_pages_deleted(conn, page_ids, batch_size=500):
+    """批量标记页面为已删除"""
+    with conn.cursor() as cursor:
+        for start in range(0, len(page_ids), batch_size):
+            batch = [str(page_id) for page_id in page_ids[start:start + batch_size]]
+            placeholders = ', '.join(['%s'] * len(batch))
+            cursor.execute(
+                f"UPDATE confluence_pages SET is_deleted = 1, deleted_at = NOW() "
+                f"WHERE page_id IN ({placeholders})",
+                batch
+            )
+    conn.commit()
+
+
+def update_moved_pages(conn, moved):
+    """批量更新移动到其他部门的页面"""
+    with conn.cursor() as cursor:
+        cursor.executemany(
+            "UPDATE confluence_pages SET department = %s, code = %s WHERE page_id = %s",
+            moved
+        )
+    conn.commit()
+
+
+def collect_pdf_garbage(page_ids, pdf_dir=None):
+    """删除已删除页面对应的PDF文件（文件名以 _{page_id}.pdf 结尾）"""
+    pdf_dir = pdf_dir or DIRS['pdf_dir']
+    removed = 0
+    for pdf_path in glob.glob(os.path.join(pdf_dir, '*.pdf')):
+        match = PDF_ID_PATTERN.search(os.path.basename(pdf_path))
+        if match and int(match.group(1)) in page_ids:
+            try:
+                os.remove(pdf_path)
+                removed += 1
+            except OSError as e:
+                logger.error(f"删除PDF失败: {pdf_path}, {str(e)}")
+    return removed
+
+
+def prune_page_tree(page_ids):
+    """从持久化的页面树中移除已删除的页面"""
+    store = PageTreeStore(os.path.join(DIRS['records_dir'], 'page_tree.tsv')).load()
+    for page_id in page_ids:
+        store.remove_subtree(page_id)
+    store.save()
+
+
+def tree_crawl_complete(orchestrator, spider_name='confluence_page_tree'):
+    """页面树爬取是否完整：正常结束，且没有子页面展开失败的页面
+
+    展开失败（限流、超时等）的页面其子树未被遍历，这些页面不在本次结果中，
+    此时清理会把仍然存在的页面标记为已删除并删除其PDF。
+    """
+    reason = orchestrator.results.get(spider_name)
+    if reason != 'finished':
+        logger.warning(f"页面树爬取未正常完成（{reason}），跳过已删除页面清理")
+        return False
+    failed = orchestrator.stats.get(spider_name, {}).get('page_tree/failed_expansions', 0)
+    if failed:
+        logger.warning(f"{failed} 个页面的子页面展开失败，页面树不完整，跳过已删除页面清理")
+        return False
+    return True
+
+
+def reconcile_after_crawl(orchestrator):
+    """页面树完整遍历后清理已删除的页面并修正已移动的页面，返回清理结果，未执行时返回 None"""
+    if not tree_crawl_complete(orchestrator):
+        return None
+    try:
+        return perform_reconciliation()
+    except Exception as e:
+        logger.error(f"清理已删除页面失败: {str(e)}")
+        return None
+
+
+def perform_reconciliation(live=None, max_delete_ratio=0.3, verify=True, dry_run=False):
+    """比较最新发现的页面与数据库中的页面，清理已删除页面并修正已移动页面
+
+    live 为本次页面树爬取得到的 PageRegistry，缺省时从 all_page_ids.txt 加载。
+    待删除页面占比超过 max_delete_ratio 时视为爬取异常，不做任何删除；
+    verify 为 True 时，删除前通过批量 CQL 查询确认页面确实已不存在。
+    """
+    if live is None:
+        live = PageLedger(os.path.join(DIRS['records_dir'], FILES['all_page_ids'])).load()
+    if not len(live):
+        logger.warning("本次没有发现任何页面，跳过清理")
+        return None
+
+    pool = get_pool()
+    with pool.connection() as conn:
+        stored = load_stored_pages(conn)
+        missing = stored.difference(live)
+        moved = find_moved_pages(stored, live)
+        logger.info(
+            f"数据库中有 {len(stored)} 个页面，本次发现 {len(live)} 个，"
+            f"已删除 {len(missing)} 个，已移动 {len(moved)} 个"
+        )
+
+        if stored and len(missing) > len(stored) * max_delete_ratio:
+            logger.error(
+                f"待删除页面占比 {len(missing) / len(stored):.1%} 超过阈值 {max_delete_ratio:.0%}，"
+                f"可能是爬取不完整，跳过清理"
+            )
+            return None
+
+        if missing and verify:
+            try:
+                missing = verify_missing_pages(missing)
+            except Exception as e:
+                logger.error(f"确认已删除页面失败，跳过清理: {str(e)}")
+                return None
+
+        if dry_run:
+            return {'deleted': list(missing), 'moved': moved, 'pdf_removed': 0}
+
+        if missing:
+            mark_pages_deleted(conn, missing)
+        if moved:
+            update_moved_pages(conn, moved)
+
+    missing_ids = set(missing)
+    pdf_removed = collect_pdf_garbage(missing_ids) if missing_ids else 0
+    if missing_ids:
+        prune_page_tree(missing_ids)
+
+    logger.info(f"清理完成：标记删除 {len(missing)} 个页面，更新 {len(moved)} 个移动页面，删除 {pdf_removed} 个PDF")
+    return {'deleted': list(missing), 'moved': moved, 'pdf_removed': pdf_removed}
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format='[%(asctime)s] %(message)s', datefmt='%Y-%m-%d %H:%M:%S')
+    perform_reconciliation()
@@ -0,0 +1,92 @@
+import os
+import logging
+import zipfile
+import tempfile
+from email.mime.application import MIMEApplication
+from confluence.config import EMAIL_CONFIG
+
+logger = logging.getLogger('attachments')
+
+# 压缩包大小上限，邮件中经 base64 编码后约为其 4/3，可在 EMAIL_CONFIG['attachment_budget'] 中调整
+DEFAULT_BUDGET = 10 * 1024 * 1024
+
+
+def attachment_budget():
+    return EMAIL_CONFIG.get('attachment_budget', DEFAULT_BUDGET)
+
+
+class AttachmentBundle:
+    """把附件流式写入一个 zip 压缩包，压缩包大小不超过预算
+
+    文件由 zipfile 分块读取和压缩，不会整个读入内存；按原始大小预估（PDF 几乎无法再压缩），
+    加入后会超出预算的文件不放入压缩包，记入 overflow，由调用方在正文中改为链接。
+    """
+
+    def __init__(self, budget=None, name='attachments.zip'):
+        self.budget = attachment_budget() if budget is None else budget
+        self.name = name
+        self.path = None
+        self.size = 0
+        self.included = []
+        self.overflow = []
+        self._zip = None
+        self._arcnames = set()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.cleanup()
+
+    def add(self, file_path, fallback=None):
+        """加入一个文件，放不下或文件不存在时记入 overflow 并返回 False
+
+        fallback 为超出预算时改用链接展示的对象（通常是页面更新记录），默认为文件路径本身。
+        """
+        fallback = file_path if fallback is None else fallback
+        try:
+            file_size = os.path.getsize(file_path)
+        except OSError:
+            logger.warning(f"附件不存在: {file_path}")
+            self.overflow.append(fallback)
+            return False
+        if self.size + file_size > self.budget:
+            self.overflow.append(fallback)
+            return False
+
+        if self._zip is None:
+            fd, self.path = tempfile.mkstemp(prefix='confluence_attachments_', suffix='.zip')
+            os.close(fd)
+            self._zip = zipfile.ZipFile(self.path, 'w', zipfile.ZIP_DEFLATED)
+        self._zip.write(file_path, self._arcname(file_path))
+        self.size = self._zip.fp.tell()
+        self.included.append(file_path)
+        return True
+
+    def _arcname(self, file_path):
+        base, ext = os.path.splitext(os.path.basename(file_path))
+        arcname, index = base + ext, 1
+        while arcname in self._arcnames:
+            index += 1
+            arcname = f"{base}_{index}{ext}"
+        self._arcnames.add(arcname)
+        return arcname
+
+    def to_mime(self):
+        """关闭压缩包并生成邮件附件，没有放入任何文件时返回 None"""
+        if self._zip is None:
+            return None
+        self._zip.close()
+        with open(self.path, 'rb') as f:
+            part = MIMEApplication(f.read(), 'zip')
+        part.add_header('Content-Disposition', 'attachment', filename=self.name)
+        logger.info(f"附件压缩包: {len(self.included)} 个文件，{self.size / 1024 / 1024:.1f} MB，"
+                    f"{len(self.overflow)} 个文件超出预算改为链接")
+        return part
+
+    def cleanup(self):
+        if self._zip is not None:
+            self._zip.close()
+        if self.path and os.path.exists(self.path):
+            os.remove(self.path)
+        self.path = None
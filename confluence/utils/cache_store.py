@@ -0,0 +1,395 @@
+import os
+import mmap
+import time
+import zlib
+import logging
+import threading
+from collections import OrderedDict
+from . import jsonutil
+
+try:
+    import zstandard
+except ImportError:  # 未安装 zstandard 时使用 zlib
+    zstandard = None
+
+logger = logging.getLogger('cache_store')
+
+CODEC_ZLIB = 'z'
+CODEC_ZSTD = 's'
+# 删除记录的偏移量：条目被淘汰、过期或损坏时追加到索引，重新加载后不会复活
+TOMBSTONE_OFFSET = -1
+
+
+class CacheEntry:
+    """索引中的一条记录：数据帧在数据文件中的位置"""
+
+    __slots__ = ('offset', 'length', 'timestamp', 'codec')
+
+    def __init__(self, offset, length, timestamp, codec):
+        self.offset = offset
+        self.length = length
+        self.timestamp = timestamp
+        self.codec = codec
+
+    def to_line(self, key):
+        return f"{key}\t{self.offset}\t{self.length}\t{self.timestamp:.0f}\t{self.codec}\n"
+
+    @staticmethod
+    def tombstone_line(key):
+        return f"{key}\t{TOMBSTONE_OFFSET}\t0\t{time.time():.0f}\t-\n"
+
+
+class CompressedCacheStore:
+    """压缩的磁盘缓存
+
+    数据文件 cache.dat 中每个条目是一个独立压缩的帧（安装了 zstandard 时用 zstd，否则用 zlib），
+    索引文件 cache.idx 每行记录 "key\\toffset\\tlength\\ttimestamp\\tcodec"。两个文件都只追加，
+    同一个键以最后一条记录为准，偏移量为 -1 的记录表示该键已删除。
+    启动时只加载索引，读取时通过内存映射按偏移量解压单个条目，不需要把整个缓存读入内存。
+
+    淘汰策略：
+    - ttl 秒后条目过期，读取时视为不存在，并在压缩时删除；
+    - 最近读取过的条目解压后保存在内存 LRU 中，总大小不超过 memory_budget 字节；
+    - 有效条目的压缩后总大小超过 disk_budget 字节时，按最久未使用的顺序从索引中移除，
+      其空间在下次压缩时回收。
+    移除条目时同时向索引追加删除记录，压缩前重新打开缓存也不会恢复已淘汰或过期的条目。
+    后台压缩线程定期重写数据文件，重写期间读写不受阻塞，只在最后切换文件时短暂加锁。
+    """
+
+    DATA_FILE = 'cache.dat'
+    INDEX_FILE = 'cache.idx'
+
+    def __init__(self, directory, level=3, ttl=None, memory_budget=64 * 1024 * 1024,
+                 disk_budget=None, compact_ratio=2.0):
+        self.directory = directory
+        self.data_path = os.path.join(directory, self.DATA_FILE)
+        self.index_path = os.path.join(directory, self.INDEX_FILE)
+        self.level = level
+        self.ttl = ttl
+        self.memory_budget = memory_budget
+        self.disk_budget = disk_budget
+        self.compact_ratio = compact_ratio
+        # 按最近使用顺序排列，最久未使用的在最前面
+        self.index = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._memory = OrderedDict()
+        self._memory_size = 0
+        self._live_size = 0
+        self._data_file = None
+        self._index_file = None
+        self._mmap = None
+        self._mmap_size = 0
+        self._size = 0
+        self._lock = threading.RLock()
+        self._compact_thread = None
+        self._stop_event = threading.Event()
+
+        os.makedirs(directory, exist_ok=True)
+        if zstandard is not None:
+            self._codec = CODEC_ZSTD
+            self._compressor = zstandard.ZstdCompressor(level=level)
+        else:
+            self._codec = CODEC_ZLIB
+        self.load_index()
+
+    def __len__(self):
+        return len(self.index)
+
+    def __contains__(self, key):
+        return key in self.index
+
+    @property
+    def data_size(self):
+        """数据文件大小（包括已被覆盖或淘汰的旧帧）"""
+        return self._size
+
+    @property
+    def live_size(self):
+        """有效条目的压缩后总大小"""
+        return self._live_size
+
+    @property
+    def memory_size(self):
+        """内存 LRU 中解压后的数据大小"""
+        return self._memory_size
+
+    def load_index(self):
+        """加载索引，忽略超出数据文件长度的不完整记录"""
+        with self._lock:
+            self.index = OrderedDict()
+            self._live_size = 0
+            self._size = os.path.getsize(self.data_path) if os.path.exists(self.data_path) else 0
+            if not os.path.exists(self.index_path):
+                return
+            with open(self.index_path, 'r', encoding='utf-8') as f:
+                for line in f:
+                    parts = line.rstrip('\n').split('\t')
+                    if len(parts) < 5:
+                        continue
+                    try:
+                        offset, length, timestamp = int(parts[1]), int(parts[2]), float(parts[3])
+                    except ValueError:
+                        continue
+                    if offset == TOMBSTONE_OFFSET:
+                        self._forget(parts[0])
+                        continue
+                    if offset < 0 or offset + length > self._size:
+                        continue
+                    self._set_entry(parts[0], CacheEntry(offset, length, timestamp, parts[4]))
+            logger.info(f"已加载缓存索引，共 {len(self.index)} 条")
+
+    def _set_entry(self, key, entry):
+        old = self.index.pop(key, None)
+        if old is not None:
+            self._live_size -= old.length
+        self.index[key] = entry
+        self._live_size += entry.length
+
+    def _forget(self, key):
+        """从内存中的索引和 LRU 移除条目，返回是否存在"""
+        entry = self.index.pop(key, None)
+        if entry is not None:
+            self._live_size -= entry.length
+        cached = self._memory.pop(key, None)
+        if cached is not None:
+            self._memory_size -= cached[1]
+        return entry is not None
+
+    def _drop_entry(self, key):
+        """移除条目并在索引文件中追加删除记录"""
+        if self._forget(key):
+            self._open_files()
+            self._index_file.write(CacheEntry.tombstone_line(key))
+
+    def _expired(self, entry, max_age, now):
+        max_age = self.ttl if max_age is None else max_age
+        return max_age is not None and now - entry.timestamp > max_age
+
+    def _compress(self, raw):
+        if self._codec == CODEC_ZSTD:
+            return self._compressor.compress(raw)
+        return zlib.compress(raw, self.level)
+
+    def _decompress(self, frame, codec):
+        if codec == CODEC_ZSTD:
+            if zstandard is None:
+                raise ValueError("缓存使用 zstd 压缩，但未安装 zstandard")
+            # 解压对象不能在线程间共享，后台压缩只复制原始帧，这里每次新建即可
+            return zstandard.ZstdDecompressor().decompress(frame)
+        return zlib.decompress(frame)
+
+    def _read_frame(self, entry):
+        """通过内存映射读取一个数据帧，数据文件增长后重新映射"""
+        end = entry.offset + entry.length
+        if self._mmap is None or end > self._mmap_size:
+            if self._data_file is not None:
+                self._data_file.flush()
+            if self._mmap is not None:
+                self._mmap.close()
+            with open(self.data_path, 'rb') as f:
+                self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            self._mmap_size = len(self._mmap)
+        return self._mmap[entry.offset:end]
+
+    def _remember(self, key, value, size):
+        """放入内存 LRU，超出预算时淘汰最久未使用的条目"""
+        if self.memory_budget is None or size > self.memory_budget:
+            return
+        old = self._memory.pop(key, None)
+        if old is not None:
+            self._memory_size -= old[1]
+        self._memory[key] = (value, size)
+        self._memory_size += size
+        while self._memory_size > self.memory_budget:
+            _, (_, evicted_size) = self._memory.popitem(last=False)
+            self._memory_size -= evicted_size
+
+    def _enforce_disk_budget(self):
+        """有效数据超过磁盘预算时，从索引中移除最久未使用的条目"""
+        if self.disk_budget is None:
+            return
+        while self._live_size > self.disk_budget and self.index:
+            key = next(iter(self.index))
+            self._drop_entry(key)
+            self.evictions += 1
+
+    def get(self, key, max_age=None):
+        """读取缓存，不存在或超过 max_age（缺省为 ttl）秒时返回 None"""
+        with self._lock:
+            entry = self.index.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            if self._expired(entry, max_age, time.time()):
+                self._drop_entry(key)
+                self.misses += 1
+                return None
+            self.index.move_to_end(key)
+
+            cached = self._memory.get(key)
+            if cached is not None:
+                self._memory.move_to_end(key)
+                self.hits += 1
+                return cached[0]
+
+            try:
+                raw = self._decompress(self._read_frame(entry), entry.codec)
+                value = jsonutil.loads(raw)
+            except Exception as e:
+                logger.error(f"读取缓存失败: {key}, {str(e)}")
+                self._drop_entry(key)
+                self.misses += 1
+                return None
+            self._remember(key, value, len(raw))
+            self.hits += 1
+            return value
+
+    def put(self, key, value):
+        """写入缓存：追加一个压缩帧和一条索引记录"""
+        raw = jsonutil.dumps(value)
+        frame = self._compress(raw)
+        with self._lock:
+            self._open_files()
+            offset = self._size
+            self._data_file.write(frame)
+            self._size += len(frame)
+            entry = CacheEntry(offset, len(frame), time.time(), self._codec)
+            self._set_entry(key, entry)
+            self._index_file.write(entry.to_line(key))
+            self._remember(key, value, len(raw))
+            self._enforce_disk_budget()
+
+    def flush(self):
+        """把缓冲的数据帧和索引写入磁盘（先数据后索引）"""
+        with self._lock:
+            if self._data_file is not None:
+                self._data_file.flush()
+                self._index_file.flush()
+
+    def needs_compaction(self):
+        """被覆盖、淘汰的旧帧过多时需要压缩"""
+        return self._size > self.compact_ratio * max(self._live_size, 1) and self._size > 1024 * 1024
+
+    def compact(self, max_age=None):
+        """重写数据文件，只保留有效且未过期的条目
+
+        先在不加锁的情况下复制快照中的数据帧，再加锁补上复制期间新写入的条目并切换文件，
+        后台线程执行时不会长时间阻塞读写。
+        """
+        with self._lock:
+            self.flush()
+            snapshot = OrderedDict(self.index)
+        if not snapshot and not self._size:
+            return 0
+
+        now = time.time()
+        temp_data = self.data_path + '.tmp'
+        temp_index = self.index_path + '.tmp'
+        copied = OrderedDict()
+        offset = 0
+        with open(temp_data, 'wb') as data_out, open(temp_index, 'w', encoding='utf-8') as index_out, \
+                open(self.data_path, 'rb') as data_in:
+            # 已写入的帧不会再被修改，可以在不加锁的情况下复制
+            for key, entry in snapshot.items():
+                if self._expired(entry, max_age, now):
+                    continue
+                data_in.seek(entry.offset)
+                data_out.write(data_in.read(entry.length))
+                new_entry = CacheEntry(offset, entry.length, entry.timestamp, entry.codec)
+                index_out.write(new_entry.to_line(key))
+                copied[key] = (entry, new_entry)
+                offset += entry.length
+
+            with self._lock:
+                self.flush()
+                new_index = OrderedDict()
+                live_size = 0
+                for key, entry in self.index.items():
+                    pair = copied.get(key)
+                    if pair is not None and pair[0] is entry:
+                        new_entry = pair[1]
+                    else:
+                        # 复制期间新写入或更新的条目
+                        if self._expired(entry, max_age, now):
+                            continue
+                        data_in.seek(entry.offset)
+                        data_out.write(data_in.read(entry.length))
+                        new_entry = CacheEntry(offset, entry.length, entry.timestamp, entry.codec)
+                        index_out.write(new_entry.to_line(key))
+                        offset += entry.length
+                    new_index[key] = new_entry
+                    live_size += new_entry.length
+                data_out.flush()
+                index_out.flush()
+
+                self._close_files()
+                os.replace(temp_data, self.data_path)
+                os.replace(temp_index, self.index_path)
+                removed = len(set(snapshot) | set(self.index)) - len(new_index)
+                for key in list(self._memory):
+                    if key not in new_index:
+                        self._memory_size -= self._memory.pop(key)[1]
+                self.index = new_index
+                self._live_size = live_size
+                self._size = offset
+
+        logger.info(f"缓存已压缩，保留 {len(new_index)} 条，移除 {removed} 条，数据文件 {offset} 字节")
+        return removed
+
+    def start_background_compaction(self, interval=600, max_age=None):
+        """启动后台线程，每 interval 秒检查一次，需要时压缩"""
+        if self._compact_thread is not None:
+            return
+
+        def run():
+            while not self._stop_event.wait(interval):
+                try:
+                    if self.needs_compaction():
+                        self.compact(max_age=max_age)
+                except Exception as e:
+                    logger.error(f"后台压缩缓存失败: {str(e)}")
+
+        self._stop_event.clear()
+        self._compact_thread = threading.Thread(target=run, name='cache-compaction', daemon=True)
+        self._compact_thread.start()
+
+    def stop_background_compaction(self):
+        if self._compact_thread is None:
+            return
+        self._stop_event.set()
+        self._compact_thread.join()
+        self._compact_thread = None
+
+    def stats(self):
+        total = self.hits + self.misses
+        hit_rate = self.hits / total if total else 0
+        return (
+            f"条目 {len(self.index)} 个，命中率 {hit_rate:.1%}（{self.hits}/{total}），"
+            f"淘汰 {self.evictions} 个，有效数据 {self._live_size} 字节，数据文件 {self._size} 字节，"
+            f"内存 {self._memory_size} 字节"
+        )
+
+    def _open_files(self):
+        if self._data_file is None:
+            self._data_file = open(self.data_path, 'ab')
+            self._index_file = open(self.index_path, 'a', encoding='utf-8')
+
+    def _close_files(self):
+        if self._mmap is not None:
+            self._mmap.close()
+            self._mmap = None
+            self._mmap_size = 0
+        if self._data_file is not None:
+            self._data_file.close()
+            self._index_file.close()
+            self._data_file = None
+            self._index_file = None
+
+    def close(self):
+        """停止后台压缩，关闭文件和内存映射"""
+        self.stop_background_compaction()
+        with self._lock:
+            self.flush()
+            self._close_files()
@@ -0,0 +1,116 @@
+import logging
+import threading
+from contextlib import contextmanager
+import pymysql
+from confluence.config import DB_CONFIG
+
+logger = logging.getLogger('db_pool')
+
+
+class ConnectionPool:
+    """简单的pymysql连接池，同一进程内的爬虫、管道和报表共享"""
+
+    def __init__(self, max_size=4, **connect_kwargs):
+        self.max_size = max_size
+        self.connect_kwargs = connect_kwargs
+        self._idle = []
+        self._in_use = 0
+        self._lock = threading.Condition()
+
+    def _connect(self):
+        """创建新的数据库连接"""
+        conn = pymysql.connect(**self.connect_kwargs)
+        logger.info("数据库连接成功")
+        return conn
+
+    def acquire(self, timeout=30):
+        """获取一个可用连接，池满时等待"""
+        with self._lock:
+            while not self._idle and self._in_use >= self.max_size:
+                if not self._lock.wait(timeout):
+                    raise RuntimeError(f"等待数据库连接超时（{timeout}秒）")
+            conn = self._idle.pop() if self._idle else None
+            self._in_use += 1
+
+        try:
+            if conn is None:
+                return self._connect()
+            # 复用前检查连接是否仍然有效
+            conn.ping(reconnect=True)
+            return conn
+        except Exception:
+            with self._lock:
+                self._in_use -= 1
+                self._lock.notify()
+            raise
+
+    def release(self, conn, discard=False):
+        """归还连接，discard=True 时直接关闭"""
+        with self._lock:
+            self._in_use -= 1
+            if discard or not conn.open:
+                try:
+                    conn.close()
+                except Exception:
+                    pass
+            else:
+                self._idle.append(conn)
+            self._lock.notify()
+
+    @contextmanager
+    def connection(self):
+        """以上下文管理器方式使用连接，出错时回滚并丢弃"""
+        conn = self.acquire()
+        try:
+            yield conn
+        except Exception:
+            try:
+                conn.rollback()
+            except Exception:
+                pass
+            self.release(conn, discard=True)
+            raise
+        else:
+            self.release(conn)
+
+    def close_all(self):
+        """关闭所有空闲连接"""
+        with self._lock:
+            idle, self._idle = self._idle, []
+        for conn in idle:
+            try:
+                conn.close()
+            except Exception:
+                pass
+        if idle:
+            logger.info(f"已关闭 {len(idle)} 个数据库连接")
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_pool():
+    """获取进程级共享连接池"""
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ConnectionPool(
+                max_size=DB_CONFIG.get('pool_size', 4),
+                host=DB_CONFIG['host'],
+                user=DB_CONFIG['user'],
+                password=DB_CONFIG['password'],
+                database=DB_CONFIG['database'],
+                port=DB_CONFIG['port'],
+                charset=DB_CONFIG['charset']
+            )
+        return _pool
+
+
+def close_pool():
+    """关闭共享连接池"""
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.close_all()
+            _pool = None
@@ -0,0 +1,111 @@
+import io
+import html
+from collections import OrderedDict
+from datetime import datetime
+
+UNASSIGNED_DEPARTMENT = '未分配部门'
+
+DIGEST_STYLE = """
+        table {border-collapse: collapse; width: 100%; margin-bottom: 16px;}
+        th, td {border: 1px solid #ddd; padding: 8px; text-align: left;}
+        th {background-color: #f2f2f2;}
+        tr:nth-child(even) {background-color: #f9f9f9;}
+"""
+
+
+class HtmlWriter:
+    """流式HTML写入器
+
+    所有片段依次写入同一个缓冲区（默认 io.StringIO，也可以是打开的文件），
+    渲染耗时与内容长度成线性关系，不会像反复 html += 那样复制已生成的部分。
+    文本和属性统一转义，页面标题中的 < & 等字符不会破坏邮件结构。
+    """
+
+    def __init__(self, out=None):
+        self.out = out if out is not None else io.StringIO()
+
+    def raw(self, markup):
+        self.out.write(markup)
+
+    def text(self, value):
+        self.out.write(html.escape('' if value is None else str(value)))
+
+    def element(self, tag, value, **attrs):
+        """写入 <tag attr="...">文本</tag>"""
+        self.out.write(f"<{tag}")
+        for name, attr_value in attrs.items():
+            self.out.write(f' {name}="{html.escape(str(attr_value), quote=True)}"')
+        self.out.write('>')
+        self.text(value)
+        self.out.write(f"</{tag}>")
+
+    def getvalue(self):
+        return self.out.getvalue()
+
+
+def group_by_department(updates):
+    """按部门分组，保持每组内的原有顺序（通常按更新时间倒序）"""
+    groups = OrderedDict()
+    for update in updates:
+        groups.setdefault(update.get('department') or UNASSIGNED_DEPARTMENT, []).append(update)
+    return groups
+
+
+def write_update_table(writer, updates):
+    writer.raw('<table><tr><th>标题</th><th>作者</th><th>代码</th><th>链接</th><th>更新时间</th></tr>')
+    for update in updates:
+        writer.raw('<tr>')
+        writer.element('td', update.get('title'))
+        writer.element('td', update.get('author'))
+        writer.element('td', update.get('code'))
+        writer.raw('<td>')
+        writer.element('a', '查看', href=update.get('url') or '')
+        writer.raw('</td>')
+        writer.element('td', update.get('last_modified'))
+        writer.raw('</tr>')
+    writer.raw('</table>')
+
+
+def write_attachment_links(writer, updates):
+    """附件超出大小预算的页面改为链接：优先短链接 micro_link，其次页面地址"""
+    if not updates:
+        return
+    writer.element('p', f"以下 {len(updates)} 个页面的PDF超出附件大小限制，未放入附件，请通过链接查看：")
+    writer.raw('<ul>')
+    for update in updates:
+        writer.raw('<li>')
+        writer.element('a', update.get('title') or update.get('page_id'),
+                       href=update.get('micro_link') or update.get('url') or '')
+        writer.raw('</li>')
+    writer.raw('</ul>')
+
+
+def render_digest(title, groups, writer=None, footer=None):
+    """渲染按部门分组的更新摘要，groups 为 {部门: [更新, ...]}
+
+    footer 为可选的回调 footer(writer)，用于在正文末尾追加内容（如附件说明）。
+    """
+    writer = writer or HtmlWriter()
+    total = sum(len(updates) for updates in groups.values())
+    writer.raw(f"<html><head><meta charset=\"utf-8\"><style>{DIGEST_STYLE}</style></head><body>")
+    writer.element('h2', title)
+    writer.element('p', f"生成时间：{datetime.now().strftime('%Y-%m-%d %H:%M:%S')}，"
+                        f"共 {total} 个页面更新，涉及 {len(groups)} 个部门")
+
+    if len(groups) > 1:
+        writer.raw('<table><tr><th>部门</th><th>更新数</th></tr>')
+        for department, updates in groups.items():
+            writer.raw('<tr>')
+            writer.element('td', department)
+            writer.element('td', len(updates))
+            writer.raw('</tr>')
+        writer.raw('</table>')
+
+    for department, updates in groups.items():
+        writer.element('h3', f"{department}（{len(updates)}）")
+        write_update_table(writer, updates)
+
+    if footer is not None:
+        footer(writer)
+    writer.raw('</body></html>')
+    return writer.getvalue()
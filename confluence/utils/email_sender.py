@@ -1,124 +1,221 @@
 import smtplib
 from email.mime.text import MIMEText
 from email.mime.multipart import MIMEMultipart
-from email.mime.application import MIMEApplication
-import os
+import time
 from datetime import datetime
 from confluence.config import EMAIL_CONFIG
+from confluence.utils.digest import HtmlWriter, group_by_department, render_digest, write_attachment_links
+from confluence.utils.attachments import AttachmentBundle
+from confluence.utils.subscriptions import SubscriptionIndex
+from confluence.utils.outbox import Outbox, drain, outbox_settings
 import logging
 
-def send_update_email(subject, content, attachments=None):
-    """发送更新邮件"""
+
+class SMTPSession:
+    """一次运行内共用的 SMTP_SSL 连接
+
+    第一次发送时建立连接并登录，之后的邮件复用同一个连接，避免每封邮件都做一次 TLS 握手和登录；
+    服务器中途断开（例如空闲超时）时自动重连一次。
+    """
+
+    def __init__(self, config=None, timeout=60):
+        self.config = config or EMAIL_CONFIG
+        self.timeout = timeout
+        self.server = None
+        self.sent = 0
+        self.logger = logging.getLogger('email_sender')
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def connect(self):
+        self.logger.info(f"连接SMTP服务器: {self.config['smtp_server']}:{self.config['smtp_port']}")
+        self.server = smtplib.SMTP_SSL(self.config['smtp_server'], self.config['smtp_port'], timeout=self.timeout)
+        self.server.login(self.config['username'], self.config['password'])
+        self.logger.info("SMTP登录成功")
+
+    def send(self, msg):
+        if self.server is None:
+            self.connect()
+        try:
+            self.server.send_message(msg)
+        except smtplib.SMTPServerDisconnected:
+            self.logger.warning("SMTP连接已断开，重新连接")
+            self.server = None
+            self.connect()
+            self.server.send_message(msg)
+        self.sent += 1
+        self.logger.info(f"邮件发送成功: {msg['Subject']}")
+
+    def close(self):
+        if self.server is None:
+            return
+        try:
+            self.server.quit()
+        except smtplib.SMTPException:
+            pass
+        self.server = None
+
+
+def build_message(subject, content, recipients=None, attachments=None, bundle=None):
+    """构造邮件，recipients 为空时发给 EMAIL_CONFIG['recipients']
+
+    attachments 为文件路径列表，流式压缩为一个 zip 附件，超出大小预算的文件在正文末尾列出；
+    也可以直接传入已经填好的 AttachmentBundle（正文中已包含超出预算的链接）。
+    """
+    msg = MIMEMultipart()
+    msg['Subject'] = subject
+    msg['From'] = EMAIL_CONFIG['sender']
+    msg['To'] = ', '.join(recipients or EMAIL_CONFIG['recipients'])
+
+    own_bundle = bundle is None and bool(attachments)
+    if own_bundle:
+        bundle = AttachmentBundle(name=f"attachments_{datetime.now().strftime('%Y%m%d')}.zip")
+        for file_path in attachments:
+            bundle.add(file_path)
+        if bundle.overflow:
+            writer = HtmlWriter()
+            writer.element('p', '以下文件超出附件大小限制，未放入附件：')
+            writer.raw('<ul>')
+            for file_path in bundle.overflow:
+                writer.element('li', file_path)
+            writer.raw('</ul>')
+            content = content.replace('</body>', writer.getvalue() + '</body>', 1) \
+                if '</body>' in content else content + writer.getvalue()
+
+    # 添加邮件正文
+    msg.attach(MIMEText(content, 'html', 'utf-8'))
+
+    # 添加附件
+    try:
+        if bundle is not None:
+            part = bundle.to_mime()
+            if part is not None:
+                msg.attach(part)
+    finally:
+        if own_bundle:
+            bundle.cleanup()
+    return msg
+
+
+def send_messages(messages, session=None):
+    """通过同一个 SMTP 连接发送多封邮件，返回成功发送的数量
+
+    单封邮件失败只记录日志，不影响其余邮件。
+    """
+    logger = logging.getLogger('email_sender')
+    own_session = session is None
+    session = session or SMTPSession()
+    sent = 0
+    try:
+        for msg in messages:
+            try:
+                session.send(msg)
+                sent += 1
+            except Exception as e:
+                logger.error(f"发送邮件失败: {msg['Subject']}: {str(e)}")
+                session.close()
+    finally:
+        if own_session:
+            session.close()
+    return sent
+
+
+def deliver(messages):
+    """把邮件写入发件箱，再在 drain_seconds 内尝试发送，返回入队数量
+
+    SMTP 服务器慢或不可用时不会丢失邮件，也不会让调用方长时间等待；
+    未发出的邮件由定时任务 python -m confluence.scripts.drain_outbox 按退避策略继续重试。
+    """
+    settings = outbox_settings()
+    with Outbox() as outbox:
+        count = outbox.enqueue(messages)
+        drain(outbox, deadline=time.time() + settings['drain_seconds'], settings=settings)
+    return count
+
+
+def send_update_email(subject, content, attachments=None, recipients=None, session=None):
+    """发送更新邮件：传入 session 时直接通过该 SMTP 连接发送，否则经发件箱投递"""
     logger = logging.getLogger('email_sender')
     try:
         logger.info(f"准备发送邮件: {subject}")
-        logger.info(f"收件人: {EMAIL_CONFIG['recipients']}")
-        
-        msg = MIMEMultipart()
-        msg['Subject'] = subject
-        msg['From'] = EMAIL_CONFIG['sender']
-        msg['To'] = ', '.join(EMAIL_CONFIG['recipients'])
-        
-        # 添加邮件正文
-        msg.attach(MIMEText(content, 'html'))
-        logger.info("已添加邮件正文")
-        
-        # 添加附件
-        if attachments:
-            for file_path in attachments:
-                if os.path.exists(file_path):
-                    with open(file_path, 'rb') as f:
-                        part = MIMEApplication(f.read())
-                        part.add_header('Content-Disposition', 'attachment', 
-                                      filename=os.path.basename(file_path))
-                        msg.attach(part)
-                    logger.info(f"已添加附件: {file_path}")
-                else:
-                    logger.warning(f"附件不存在: {file_path}")
-        
-        # 发送邮件
-        logger.info(f"连接SMTP服务器: {EMAIL_CONFIG['smtp_server']}:{EMAIL_CONFIG['smtp_port']}")
-        with smtplib.SMTP_SSL(EMAIL_CONFIG['smtp_server'], EMAIL_CONFIG['smtp_port']) as server:
-            server.login(EMAIL_CONFIG['username'], EMAIL_CONFIG['password'])
-            logger.info("SMTP登录成功")
-            server.send_message(msg)
-            logger.info("邮件发送成功")
-            
-        return True
+        logger.info(f"收件人: {recipients or EMAIL_CONFIG['recipients']}")
+        msg = build_message(subject, content, recipients, attachments)
+        if session is not None:
+            return send_messages([msg], session) == 1
+        return deliver([msg]) == 1
     except Exception as e:
         logger.error(f"发送邮件失败: {str(e)}")
         return False
 
-def format_update_content(updates):
-    """格式化更新内容为HTML"""
+
+def format_update_content(updates, title='Confluence文档更新通知'):
+    """格式化更新内容为按部门分组的HTML"""
     logger = logging.getLogger('email_sender')
     logger.info(f"格式化 {len(updates) if updates else 0} 条更新内容")
-    
+
     if not updates:
         logger.info("没有需要发送的更新内容")
         return None
-        
-    html = """
-    <html>
-    <head>
-        <style>
-            table {{border-collapse: collapse; width: 100%;}}
-            th, td {{border: 1px solid #ddd; padding: 8px; text-align: left;}}
-            th {{background-color: #f2f2f2;}}
-            tr:nth-child(even) {{background-color: #f9f9f9;}}
-        </style>
-    </head>
-    <body>
-        <h2>Confluence文档更新通知</h2>
-        <p>更新时间：{}</p>
-        <table>
-            <tr>
-                <th>标题</th>
-                <th>作者</th>
-                <th>部门</th>
-                <th>链接</th>
-                <th>更新时间</th>
-            </tr>
-    """.format(datetime.now().strftime('%Y-%m-%d %H:%M:%S'))
-    
-    for update in updates:
-        html += """
-            <tr>
-                <td>{}</td>
-                <td>{}</td>
-                <td>{}</td>
-                <td><a href="{}">查看</a></td>
-                <td>{}</td>
-            </tr>
-        """.format(
-            update['title'],
-            update['author'],
-            update['department'],
-            update['url'],
-            update['last_modified']
-        )
-    
-    html += """
-        </table>
-    </body>
-    </html>
-    """
+
+    html = render_digest(title, group_by_department(updates))
     logger.info("更新内容格式化完成")
     return html
 
+
+def digest_messages(updates, subject, title, index=None):
+    """按订阅索引生成一次运行要发送的全部邮件
+
+    recipients 收到按部门分组的全部更新，department_recipients 和 subscriptions 中的收件人
+    只收到订阅的部门和代码；内容相同的收件人合并为一封。邮件逐封生成，发送一封再渲染下一封。
+    EMAIL_CONFIG['attach_pdfs'] 为真时，各邮件涉及页面的PDF压缩为一个附件，超出大小预算的改为链接。
+    """
+    index = index or SubscriptionIndex.from_config()
+    groups = group_by_department(updates)
+    for recipients, selection in index.fan_out(groups):
+        if selection is not groups:
+            departments = list(selection)
+            label = '、'.join(departments[:3]) + ('等' if len(departments) > 3 else '')
+            message_subject, message_title = f"{subject} - {label}", f"{title} - {label}"
+        else:
+            message_subject, message_title = subject, title
+
+        if not EMAIL_CONFIG.get('attach_pdfs'):
+            yield build_message(message_subject, render_digest(message_title, selection), recipients)
+            continue
+
+        with AttachmentBundle(name=f"confluence_pdf_{datetime.now().strftime('%Y%m%d')}.zip") as bundle:
+            for department_updates in selection.values():
+                for update in department_updates:
+                    if update.get('pdf_link'):
+                        bundle.add(update['pdf_link'], fallback=update)
+            content = render_digest(message_title, selection,
+                                    footer=lambda writer: write_attachment_links(writer, bundle.overflow))
+            yield build_message(message_subject, content, recipients, bundle=bundle)
+
+
+def send_digest(updates, subject, title):
+    """渲染各收件人订阅的摘要并经发件箱投递"""
+    logger = logging.getLogger('email_sender')
+    logger.info(f"准备发送摘要邮件: {subject}，共 {len(updates)} 条更新")
+    count = deliver(digest_messages(updates, subject, title))
+    logger.info(f"摘要邮件已投递，共 {count} 封")
+    return count
+
+
 def send_hourly_update(updates):
     """发送每小时更新邮件"""
     logger = logging.getLogger('email_sender')
     if not updates:
         logger.info("没有每小时更新内容，跳过发送")
         return
-        
+
     subject = f"Confluence文档更新通知 - {datetime.now().strftime('%Y-%m-%d %H:%M')}"
-    content = format_update_content(updates)
-    if content:
-        send_update_email(subject, content)
-    else:
-        logger.info("没有格式化后的内容，跳过发送")
+    send_digest(updates, subject, 'Confluence文档更新通知')
+
 
 def send_daily_summary(updates):
     """发送每日汇总邮件"""
@@ -126,10 +223,6 @@ def send_daily_summary(updates):
     if not updates:
         logger.info("没有每日更新内容，跳过发送")
         return
-        
+
     subject = f"Confluence文档每日更新汇总 - {datetime.now().strftime('%Y-%m-%d')}"
-    content = format_update_content(updates)
-    if content:
-        send_update_email(subject, content)
-    else:
-        logger.info("没有格式化后的内容，跳过发送") 
\ No newline at end of file
+    send_digest(updates, subject, 'Confluence文档每日更新汇总')
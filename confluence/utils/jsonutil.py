@@ -0,0 +1,37 @@
+import json
+
+try:
+    import orjson
+except ImportError:  # 未安装 orjson 时使用标准库
+    orjson = None
+
+# orjson.JSONDecodeError 是 json.JSONDecodeError 的子类，两种后端都可以统一捕获
+JSONDecodeError = json.JSONDecodeError
+
+BACKEND = 'orjson' if orjson is not None else 'json'
+
+
+def loads(data):
+    """解析JSON，data 可以是 bytes 或 str；orjson 可直接解析响应字节，无需先解码为字符串"""
+    if orjson is not None:
+        return orjson.loads(data)
+    if isinstance(data, (bytes, bytearray, memoryview)):
+        data = bytes(data).decode('utf-8')
+    return json.loads(data)
+
+
+def dumps(obj):
+    """序列化为紧凑的 UTF-8 字节（保留中文，不缩进）"""
+    if orjson is not None:
+        return orjson.dumps(obj)
+    return json.dumps(obj, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+
+
+def load(f):
+    """从二进制文件读取JSON"""
+    return loads(f.read())
+
+
+def dump(obj, f):
+    """写入二进制文件"""
+    f.write(dumps(obj))
@@ -0,0 +1,205 @@
+import os
+import time
+import bisect
+import logging
+import threading
+from contextlib import contextmanager
+from datetime import datetime
+from . import jsonutil
+
+logger = logging.getLogger('metrics')
+
+# 延迟直方图的桶上界（秒）
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+
+
+def endpoint_class(url):
+    """按地址归类请求，用于分组统计"""
+    if 'naturalchildren.action' in url:
+        return 'naturalchildren'
+    if 'flyingpdf' in url or 'pdfpageexport' in url or 'exportpdf' in url.lower():
+        return 'pdf_export'
+    if '/rest/api/' in url:
+        return 'rest'
+    if 'viewpage.action' in url:
+        return 'viewpage'
+    return 'other'
+
+
+def _label_key(labels):
+    return tuple(sorted(labels.items()))
+
+
+def _format_labels(label_key, extra=None):
+    items = list(label_key) + (extra or [])
+    if not items:
+        return ''
+    return '{' + ','.join(f'{name}="{value}"' for name, value in items) + '}'
+
+
+class Histogram:
+    """固定分桶的直方图，分位数按桶内线性插值估算"""
+
+    __slots__ = ('buckets', 'counts', 'count', 'sum', 'max')
+
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+        if value > self.max:
+            self.max = value
+
+    def quantile(self, q):
+        if not self.count:
+            return 0.0
+        rank = q * self.count
+        seen = 0
+        for index, bucket_count in enumerate(self.counts):
+            if seen + bucket_count >= rank and bucket_count:
+                lower = self.buckets[index - 1] if index > 0 else 0.0
+                upper = min(self.buckets[index], self.max) if index < len(self.buckets) else self.max
+                return lower + (upper - lower) * (rank - seen) / bucket_count
+            seen += bucket_count
+        return self.max
+
+
+class MetricsRegistry:
+    """进程内的爬取指标：计数器、仪表值和延迟直方图
+
+    inc() 累加的是计数器；set() 直接写入的值（运行时长、从 Scrapy 统计复制的数值等）
+    不保证单调递增，单独保存并按 gauge 类型导出。
+
+    编排器在同一进程中运行两个爬虫，两者共享一个注册表，每个爬虫结束时把当前的全部指标
+    写入 Prometheus 文本文件（可供 node_exporter 的 textfile 采集器读取）和带时间戳的 JSON 文件。
+    """
+
+    def __init__(self):
+        self.started_at = datetime.now()
+        self._lock = threading.Lock()
+        self._counters = {}
+        self._gauges = {}
+        self._histograms = {}
+
+    def inc(self, name, value=1, **labels):
+        """计数器加 value"""
+        key = (name, _label_key(labels))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def set(self, name, value, **labels):
+        """设置仪表值（用于汇总其他组件自己统计的数值）"""
+        with self._lock:
+            self._gauges[(name, _label_key(labels))] = value
+
+    def observe(self, name, value, **labels):
+        """记录一次耗时（秒）"""
+        key = (name, _label_key(labels))
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = Histogram()
+            histogram.observe(value)
+
+    @contextmanager
+    def timer(self, name, **labels):
+        """统计代码块的耗时"""
+        start = time.monotonic()
+        try:
+            yield
+        finally:
+            self.observe(name, time.monotonic() - start, **labels)
+
+    def to_prometheus(self):
+        """Prometheus 文本格式"""
+        lines = []
+        with self._lock:
+            counters = sorted(self._counters.items())
+            gauges = sorted(self._gauges.items())
+            histograms = sorted(self._histograms.items(), key=lambda item: item[0])
+        typed = set()
+        for metric_type, values in (('counter', counters), ('gauge', gauges)):
+            for (name, label_key), value in values:
+                if name not in typed:
+                    lines.append(f"# TYPE confluence_{name} {metric_type}")
+                    typed.add(name)
+                lines.append(f"confluence_{name}{_format_labels(label_key)} {value}")
+        for (name, label_key), histogram in histograms:
+            if name not in typed:
+                lines.append(f"# TYPE confluence_{name} histogram")
+                typed.add(name)
+            cumulative = 0
+            for bucket, bucket_count in zip(histogram.buckets, histogram.counts):
+                cumulative += bucket_count
+                lines.append(f"confluence_{name}_bucket{_format_labels(label_key, [('le', bucket)])} {cumulative}")
+            lines.append(f"confluence_{name}_bucket{_format_labels(label_key, [('le', '+Inf')])} {histogram.count}")
+            lines.append(f"confluence_{name}_sum{_format_labels(label_key)} {histogram.sum:.6f}")
+            lines.append(f"confluence_{name}_count{_format_labels(label_key)} {histogram.count}")
+        return '\n'.join(lines) + '\n'
+
+    def to_dict(self):
+        """JSON 格式的汇总，直方图给出次数、总耗时和 p50/p95/p99"""
+        with self._lock:
+            counters = sorted(self._counters.items())
+            gauges = sorted(self._gauges.items())
+            histograms = sorted(self._histograms.items(), key=lambda item: item[0])
+        return {
+            'started_at': self.started_at.strftime('%Y-%m-%d %H:%M:%S'),
+            'written_at': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+            'counters': [
+                {'name': name, 'labels': dict(label_key), 'value': value}
+                for (name, label_key), value in counters
+            ],
+            'gauges': [
+                {'name': name, 'labels': dict(label_key), 'value': value}
+                for (name, label_key), value in gauges
+            ],
+            'histograms': [
+                {
+                    'name': name,
+                    'labels': dict(label_key),
+                    'count': histogram.count,
+                    'sum': round(histogram.sum, 6),
+                    'max': round(histogram.max, 6),
+                    'p50': round(histogram.quantile(0.5), 6),
+                    'p95': round(histogram.quantile(0.95), 6),
+                    'p99': round(histogram.quantile(0.99), 6)
+                }
+                for (name, label_key), histogram in histograms
+            ]
+        }
+
+    def write(self, directory):
+        """写入 crawl_metrics.prom 和本次运行的 JSON 文件，返回 JSON 文件路径"""
+        os.makedirs(directory, exist_ok=True)
+        prom_path = os.path.join(directory, 'crawl_metrics.prom')
+        temp_path = prom_path + '.tmp'
+        with open(temp_path, 'w', encoding='utf-8') as f:
+            f.write(self.to_prometheus())
+        os.replace(temp_path, prom_path)
+
+        json_path = os.path.join(
+            directory, f"crawl_metrics_{self.started_at.strftime('%Y%m%d_%H%M%S')}.json")
+        with open(json_path, 'wb') as f:
+            jsonutil.dump(self.to_dict(), f)
+        logger.info(f"指标已写入: {prom_path}, {json_path}")
+        return json_path
+
+
+_registry = None
+_registry_lock = threading.Lock()
+
+
+def get_registry():
+    """获取进程级共享的指标注册表"""
+    global _registry
+    with _registry_lock:
+        if _registry is None:
+            _registry = MetricsRegistry()
+        return _registry
@@ -0,0 +1,213 @@
+import os
+import time
+import email
+import fcntl
+import sqlite3
+import logging
+from email import policy
+from contextlib import contextmanager
+from confluence.config import DIRS, EMAIL_CONFIG
+
+logger = logging.getLogger('outbox')
+
+STATUS_PENDING = 'pending'
+STATUS_SENT = 'sent'
+STATUS_FAILED = 'failed'
+
+# 可在 EMAIL_CONFIG['outbox'] 中覆盖
+DEFAULT_SETTINGS = {
+    'batch_size': 20,            # 每批取出的邮件数，一批共用一个 SMTP 连接
+    'rate_per_minute': 30,       # 每分钟最多发送的邮件数，0 表示不限制
+    'max_attempts': 8,           # 超过后标记为 failed，不再重试
+    'backoff_base': 60,          # 第 n 次失败后等待 backoff_base * 2^(n-1) 秒再重试
+    'backoff_max': 3600,
+    'max_consecutive_failures': 3,  # 连续失败这么多次视为服务器不可用，结束本轮发送
+    'drain_seconds': 60,         # 爬取结束后进程内发送的时间上限，剩余邮件由定时任务发送
+    'keep_days': 30              # 已发送邮件保留的天数
+}
+
+
+def outbox_settings():
+    settings = dict(DEFAULT_SETTINGS)
+    settings.update(EMAIL_CONFIG.get('outbox', {}))
+    return settings
+
+
+class Outbox:
+    """SQLite 持久化发件箱
+
+    邮件以完整的 MIME 字节保存，入队只是一次本地写入，不依赖 SMTP 服务器是否可用；
+    发送失败的邮件按指数退避安排下次重试，直到成功或超过最大尝试次数。
+    多个进程（爬取进程和定时任务）可以同时入队，发送由文件锁保证同一时间只有一个进程在进行。
+    """
+
+    def __init__(self, path=None):
+        self.path = path or os.path.join(DIRS['records_dir'], 'email_outbox.sqlite3')
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        self.conn = sqlite3.connect(self.path, timeout=30)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS outbox (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                subject TEXT,
+                recipients TEXT,
+                payload BLOB NOT NULL,
+                status TEXT NOT NULL DEFAULT 'pending',
+                attempts INTEGER NOT NULL DEFAULT 0,
+                next_attempt REAL NOT NULL,
+                last_error TEXT,
+                created REAL NOT NULL,
+                sent_at REAL
+            )
+        """)
+        self.conn.execute("CREATE INDEX IF NOT EXISTS idx_outbox_due ON outbox (status, next_attempt)")
+        self.conn.commit()
+
+    def close(self):
+        self.conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def enqueue(self, messages):
+        """把邮件写入发件箱，返回入队数量"""
+        count = 0
+        with self.conn:
+            for msg in messages:
+                now = time.time()
+                self.conn.execute(
+                    "INSERT INTO outbox (subject, recipients, payload, status, next_attempt, created) "
+                    "VALUES (?, ?, ?, ?, ?, ?)",
+                    (msg['Subject'], msg['To'], msg.as_bytes(), STATUS_PENDING, now, now))
+                count += 1
+        logger.info(f"已加入发件箱: {count} 封邮件")
+        return count
+
+    def due(self, limit):
+        """到期待发送的邮件 [(id, 已尝试次数), ...]
+
+        只取ID和元数据，带附件的邮件可能有十几 MB，正文由 load() 在发送时逐封读取。
+        """
+        cursor = self.conn.execute(
+            "SELECT id, attempts FROM outbox WHERE status = ? AND next_attempt <= ? "
+            "ORDER BY id LIMIT ?", (STATUS_PENDING, time.time(), limit))
+        return cursor.fetchall()
+
+    def load(self, message_id):
+        """读取并解析一封邮件"""
+        row = self.conn.execute("SELECT payload FROM outbox WHERE id = ?", (message_id,)).fetchone()
+        return email.message_from_bytes(row[0], policy=policy.SMTP)
+
+    def mark_sent(self, message_id):
+        with self.conn:
+            self.conn.execute(
+                "UPDATE outbox SET status = ?, attempts = attempts + 1, sent_at = ?, last_error = NULL "
+                "WHERE id = ?", (STATUS_SENT, time.time(), message_id))
+
+    def mark_failed(self, message_id, attempts, error, settings):
+        """记录一次失败：未超过最大次数时按指数退避安排重试，否则标记为 failed"""
+        attempts += 1
+        if attempts >= settings['max_attempts']:
+            status, delay = STATUS_FAILED, 0
+            logger.error(f"邮件 {message_id} 已失败 {attempts} 次，不再重试: {error}")
+        else:
+            status = STATUS_PENDING
+            delay = min(settings['backoff_base'] * 2 ** (attempts - 1), settings['backoff_max'])
+            logger.warning(f"邮件 {message_id} 第 {attempts} 次发送失败，{delay} 秒后重试: {error}")
+        with self.conn:
+            self.conn.execute(
+                "UPDATE outbox SET status = ?, attempts = ?, next_attempt = ?, last_error = ? WHERE id = ?",
+                (status, attempts, time.time() + delay, str(error)[:500], message_id))
+
+    def retry_failed(self):
+        """把 failed 的邮件重新放回队列，返回数量"""
+        with self.conn:
+            cursor = self.conn.execute(
+                "UPDATE outbox SET status = ?, attempts = 0, next_attempt = ? WHERE status = ?",
+                (STATUS_PENDING, time.time(), STATUS_FAILED))
+        return cursor.rowcount
+
+    def purge(self, keep_days):
+        """删除超过保留期的已发送邮件"""
+        with self.conn:
+            cursor = self.conn.execute(
+                "DELETE FROM outbox WHERE status = ? AND sent_at < ?",
+                (STATUS_SENT, time.time() - keep_days * 86400))
+        return cursor.rowcount
+
+    def counts(self):
+        cursor = self.conn.execute("SELECT status, COUNT(*) FROM outbox GROUP BY status")
+        return dict(cursor.fetchall())
+
+    @contextmanager
+    def sender_lock(self):
+        """发送锁，已被其他进程持有时 yield False"""
+        with open(self.path + '.lock', 'w') as lock_file:
+            try:
+                fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except OSError:
+                yield False
+                return
+            try:
+                yield True
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+def drain(outbox, deadline=None, session_factory=None, settings=None):
+    """发送发件箱中到期的邮件，返回本轮统计 {'sent', 'failed', 'outbox': {状态: 数量}}
+
+    每批邮件共用一个 SMTP 连接，按 rate_per_minute 控制发送间隔；
+    连续失败 max_consecutive_failures 次或超过 deadline（time.time() 的值）时结束，剩余邮件留待下一轮。
+    """
+    from confluence.utils.email_sender import SMTPSession
+
+    settings = settings or outbox_settings()
+    session_factory = session_factory or SMTPSession
+    interval = 60.0 / settings['rate_per_minute'] if settings['rate_per_minute'] else 0
+    stats = {'sent': 0, 'failed': 0}
+
+    with outbox.sender_lock() as acquired:
+        if not acquired:
+            logger.info("另一个进程正在发送发件箱中的邮件，跳过")
+            return stats
+
+        consecutive_failures = 0
+        last_send = 0.0
+        while deadline is None or time.time() < deadline:
+            batch = outbox.due(settings['batch_size'])
+            if not batch:
+                break
+            with session_factory() as session:
+                for message_id, attempts in batch:
+                    if deadline is not None and time.time() >= deadline:
+                        break
+                    wait = last_send + interval - time.time()
+                    if wait > 0:
+                        time.sleep(wait)
+                    last_send = time.time()
+                    try:
+                        session.send(outbox.load(message_id))
+                    except Exception as e:
+                        outbox.mark_failed(message_id, attempts, e, settings)
+                        stats['failed'] += 1
+                        consecutive_failures += 1
+                        session.close()
+                        if consecutive_failures >= settings['max_consecutive_failures']:
+                            break
+                    else:
+                        outbox.mark_sent(message_id)
+                        stats['sent'] += 1
+                        consecutive_failures = 0
+            if consecutive_failures >= settings['max_consecutive_failures']:
+                logger.warning(f"连续 {consecutive_failures} 封邮件发送失败，结束本轮发送")
+                break
+
+    outbox.purge(settings['keep_days'])
+    stats['outbox'] = outbox.counts()
+    logger.info(f"发件箱本轮发送 {stats['sent']} 封，失败 {stats['failed']} 封，"
+                f"待发送 {stats['outbox'].get(STATUS_PENDING, 0)} 封")
+    return stats
@@ -0,0 +1,172 @@
+import os
+import logging
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+logger = logging.getLogger('page_frontier')
+
+
+class FrontierEntry:
+    """待展开子页面的页面"""
+
+    __slots__ = ('page_id', 'department', 'code', 'depth', 'parent_index', 'space')
+
+    def __init__(self, page_id, department, code, depth, parent_index=0, space=''):
+        self.page_id = str(page_id)
+        self.department = department
+        self.code = code
+        self.depth = depth
+        self.parent_index = parent_index
+        self.space = space or ''
+
+    def to_line(self):
+        return (
+            f"{self.page_id}\t{self.department}\t{self.code}\t{self.depth}\t"
+            f"{self.parent_index}\t{self.space}\n"
+        )
+
+    @classmethod
+    def from_line(cls, line):
+        parts = line.rstrip('\n').split('\t')
+        if len(parts) < 6:
+            return None
+        return cls(parts[0], parts[1], parts[2], int(parts[3]), int(parts[4]), parts[5])
+
+
+class PageFrontier:
+    """广度优先的页面展开队列
+
+    按先进先出顺序展开，即按层遍历；max_depth 限制展开深度（根页面深度为 0，
+    只展开深度小于 max_depth 的页面），
+    max_pages_per_space 限制每个空间最多展开的页面数，None 表示不限制。
+    内存中最多保留 max_in_memory 个待展开页面，超出部分溢写到 spool_path，
+    因此再宽的页面树也不会占用过多内存。
+    """
+
+    def __init__(self, max_depth=None, max_pages_per_space=None, max_in_memory=10000, spool_path=None):
+        self.max_depth = max_depth
+        self.max_pages_per_space = max_pages_per_space
+        self.max_in_memory = max_in_memory
+        self.spool_path = spool_path
+        self.pushed = 0
+        self.depth_limited = 0
+        self.breadth_limited = 0
+        self._memory = deque()
+        self._space_counts = {}
+        self._spool_pending = 0
+        self._spool_offset = 0
+
+        if self.spool_path and os.path.exists(self.spool_path):
+            os.remove(self.spool_path)
+
+    def __len__(self):
+        return len(self._memory) + self._spool_pending
+
+    def accepts(self, depth, space=''):
+        """该深度和空间的页面是否还允许展开"""
+        if self.max_depth is not None and depth >= self.max_depth:
+            return False
+        if self.max_pages_per_space is not None and \
+                self._space_counts.get(space, 0) >= self.max_pages_per_space:
+            return False
+        return True
+
+    def push(self, page_id, department, code, depth, parent_index=0, space=''):
+        """加入待展开页面，超出深度或空间宽度限制时返回 False"""
+        if self.max_depth is not None and depth >= self.max_depth:
+            self.depth_limited += 1
+            return False
+        space = space or ''
+        if self.max_pages_per_space is not None:
+            count = self._space_counts.get(space, 0)
+            if count >= self.max_pages_per_space:
+                self.breadth_limited += 1
+                return False
+            self._space_counts[space] = count + 1
+
+        entry = FrontierEntry(page_id, department, code, depth, parent_index, space)
+        self.pushed += 1
+        # 溢写文件中还有积压时必须继续写文件，保证先进先出
+        if self.spool_path and (self._spool_pending or len(self._memory) >= self.max_in_memory):
+            with open(self.spool_path, 'a', encoding='utf-8') as f:
+                f.write(entry.to_line())
+            self._spool_pending += 1
+        else:
+            self._memory.append(entry)
+        return True
+
+    def _refill(self):
+        """从溢写文件读回一批页面"""
+        if not self._spool_pending:
+            return
+        with open(self.spool_path, 'r', encoding='utf-8') as f:
+            f.seek(self._spool_offset)
+            while self._spool_pending and len(self._memory) < self.max_in_memory:
+                line = f.readline()
+                if not line:
+                    break
+                entry = FrontierEntry.from_line(line)
+                if entry is not None:
+                    self._memory.append(entry)
+                self._spool_pending -= 1
+            self._spool_offset = f.tell()
+
+    def pop(self):
+        """取出下一个待展开页面，队列为空时返回 None"""
+        if not self._memory:
+            self._refill()
+            if not self._memory:
+                return None
+        return self._memory.popleft()
+
+    def stats(self):
+        return (
+            f"入队 {self.pushed} 个，待展开 {len(self)} 个，"
+            f"超出深度 {self.depth_limited} 个，超出空间宽度 {self.breadth_limited} 个"
+        )
+
+    def cleanup(self):
+        """删除溢写文件"""
+        if self.spool_path and os.path.exists(self.spool_path):
+            os.remove(self.spool_path)
+
+
+def walk_frontier(frontier, expand, workers=8):
+    """用线程池并发展开 frontier 中的页面，直到队列为空
+
+    expand(entry) 返回子页面列表 [(page_id, space), ...]，子页面以 depth + 1 继续入队；
+    同一页面只展开一次。最多同时进行 workers 个展开，任何时候都只有 frontier
+    中的页面在排队，不会产生递归。
+    """
+    seen = set()
+    expanded = 0
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        pending = {}
+        while True:
+            while len(pending) < workers:
+                entry = frontier.pop()
+                if entry is None:
+                    break
+                key = int(entry.page_id)
+                if key in seen:
+                    continue
+                seen.add(key)
+                pending[executor.submit(expand, entry)] = entry
+            if not pending:
+                break
+
+            done, _ = wait(list(pending), return_when=FIRST_COMPLETED)
+            for future in done:
+                entry = pending.pop(future)
+                expanded += 1
+                try:
+                    children = future.result() or []
+                except Exception as e:
+                    logger.error(f"展开页面 {entry.page_id} 失败: {str(e)}")
+                    continue
+                for child_id, space in children:
+                    if int(child_id) not in seen:
+                        frontier.push(child_id, entry.department, entry.code,
+                                      entry.depth + 1, entry.parent_index, space)
+    logger.info(f"页面树遍历完成，共展开 {expanded} 个页面，{frontier.stats()}")
+    return expanded
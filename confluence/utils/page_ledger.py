@@ -0,0 +1,104 @@
+import os
+import mmap
+import logging
+from .page_registry import PageRegistry
+
+logger = logging.getLogger('page_ledger')
+
+
+class PageLedger:
+    """页面ID记录的追加式账本
+
+    快照文件（all_page_ids.txt）保持原有的 "page_id\\tdepartment\\tcode" 排序格式，
+    供其他流程直接读取；两次压缩之间新发现或移除的页面只追加到 .journal 日志文件，
+    每条记录以 "+" 或 "-" 开头。加载时内存映射快照并重放日志，压缩时重写快照并清空日志。
+    """
+
+    def __init__(self, snapshot_path, compact_threshold=5000):
+        self.snapshot_path = snapshot_path
+        self.journal_path = snapshot_path + '.journal'
+        self.compact_threshold = compact_threshold
+        self.journal_entries = 0
+        self._pending = []
+
+    @staticmethod
+    def _iter_mmap_lines(path):
+        """以内存映射方式逐行读取文件"""
+        if not os.path.exists(path) or os.path.getsize(path) == 0:
+            return
+        with open(path, 'rb') as f:
+            mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            try:
+                for line in iter(mm.readline, b''):
+                    line = line.rstrip(b'\r\n')
+                    if line:
+                        yield line.decode('utf-8')
+            finally:
+                mm.close()
+
+    def load(self):
+        """加载快照并重放日志，返回 PageRegistry"""
+        pages = PageRegistry()
+        for line in self._iter_mmap_lines(self.snapshot_path):
+            parts = line.split('\t')
+            if len(parts) >= 3:
+                pages.add(parts[0], parts[1], parts[2])
+
+        self.journal_entries = 0
+        for line in self._iter_mmap_lines(self.journal_path):
+            parts = line.split('\t')
+            if len(parts) < 4:
+                continue
+            if parts[0] == '+':
+                pages.add(parts[1], parts[2], parts[3])
+            elif parts[0] == '-':
+                pages.discard(parts[1])
+            self.journal_entries += 1
+
+        if self.journal_entries:
+            logger.info(f"已重放 {self.journal_entries} 条页面ID日志记录")
+        return pages
+
+    def load_ids(self):
+        """只加载页面ID（升序整数数组）"""
+        return self.load().ids()
+
+    def append(self, page_id, department, code):
+        """记录新发现的页面，O(1)，flush 时才写入磁盘"""
+        self._pending.append(f"+\t{page_id}\t{department}\t{code}\n")
+
+    def remove(self, page_id, department, code):
+        """记录被移除的页面"""
+        self._pending.append(f"-\t{page_id}\t{department}\t{code}\n")
+
+    def flush(self):
+        """将待写入的记录追加到日志文件"""
+        if not self._pending:
+            return 0
+        with open(self.journal_path, 'a', encoding='utf-8') as f:
+            f.writelines(self._pending)
+            f.flush()
+            os.fsync(f.fileno())
+        count = len(self._pending)
+        self.journal_entries += count
+        self._pending = []
+        return count
+
+    @property
+    def needs_compaction(self):
+        """日志记录数超过阈值时需要压缩"""
+        return self.journal_entries + len(self._pending) >= self.compact_threshold
+
+    def compact(self, pages):
+        """用当前完整的页面登记表重写快照，并清空日志"""
+        temp_path = self.snapshot_path + '.tmp'
+        with open(temp_path, 'w', encoding='utf-8') as f:
+            for page_id, department, code in pages.iter_sorted():
+                f.write(f"{page_id}\t{department}\t{code}\n")
+        os.replace(temp_path, self.snapshot_path)
+
+        self._pending = []
+        self.journal_entries = 0
+        if os.path.exists(self.journal_path):
+            os.remove(self.journal_path)
+        logger.info(f"页面ID快照已压缩，共 {len(pages)} 条记录")
@@ -0,0 +1,112 @@
+import os
+import logging
+from collections import deque
+
+logger = logging.getLogger('page_queue')
+
+
+class PageHandoffQueue:
+    """页面树爬虫到PDF爬虫的有界交接队列
+
+    内存中最多保留 maxsize 个待处理页面，超出的部分追加到本地溢写文件，
+    消费端取空内存队列后再按顺序从文件中读回，生产端永远不会被阻塞。
+    同一个页面ID只会入队一次，exclude 中的页面ID（如增量更新时的旧页面）直接忽略。
+    """
+
+    def __init__(self, maxsize=1000, spool_path=None, exclude=None):
+        self.maxsize = maxsize
+        self.spool_path = spool_path
+        self.exclude = exclude or set()
+        self.closed = False
+        self.put_count = 0
+        self._memory = deque()
+        self._seen = set()
+        self._spool_pending = 0
+        self._spool_offset = 0
+        self._listeners = []
+
+        if self.spool_path and os.path.exists(self.spool_path):
+            os.remove(self.spool_path)
+
+    def __len__(self):
+        """待消费的页面数（内存 + 溢写文件）"""
+        return len(self._memory) + self._spool_pending
+
+    def add_listener(self, callback):
+        """注册入队或关闭时的回调"""
+        self._listeners.append(callback)
+
+    def _notify(self):
+        for callback in self._listeners:
+            try:
+                callback()
+            except Exception as e:
+                logger.error(f"交接队列回调出错: {str(e)}")
+
+    def put(self, page_id, department, code):
+        """放入一个新发现的页面，重复或被排除的页面返回 False"""
+        if self.closed:
+            return False
+        key = int(page_id)
+        if key in self._seen or key in self.exclude:
+            return False
+        self._seen.add(key)
+        self.put_count += 1
+
+        # 溢写文件中还有积压时必须继续写文件，保证先进先出
+        if len(self._memory) < self.maxsize and not self._spool_pending:
+            self._memory.append((str(page_id), department, code))
+        elif self.spool_path:
+            with open(self.spool_path, 'a', encoding='utf-8') as f:
+                f.write(f"{page_id}\t{department}\t{code}\n")
+            self._spool_pending += 1
+        else:
+            self._memory.append((str(page_id), department, code))
+
+        self._notify()
+        return True
+
+    def _refill(self):
+        """从溢写文件读回一批页面"""
+        if not self._spool_pending:
+            return
+        with open(self.spool_path, 'r', encoding='utf-8') as f:
+            f.seek(self._spool_offset)
+            while self._spool_pending and len(self._memory) < self.maxsize:
+                line = f.readline()
+                if not line:
+                    break
+                parts = line.rstrip('\n').split('\t')
+                if len(parts) >= 3:
+                    self._memory.append((parts[0], parts[1], parts[2]))
+                self._spool_pending -= 1
+            self._spool_offset = f.tell()
+
+    def get_batch(self, limit):
+        """取出最多 limit 个待处理页面"""
+        batch = []
+        while len(batch) < limit:
+            if not self._memory:
+                self._refill()
+                if not self._memory:
+                    break
+            batch.append(self._memory.popleft())
+        return batch
+
+    @property
+    def drained(self):
+        """生产端已关闭且所有页面都已被取走"""
+        return self.closed and not len(self)
+
+    def close(self):
+        """生产端结束，不再接收新页面"""
+        if self.closed:
+            return
+        self.closed = True
+        logger.info(f"交接队列已关闭，共入队 {self.put_count} 个页面，待处理 {len(self)} 个")
+        self._notify()
+
+    def cleanup(self):
+        """删除溢写文件"""
+        if self.spool_path and os.path.exists(self.spool_path):
+            os.remove(self.spool_path)
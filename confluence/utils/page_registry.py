@@ -0,0 +1,121 @@
+from array import array
+
+
+class PageRecord:
+    """单个页面的记录，可以像 (page_id, department, code) 元组一样解包"""
+
+    __slots__ = ('page_id', 'department', 'code')
+
+    def __init__(self, page_id, department, code):
+        self.page_id = page_id
+        self.department = department
+        self.code = code
+
+    def __iter__(self):
+        yield str(self.page_id)
+        yield self.department
+        yield self.code
+
+    def __repr__(self):
+        return f"PageRecord({self.page_id}, {self.department!r}, {self.code!r})"
+
+
+class PageRegistry:
+    """紧凑的页面登记表
+
+    页面ID以整数为键，部门和代码字符串各自驻留在小表中，每个页面只保存一个整数标签
+    （部门序号 << 16 | 代码序号），避免每条记录重复保存部门字符串。
+    迭代时仍然产出 (page_id, department, code) 字符串元组，兼容原有的集合用法。
+    一个页面ID只对应一条记录，重复添加时以最后一次为准。
+    """
+
+    CODE_BITS = 16
+    CODE_MASK = (1 << CODE_BITS) - 1
+
+    def __init__(self, pages=None):
+        self._tags = {}
+        self._departments = []
+        self._department_index = {}
+        self._codes = []
+        self._code_index = {}
+        if pages:
+            for page_id, department, code in pages:
+                self.add(page_id, department, code)
+
+    @staticmethod
+    def _intern(value, table, index):
+        """把字符串驻留到表中，返回序号"""
+        position = index.get(value)
+        if position is None:
+            position = len(table)
+            table.append(value)
+            index[value] = position
+        return position
+
+    def _tag(self, department, code):
+        department_idx = self._intern(department, self._departments, self._department_index)
+        code_idx = self._intern(code, self._codes, self._code_index)
+        return (department_idx << self.CODE_BITS) | code_idx
+
+    def _untag(self, tag):
+        return self._departments[tag >> self.CODE_BITS], self._codes[tag & self.CODE_MASK]
+
+    def add(self, page_id, department, code):
+        """添加或更新页面，新增或部门/代码发生变化时返回 True"""
+        key = int(page_id)
+        tag = self._tag(department, code)
+        if self._tags.get(key) == tag:
+            return False
+        self._tags[key] = tag
+        return True
+
+    def discard(self, page_id):
+        """移除页面，存在时返回 True"""
+        return self._tags.pop(int(page_id), None) is not None
+
+    def get(self, page_id):
+        """获取页面记录，不存在时返回 None"""
+        key = int(page_id)
+        tag = self._tags.get(key)
+        if tag is None:
+            return None
+        department, code = self._untag(tag)
+        return PageRecord(key, department, code)
+
+    def __contains__(self, item):
+        """支持按页面ID或 (page_id, department, code) 元组判断"""
+        if isinstance(item, tuple):
+            tag = self._tags.get(int(item[0]))
+            return tag is not None and self._untag(tag) == (item[1], item[2])
+        return int(item) in self._tags
+
+    def __len__(self):
+        return len(self._tags)
+
+    def __iter__(self):
+        for key, tag in self._tags.items():
+            department, code = self._untag(tag)
+            yield (str(key), department, code)
+
+    def iter_sorted(self):
+        """按页面ID升序迭代"""
+        for key in sorted(self._tags):
+            department, code = self._untag(self._tags[key])
+            yield (str(key), department, code)
+
+    def id_view(self):
+        """页面ID的集合视图，可直接做集合运算而无需复制"""
+        return self._tags.keys()
+
+    def ids(self):
+        """升序排列的页面ID数组"""
+        return array('q', sorted(self._tags))
+
+    def difference(self, other):
+        """本登记表中有而 other 中没有的页面ID（升序数组）"""
+        other_ids = other.id_view() if isinstance(other, PageRegistry) else other
+        return array('q', sorted(self._tags.keys() - other_ids))
+
+    def departments(self):
+        """已驻留的部门列表"""
+        return list(self._departments)
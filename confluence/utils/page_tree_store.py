@@ -0,0 +1,198 @@
+import os
+import logging
+from collections import deque
+
+logger = logging.getLogger('page_tree_store')
+
+ROOT_PARENT = 0
+
+
+class TreeNode:
+    """页面树中的一个节点"""
+
+    __slots__ = ('parent_id', 'position', 'depth', 'child_count', 'version')
+
+    def __init__(self, parent_id, position, depth, child_count=-1, version=-1):
+        self.parent_id = parent_id
+        self.position = position
+        self.depth = depth
+        # -1 表示尚未获取
+        self.child_count = child_count
+        self.version = version
+
+
+class PageTreeStore:
+    """持久化的页面树结构（父子关系、位置、深度）
+
+    文件格式为每行 "page_id\\tparent_id\\tposition\\tdepth\\tchild_count\\tversion"，
+    父页面ID为 0 表示根页面。内存中维护父页面到子页面的索引，用于按祖先查询子树、
+    整体移动或删除子树。
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.nodes = {}
+        self._children = {}
+        self.dirty = False
+
+    def load(self):
+        """从文件加载页面树"""
+        self.nodes = {}
+        self._children = {}
+        if not os.path.exists(self.path):
+            return self
+        with open(self.path, 'r', encoding='utf-8') as f:
+            for line in f:
+                parts = line.rstrip('\n').split('\t')
+                if len(parts) < 6:
+                    continue
+                page_id, parent_id, position, depth, child_count, version = map(int, parts[:6])
+                self._attach(page_id, TreeNode(parent_id, position, depth, child_count, version))
+        self.dirty = False
+        logger.info(f"已加载页面树结构，共 {len(self.nodes)} 个节点")
+        return self
+
+    def save(self):
+        """写回文件（先写临时文件再替换）"""
+        if not self.dirty:
+            return
+        temp_path = self.path + '.tmp'
+        with open(temp_path, 'w', encoding='utf-8') as f:
+            for page_id in sorted(self.nodes):
+                node = self.nodes[page_id]
+                f.write(
+                    f"{page_id}\t{node.parent_id}\t{node.position}\t{node.depth}\t"
+                    f"{node.child_count}\t{node.version}\n"
+                )
+        os.replace(temp_path, self.path)
+        self.dirty = False
+        logger.info(f"已保存页面树结构，共 {len(self.nodes)} 个节点")
+
+    def _attach(self, page_id, node):
+        self.nodes[page_id] = node
+        self._children.setdefault(node.parent_id, set()).add(page_id)
+
+    def _detach(self, page_id):
+        node = self.nodes.pop(page_id, None)
+        if node is not None:
+            siblings = self._children.get(node.parent_id)
+            if siblings is not None:
+                siblings.discard(page_id)
+                if not siblings:
+                    del self._children[node.parent_id]
+        return node
+
+    def get(self, page_id):
+        return self.nodes.get(int(page_id))
+
+    def __contains__(self, page_id):
+        return int(page_id) in self.nodes
+
+    def __len__(self):
+        return len(self.nodes)
+
+    def set_root(self, page_id):
+        """登记一个根页面"""
+        page_id = int(page_id)
+        node = self.nodes.get(page_id)
+        if node is None:
+            self._attach(page_id, TreeNode(ROOT_PARENT, 0, 0))
+            self.dirty = True
+        elif node.parent_id != ROOT_PARENT:
+            self.move_subtree(page_id, ROOT_PARENT, 0)
+
+    def record_children(self, parent_id, children):
+        """记录一次子页面列表的结果
+
+        children 为 [(page_id, position, version), ...]，version 未知时传 -1。
+        不在新列表中的旧子页面会从树中摘除，其后代暂时成为孤儿，
+        等待该页面在别处重新出现（自动重新挂接）或在清理时删除。
+        """
+        parent_id = int(parent_id)
+        parent = self.nodes.get(parent_id)
+        depth = parent.depth + 1 if parent is not None else 1
+
+        current = set()
+        for page_id, position, version in children:
+            page_id = int(page_id)
+            current.add(page_id)
+            node = self.nodes.get(page_id)
+            if node is None:
+                self._attach(page_id, TreeNode(parent_id, position, depth, version=version))
+            else:
+                if node.parent_id != parent_id:
+                    self.move_subtree(page_id, parent_id, position)
+                    node = self.nodes[page_id]
+                node.position = position
+                if version != -1:
+                    node.version = version
+
+        for stale_id in self._children.get(parent_id, set()) - current:
+            self._detach(stale_id)
+
+        if parent is not None:
+            parent.child_count = len(current)
+        self.dirty = True
+
+    def children(self, page_id):
+        """按位置排序的直接子页面ID"""
+        child_ids = self._children.get(int(page_id), ())
+        return sorted(child_ids, key=lambda child_id: self.nodes[child_id].position)
+
+    def descendants(self, page_id):
+        """子树中所有后代页面ID（广度优先，不含自身）"""
+        result = []
+        queue = deque([int(page_id)])
+        while queue:
+            current = queue.popleft()
+            for child_id in self._children.get(current, ()):
+                result.append(child_id)
+                queue.append(child_id)
+        return result
+
+    def ancestors(self, page_id):
+        """从父页面到根页面的祖先链"""
+        result = []
+        node = self.nodes.get(int(page_id))
+        while node is not None and node.parent_id != ROOT_PARENT:
+            result.append(node.parent_id)
+            node = self.nodes.get(node.parent_id)
+        return result
+
+    def move_subtree(self, page_id, new_parent_id, position):
+        """把整个子树移动到新的父页面下，并更新深度"""
+        page_id = int(page_id)
+        new_parent_id = int(new_parent_id)
+        node = self._detach(page_id)
+        if node is None:
+            return
+        new_parent = self.nodes.get(new_parent_id)
+        new_depth = new_parent.depth + 1 if new_parent is not None else 0
+        delta = new_depth - node.depth
+        node.parent_id = new_parent_id
+        node.position = position
+        node.depth = new_depth
+        self._attach(page_id, node)
+        if delta:
+            for descendant_id in self.descendants(page_id):
+                self.nodes[descendant_id].depth += delta
+        self.dirty = True
+
+    def remove_subtree(self, page_id):
+        """删除整个子树，返回被删除的页面ID列表（含自身）"""
+        page_id = int(page_id)
+        if page_id not in self.nodes:
+            return []
+        removed = [page_id] + self.descendants(page_id)
+        for removed_id in reversed(removed):
+            self._detach(removed_id)
+            self._children.pop(removed_id, None)
+        self.dirty = True
+        return removed
+
+    def orphans(self):
+        """父页面已不在树中的非根节点（通常是被删除或移出的子树）"""
+        return [
+            page_id for page_id, node in self.nodes.items()
+            if node.parent_id != ROOT_PARENT and node.parent_id not in self.nodes
+        ]
@@ -0,0 +1,107 @@
+import os
+import logging
+from contextlib import contextmanager
+from confluence.config import DIRS
+from confluence.utils.tracing import get_run_id
+
+logger = logging.getLogger('profiling')
+
+# 取值: cprofile（确定性分析）、pyinstrument（采样分析），为空或 0 表示不分析
+PROFILE_ENV = 'CONFLUENCE_PROFILE'
+PROFILE_MODES = ('cprofile', 'pyinstrument')
+
+
+def profiling_mode():
+    """从环境变量读取分析模式，未启用时返回 None"""
+    mode = os.environ.get(PROFILE_ENV, '').strip().lower()
+    if mode in ('', '0', 'false', 'no', 'off'):
+        return None
+    if mode in ('1', 'true', 'yes', 'on'):
+        return 'cprofile'
+    if mode not in PROFILE_MODES:
+        logger.warning(f"未知的分析模式 {mode}，改用 cprofile")
+        return 'cprofile'
+    return mode
+
+
+def output_prefix(name):
+    """分析结果的文件名前缀：logs/profiles/<name>_<运行ID>"""
+    directory = os.path.join(DIRS['logs_dir'], 'profiles')
+    os.makedirs(directory, exist_ok=True)
+    return os.path.join(directory, f"{name}_{get_run_id()}")
+
+
+def _write_cprofile(profiler, prefix, top):
+    import pstats
+    profiler.dump_stats(prefix + '.prof')
+    with open(prefix + '.txt', 'w', encoding='utf-8') as f:
+        stats = pstats.Stats(profiler, stream=f).strip_dirs()
+        f.write(f"按自身耗时排序的前 {top} 个函数\n")
+        stats.sort_stats('tottime').print_stats(top)
+        f.write(f"\n按累计耗时排序的前 {top} 个函数\n")
+        stats.sort_stats('cumulative').print_stats(top)
+    return [prefix + '.prof', prefix + '.txt']
+
+
+def _write_pyinstrument(profiler, prefix):
+    paths = []
+    with open(prefix + '.txt', 'w', encoding='utf-8') as f:
+        f.write(profiler.output_text(unicode=True, color=False))
+    paths.append(prefix + '.txt')
+    with open(prefix + '.html', 'w', encoding='utf-8') as f:
+        f.write(profiler.output_html())
+    paths.append(prefix + '.html')
+    try:
+        from pyinstrument.renderers import SpeedscopeRenderer
+    except ImportError:  # 旧版本 pyinstrument 没有 speedscope 输出
+        return paths
+    with open(prefix + '.speedscope.json', 'w', encoding='utf-8') as f:
+        f.write(profiler.output(renderer=SpeedscopeRenderer()))
+    paths.append(prefix + '.speedscope.json')
+    return paths
+
+
+@contextmanager
+def profile_run(name, mode=None, top=40):
+    """在分析器中运行代码块，结果写入 logs/profiles
+
+    mode 为空时读取环境变量 CONFLUENCE_PROFILE；未启用时只做一次判断，不导入任何分析器。
+    cprofile 输出 .prof（可用 snakeviz、flameprof 生成火焰图）和热点函数列表 .txt；
+    pyinstrument 输出调用树 .txt、.html 和 speedscope 格式的 .speedscope.json。
+    分析器只覆盖调用线程（reactor 所在的主线程），线程池中的工作不计入。
+    """
+    mode = mode or profiling_mode()
+    if mode is None:
+        yield
+        return
+
+    if mode == 'pyinstrument':
+        try:
+            from pyinstrument import Profiler
+        except ImportError:
+            logger.warning("未安装 pyinstrument，改用 cProfile")
+            mode = 'cprofile'
+
+    if mode == 'pyinstrument':
+        profiler = Profiler(interval=0.001)
+        start, stop = profiler.start, profiler.stop
+    else:
+        import cProfile
+        profiler = cProfile.Profile()
+        start, stop = profiler.enable, profiler.disable
+
+    logger.info(f"性能分析已启用（{mode}）: {name}")
+    start()
+    try:
+        yield
+    finally:
+        stop()
+        prefix = output_prefix(name)
+        try:
+            if mode == 'pyinstrument':
+                paths = _write_pyinstrument(profiler, prefix)
+            else:
+                paths = _write_cprofile(profiler, prefix, top)
+            logger.info(f"性能分析结果已写入: {', '.join(paths)}")
+        except Exception as e:
+            logger.error(f"写入性能分析结果失败: {str(e)}")
@@ -0,0 +1,136 @@
+import os
+import pickle
+import logging
+import requests
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from confluence.config import CONFLUENCE_CONFIG
+from confluence.utils import jsonutil
+
+logger = logging.getLogger('rest_client')
+
+COOKIES_PATH = os.path.join("confluence", "cookies.pkl")
+
+DEFAULT_HEADERS = {
+    'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36',
+    'Accept': 'application/json',
+    'Accept-Language': 'zh-CN,zh;q=0.9,en;q=0.8',
+    'Connection': 'keep-alive'
+}
+
+# 批量查询结果；未返回的页面 status 为 'missing'（不存在或无权限），version 为 -1
+PageStatus = namedtuple('PageStatus', ['page_id', 'version', 'status'])
+
+
+def load_cookies(path=COOKIES_PATH):
+    """读取 selenium_login 保存的cookies列表"""
+    if not os.path.exists(path):
+        return None
+    with open(path, "rb") as f:
+        return pickle.load(f)
+
+
+class ConfluenceRestClient:
+    """共享连接池的 Confluence REST 客户端
+
+    一个 requests.Session 在多个线程间复用，连接池大小与并发数一致，
+    避免每个请求重新建立 TCP/TLS 连接。可重试的服务端错误由 urllib3 自动退避重试。
+    """
+
+    def __init__(self, base_url=None, cookies=None, pool_size=32, timeout=(5, 30), retries=2):
+        self.base_url = (base_url or CONFLUENCE_CONFIG['base_url']).rstrip('/')
+        self.timeout = timeout
+        self.session = requests.Session()
+        self.session.headers.update(DEFAULT_HEADERS)
+
+        retry = Retry(
+            total=retries,
+            backoff_factor=0.5,
+            status_forcelist=(429, 502, 503, 504),
+            allowed_methods=frozenset(['GET', 'HEAD'])
+        )
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=retry)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+
+        self.set_cookies(cookies if cookies is not None else load_cookies())
+
+    def set_cookies(self, cookies):
+        """设置cookies，支持 selenium 的cookie列表或 {name: value} 字典"""
+        self.session.cookies.clear()
+        if not cookies:
+            return
+        if isinstance(cookies, dict):
+            cookies = [{'name': name, 'value': value} for name, value in cookies.items()]
+        for cookie in cookies:
+            self.session.cookies.set(cookie['name'], cookie['value'], path=cookie.get('path', '/'))
+
+    def url(self, path):
+        return f"{self.base_url}{path}"
+
+    def get(self, path, **kwargs):
+        """发送GET请求，path 为以 / 开头的相对路径"""
+        kwargs.setdefault('timeout', self.timeout)
+        return self.session.get(self.url(path), **kwargs)
+
+    def get_content(self, page_id, expand=None):
+        """获取页面内容（/rest/api/content/{id}），返回原始响应"""
+        params = {'expand': expand} if expand else None
+        return self.get(f"/rest/api/content/{page_id}", params=params, allow_redirects=False)
+
+    def search(self, cql, expand=None, limit=100):
+        """CQL 内容搜索，按 start/limit 翻页逐条产出结果
+
+        服务器会限制每页的实际条数，返回条数少于 limit 不代表已取完，只以 _links.next 判断是否还有下一页。
+        """
+        start = 0
+        while True:
+            params = {'cql': cql, 'start': start, 'limit': limit}
+            if expand:
+                params['expand'] = expand
+            response = self.get('/rest/api/content/search', params=params)
+            response.raise_for_status()
+            data = jsonutil.loads(response.content)
+            results = data.get('results', [])
+            for result in results:
+                yield result
+            if not results or not (data.get('_links') or {}).get('next'):
+                break
+            start += len(results)
+
+    def _lookup_chunk(self, page_ids, page_size):
+        """用一条 CQL 查询一组页面"""
+        found = {}
+        cql = f"id in ({','.join(str(page_id) for page_id in page_ids)})"
+        for result in self.search(cql, expand='version', limit=page_size):
+            page_id = int(result['id'])
+            version = (result.get('version') or {}).get('number', -1)
+            found[page_id] = PageStatus(page_id, version, result.get('status', 'current'))
+        return found
+
+    def batch_lookup(self, page_ids, batch_size=100, page_size=100, concurrency=4):
+        """批量查询页面是否存在及其版本
+
+        每 batch_size 个ID合并为一条 CQL "id in (...)" 查询，多个查询并发执行。
+        返回 {page_id: PageStatus}，结果中没有的页面标记为 missing。
+        请求失败时抛出 requests.RequestException，调用方不应把失败当作页面不存在。
+        """
+        page_ids = sorted({int(page_id) for page_id in page_ids})
+        chunks = [page_ids[i:i + batch_size] for i in range(0, len(page_ids), batch_size)]
+        statuses = {page_id: PageStatus(page_id, -1, 'missing') for page_id in page_ids}
+        if not chunks:
+            return statuses
+
+        with ThreadPoolExecutor(max_workers=max(1, min(concurrency, len(chunks)))) as executor:
+            for found in executor.map(lambda chunk: self._lookup_chunk(chunk, page_size), chunks):
+                statuses.update(found)
+        logger.info(
+            f"批量查询 {len(page_ids)} 个页面，共 {len(chunks)} 次查询，"
+            f"存在 {sum(1 for status in statuses.values() if status.status != 'missing')} 个"
+        )
+        return statuses
+
+    def close(self):
+        self.session.close()
@@ -0,0 +1,90 @@
+from collections import OrderedDict, defaultdict
+from confluence.config import EMAIL_CONFIG
+
+# 订阅全部部门的通配符
+ALL_DEPARTMENTS = '*'
+
+
+class SubscriptionIndex:
+    """收件人 → 部门/代码 的订阅索引
+
+    内部保存反向索引（部门 → 收件人、代码 → 收件人），分发时只需按部门遍历一次已分组的更新，
+    每个收件人得到的内容只包含其订阅的部门和代码，而不是全部更新。
+    """
+
+    def __init__(self):
+        self.by_department = defaultdict(set)
+        self.by_code = defaultdict(set)
+        self.everything = set()
+        self.departments_of = defaultdict(set)
+
+    @classmethod
+    def from_config(cls, config=None):
+        """从邮件配置构建索引
+
+        - recipients:             收到全部部门的汇总
+        - department_recipients:  {部门: [邮箱, ...]}
+        - subscriptions:          {邮箱: {'departments': [...], 'codes': [...]}}，部门为 '*' 表示全部
+        """
+        config = config or EMAIL_CONFIG
+        index = cls()
+        for recipient in config.get('recipients', ()):
+            index.subscribe(recipient, departments=[ALL_DEPARTMENTS])
+        for department, recipients in config.get('department_recipients', {}).items():
+            for recipient in recipients:
+                index.subscribe(recipient, departments=[department])
+        for recipient, subscription in config.get('subscriptions', {}).items():
+            index.subscribe(recipient, subscription.get('departments', ()), subscription.get('codes', ()))
+        return index
+
+    def subscribe(self, recipient, departments=(), codes=()):
+        for department in departments:
+            if department == ALL_DEPARTMENTS:
+                self.everything.add(recipient)
+            else:
+                self.by_department[department].add(recipient)
+                self.departments_of[recipient].add(department)
+        for code in codes:
+            self.by_code[code].add(recipient)
+
+    def recipients(self):
+        result = set(self.everything).union(self.departments_of)
+        for recipients in self.by_code.values():
+            result.update(recipients)
+        return result
+
+    def __len__(self):
+        return len(self.recipients())
+
+    def fan_out(self, groups):
+        """把按部门分组的更新分发给订阅者
+
+        groups 为 {部门: [更新, ...]}，返回 [(收件人列表, {部门: [更新, ...]}), ...]。
+        订阅全部部门的收件人合并为第一封，其余内容完全相同的收件人也合并为一封，每份内容只渲染一次。
+        """
+        selections = defaultdict(OrderedDict)
+        for department, updates in groups.items():
+            for recipient in self.by_department.get(department, ()):
+                if recipient not in self.everything:
+                    selections[recipient][department] = updates
+            if not self.by_code:
+                continue
+            for update in updates:
+                for recipient in self.by_code.get(update.get('code'), ()):
+                    if recipient in self.everything or department in self.departments_of[recipient]:
+                        continue
+                    selections[recipient].setdefault(department, []).append(update)
+
+        merged = OrderedDict()
+        for recipient in sorted(selections):
+            selection = selections[recipient]
+            key = tuple((department, tuple(update.get('page_id') for update in updates))
+                        for department, updates in selection.items())
+            merged.setdefault(key, (selection, []))[1].append(recipient)
+
+        result = []
+        if self.everything and groups:
+            result.append((sorted(self.everything), groups))
+        for selection, recipients in merged.values():
+            result.append((recipients, selection))
+        return result
@@ -0,0 +1,133 @@
+import os
+import time
+import uuid
+import atexit
+import logging
+import threading
+from contextlib import contextmanager
+from datetime import datetime
+from confluence.config import DIRS
+from confluence.utils import jsonutil
+
+logger = logging.getLogger('tracing')
+
+# 运行ID通过环境变量传递，shell 脚本和它启动的 Python 进程使用同一个ID
+RUN_ID_ENV = 'CONFLUENCE_RUN_ID'
+
+_run_id = None
+_run_id_lock = threading.Lock()
+
+
+def get_run_id():
+    """本次运行的ID，优先使用环境变量中的值，否则生成并写回环境变量"""
+    global _run_id
+    with _run_id_lock:
+        if _run_id is None:
+            _run_id = os.environ.get(RUN_ID_ENV) or \
+                f"{datetime.now().strftime('%Y%m%d%H%M%S')}-{uuid.uuid4().hex[:6]}"
+            os.environ[RUN_ID_ENV] = _run_id
+        return _run_id
+
+
+def install_log_run_id():
+    """给每条日志记录加上 run_id 属性，日志格式中可以使用 %(run_id)s"""
+    factory = logging.getLogRecordFactory()
+    if getattr(factory, 'adds_run_id', False):
+        return
+
+    def record_factory(*args, **kwargs):
+        record = factory(*args, **kwargs)
+        record.run_id = get_run_id()
+        return record
+
+    record_factory.adds_run_id = True
+    logging.setLogRecordFactory(record_factory)
+
+
+# 导入本模块即生效，保证使用 %(run_id)s 的日志格式在任何入口下都可用
+install_log_run_id()
+
+
+class Tracer:
+    """把 span 以 JSON Lines 追加到 logs/traces/trace_<run_id>.jsonl
+
+    每个 span 记录运行ID、名称、页面ID、开始时间（epoch 秒）、耗时（毫秒）、状态和附加属性。
+    写入先进入缓冲区，攒够 buffer_size 条或 flush/close 时落盘，可在多个线程中使用。
+    """
+
+    def __init__(self, path, run_id, buffer_size=200):
+        self.path = path
+        self.run_id = run_id
+        self.buffer_size = buffer_size
+        self._buffer = []
+        self._lock = threading.Lock()
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+
+    def emit(self, name, start=None, page_id=None, status='ok', end=None, **attrs):
+        """记录一个 span；start/end 为 time.time() 的值，end 为空表示到当前为止"""
+        end = end if end is not None else time.time()
+        start = start if start is not None else end
+        record = {
+            'run_id': self.run_id,
+            'name': name,
+            'page_id': str(page_id) if page_id is not None else None,
+            'start': round(start, 3),
+            'duration_ms': round((end - start) * 1000, 1),
+            'status': status
+        }
+        record.update(attrs)
+        line = jsonutil.dumps(record) + b'\n'
+        with self._lock:
+            self._buffer.append(line)
+            if len(self._buffer) >= self.buffer_size:
+                self._flush_locked()
+
+    @contextmanager
+    def span(self, name, page_id=None, **attrs):
+        """统计代码块的 span，块内可以往 yield 出的字典中补充属性"""
+        start = time.time()
+        status = 'ok'
+        try:
+            yield attrs
+        except Exception as e:
+            status = 'error'
+            attrs.setdefault('error', str(e)[:200])
+            raise
+        finally:
+            self.emit(name, start, page_id, status, **attrs)
+
+    def _flush_locked(self):
+        if not self._buffer:
+            return
+        try:
+            with open(self.path, 'ab') as f:
+                f.writelines(self._buffer)
+        except OSError as e:
+            logger.error(f"写入追踪文件失败: {str(e)}")
+        self._buffer = []
+
+    def flush(self):
+        with self._lock:
+            self._flush_locked()
+
+
+_tracer = None
+_tracer_lock = threading.Lock()
+
+
+def get_tracer():
+    """获取进程级共享的 Tracer，进程退出时自动落盘"""
+    global _tracer
+    with _tracer_lock:
+        if _tracer is None:
+            run_id = get_run_id()
+            _tracer = Tracer(os.path.join(DIRS['logs_dir'], 'traces', f"trace_{run_id}.jsonl"), run_id)
+            atexit.register(_tracer.flush)
+        return _tracer
+
+
+def close_tracer():
+    """写出缓冲区中剩余的 span"""
+    with _tracer_lock:
+        if _tracer is not None:
+            _tracer.flush()
@@ -0,0 +1,118 @@
+import logging
+from collections import Counter
+from datetime import datetime
+import pymysql
+from confluence.utils.db import get_pool
+
+logger = logging.getLogger('update_summary')
+
+# 汇总表记录的是更新事件：页面每次更新按当时的 (小时, 部门) 加一，之后再次更新不会从原来的小时扣除。
+# 因此某个小时的计数是当前 last_modified 落在该小时的页面数的上界，只用于判断时间段内是否有更新，
+# 报表中的页面列表和数量以页面表的范围查询为准
+SUMMARY_TABLE = 'confluence_update_summary'
+
+CREATE_SUMMARY_SQL = f"""
+    CREATE TABLE IF NOT EXISTS {SUMMARY_TABLE} (
+        hour_start DATETIME NOT NULL,
+        department VARCHAR(100) NOT NULL DEFAULT '',
+        updates INT NOT NULL DEFAULT 0,
+        updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
+        PRIMARY KEY (hour_start, department)
+    ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4;
+"""
+
+# 从页面表重建汇总（汇总表新建时执行一次）
+BACKFILL_SUMMARY_SQL = f"""
+    INSERT INTO {SUMMARY_TABLE} (hour_start, department, updates)
+    SELECT DATE_FORMAT(last_modified, '%Y-%m-%d %H:00:00'), COALESCE(department, ''), COUNT(*)
+    FROM confluence_pages
+    WHERE last_modified IS NOT NULL AND is_deleted = 0
+    GROUP BY 1, 2
+    ON DUPLICATE KEY UPDATE updates = VALUES(updates)
+"""
+
+RECORD_UPDATES_SQL = f"""
+    INSERT INTO {SUMMARY_TABLE} (hour_start, department, updates)
+    VALUES (%s, %s, %s)
+    ON DUPLICATE KEY UPDATE updates = updates + VALUES(updates)
+"""
+
+UPDATES_SQL = """
+    SELECT page_id, title, author, last_modified, url, micro_link, pdf_link, department, code
+    FROM confluence_pages
+    WHERE last_modified >= %s AND last_modified < %s AND is_deleted = 0
+    ORDER BY department, last_modified DESC
+"""
+
+
+def format_time(value):
+    """datetime 和 'YYYY-MM-DD HH:MM:SS' 字符串统一为字符串，便于比较"""
+    return value.strftime('%Y-%m-%d %H:%M:%S') if isinstance(value, datetime) else str(value)
+
+
+def hour_bucket(value):
+    """更新时间所在的小时，例如 '2024-01-02 03:00:00'"""
+    return format_time(value)[:13] + ':00:00'
+
+
+def changed_items(cursor, items):
+    """一批页面中新增或更新时间发生变化的页面，按主键查询库中已有的更新时间"""
+    page_ids = [str(item['page_id']) for item in items]
+    placeholders = ', '.join(['%s'] * len(page_ids))
+    cursor.execute(
+        f"SELECT page_id, last_modified FROM confluence_pages WHERE page_id IN ({placeholders})", page_ids)
+    stored = {str(page_id): last_modified for page_id, last_modified in cursor.fetchall()}
+    return [
+        item for item in items
+        if item.get('last_modified') and (
+            stored.get(str(item['page_id'])) is None
+            or format_time(stored[str(item['page_id'])]) != format_time(item['last_modified']))
+    ]
+
+
+def record_updates(cursor, items):
+    """按 (小时, 部门) 累加更新次数，与页面写入在同一个事务中提交
+
+    只增不减：页面的更新时间移到其他小时后，原来小时的计数保留（见 SUMMARY_TABLE 的说明）。
+    """
+    counts = Counter((hour_bucket(item['last_modified']), item.get('department') or '') for item in items)
+    if counts:
+        cursor.executemany(RECORD_UPDATES_SQL, [(hour, department, count)
+                                                for (hour, department), count in counts.items()])
+    return sum(counts.values())
+
+
+def get_update_counts(start, end=None):
+    """[start, end) 内各部门的更新次数 {部门: 次数}，只读取汇总表，按小时粒度（start 所在小时整点算起）
+
+    计数包含之后又被再次更新的页面，是页面表中实际结果数量的上界。
+    """
+    end = end or datetime.now()
+    with get_pool().connection() as conn:
+        with conn.cursor() as cursor:
+            cursor.execute(
+                f"SELECT department, SUM(updates) FROM {SUMMARY_TABLE} "
+                f"WHERE hour_start >= %s AND hour_start < %s GROUP BY department",
+                (hour_bucket(start), format_time(end)))
+            return {department: int(count) for department, count in cursor.fetchall()}
+
+
+def get_updates(start, end=None):
+    """[start, end) 内更新的页面，按部门和更新时间排序
+
+    先查汇总表，时间段内没有任何更新时不再扫描页面表；否则按 last_modified 索引做范围查询。
+    汇总表只作为是否有更新的判断（计数是上界，可能把没有结果的时间段判为有更新，但不会漏掉），
+    返回的页面以范围查询为准。
+    """
+    end = end or datetime.now()
+    counts = get_update_counts(start, end)
+    if not any(counts.values()):
+        logger.info(f"{format_time(start)} 至 {format_time(end)} 没有更新")
+        return []
+    with get_pool().connection() as conn:
+        with conn.cursor(pymysql.cursors.DictCursor) as cursor:
+            cursor.execute(UPDATES_SQL, (format_time(start), format_time(end)))
+            updates = cursor.fetchall()
+    logger.info(f"{format_time(start)} 至 {format_time(end)} 共 {len(updates)} 条更新，"
+                f"涉及 {len({update['department'] for update in updates})} 个部门")
+    return updates
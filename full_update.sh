@@ -19,10 +19,13 @@ mkdir -p logs
 # 设置日志文件
 LOG_FILE="logs/update_confluence.log"
 
+# 运行ID，Python 进程继承后写入日志、追踪文件和数据库
+export CONFLUENCE_RUN_ID="${CONFLUENCE_RUN_ID:-$(date '+%Y%m%d%H%M%S')-$$}"
+
 # 日志函数
 log_message() {
     local TIMESTAMP=$(date '+%Y-%m-%d %H:%M:%S')
-    echo "[$TIMESTAMP] $1" >> $LOG_FILE
+    echo "[$TIMESTAMP] [$CONFLUENCE_RUN_ID] $1" >> $LOG_FILE
 }
 
 # 清理指定进程
@@ -93,51 +96,10 @@ cleanup
 log_message "创建必要的目录"
 mkdir -p PDF_document records logs
 
-# 初始化数据库
-log_message "初始化数据库"
-python3 -c "
-from confluence.init_db import init_db
-init_db()
-" >> $LOG_FILE 2>&1
-
-if [ $? -ne 0 ]; then
-    log_message "数据库初始化失败"
-    exit 1
-fi
-
-# 获取 cookies
-log_message "开始获取 cookies"
-python3 -c "
-from confluence.utils.selenium_login import get_cookies
-from confluence.config import CONFLUENCE_CONFIG
-get_cookies(CONFLUENCE_CONFIG['base_url'], CONFLUENCE_CONFIG['username'], CONFLUENCE_CONFIG['password'])
-" >> $LOG_FILE 2>&1
-
-if [ $? -ne 0 ]; then
-    log_message "获取 cookies 失败"
-    exit 1
-fi
-
-# 获取所有页面ID
-log_message "开始获取所有页面ID"
-python3 -c "
-from confluence.spiders.full_update import run_spider_with_timeout
-success = run_spider_with_timeout('confluence_page_tree', timeout=1800)
-if not success:
-    raise Exception('获取页面ID失败')
-" >> $LOG_FILE 2>&1
-
-if [ $? -ne 0 ]; then
-    log_message "获取页面ID失败"
-    exit 1
-fi
-
-# 执行全量更新
-log_message "开始下载页面PDF"
-timeout $TIMEOUT python3 -c "
-from confluence.spiders.full_update import perform_full_update
-perform_full_update()
-" >> $LOG_FILE 2>&1
+# 初始化数据库、获取 cookies、获取页面ID、下载PDF和发送汇总邮件在同一个进程内完成，
+# 只登录一次并共享数据库连接池
+log_message "开始全量更新流程"
+timeout $TIMEOUT python3 -m confluence.spiders.orchestrator full >> $LOG_FILE 2>&1
 
 EXIT_CODE=$?
 if [ $EXIT_CODE -ne 0 ]; then
@@ -149,19 +111,6 @@ if [ $EXIT_CODE -ne 0 ]; then
     exit 1
 fi
 
-# 发送每日汇总邮件
-log_message "发送更新汇总邮件"
-python3 -c "
-from confluence.utils.email_sender import send_daily_summary
-from confluence.spiders.incremental_update import get_daily_updates
-updates = get_daily_updates()
-if updates:
-    send_daily_summary(updates)
-    print('发送更新汇总邮件成功')
-else:
-    print('没有需要汇总的更新')
-" >> $LOG_FILE 2>&1
-
 # 记录完成
 log_message "全量更新完成"
 log_message "----------------------------------------"
@@ -16,45 +16,24 @@ mkdir -p logs
 # 设置日志文件
 LOG_FILE="logs/incremental_update.log"
 
+# 运行ID，Python 进程继承后写入日志、追踪文件和数据库
+export CONFLUENCE_RUN_ID="${CONFLUENCE_RUN_ID:-$(date '+%Y%m%d%H%M%S')-$$}"
+
 # 日志函数
 log_message() {
     local TIMESTAMP=$(date '+%Y-%m-%d %H:%M:%S')
-    echo "[$TIMESTAMP] $1" >> $LOG_FILE
+    echo "[$TIMESTAMP] [$CONFLUENCE_RUN_ID] $1" >> $LOG_FILE
 }
 
 # 开始执行
 log_message "开始执行增量更新..."
 
-# 获取 cookies
-log_message "开始获取 cookies"
-python3 -c "
-from confluence.utils.selenium_login import get_cookies
-from confluence.config import CONFLUENCE_CONFIG
-get_cookies(CONFLUENCE_CONFIG['base_url'], CONFLUENCE_CONFIG['username'], CONFLUENCE_CONFIG['password'])
-" >> $LOG_FILE 2>&1
+# 获取 cookies、爬取和比较页面ID、下载PDF和发送汇总邮件在同一个进程内完成
+python3 -m confluence.spiders.orchestrator incremental >> $LOG_FILE 2>&1
 
 if [ $? -ne 0 ]; then
-    log_message "获取 cookies 失败"
-    exit 1
+    log_message "增量更新失败"
 fi
 
-# 执行增量更新（包括爬取和比较页面ID）
-python3 -c "
-from confluence.spiders.incremental_update import perform_incremental_update
-perform_incremental_update()
-" >> $LOG_FILE 2>&1
-
-# 发送更新汇总邮件
-python3 -c "
-from confluence.utils.email_sender import send_daily_summary
-from confluence.spiders.incremental_update import get_daily_updates
-updates = get_daily_updates()
-if updates:
-    send_daily_summary(updates)
-    print('发送更新汇总邮件成功')
-else:
-    print('本次没有新的更新')
-" >> $LOG_FILE 2>&1
-
 log_message "增量更新执行完成"
 echo "----------------------------------------" >> $LOG_FILE 
\ No newline at end of file
@@ -37,11 +37,15 @@ crontab -l > "$TEMP_CRON" 2>/dev/null
 sed -i '/incremental_update/d' "$TEMP_CRON"
 sed -i '/update_confluence/d' "$TEMP_CRON"
 sed -i '/manage_logs/d' "$TEMP_CRON"
+sed -i '/drain_outbox/d' "$TEMP_CRON"
 
 # 添加新的定时任务
 # 每3小时执行一次增量更新
 echo "0 */3 * * * cd $WORK_DIR && source venv/bin/activate && ./incremental_update.sh" >> "$TEMP_CRON"
 
+# 每10分钟发送发件箱中未发出或需要重试的邮件
+echo "*/10 * * * * cd $WORK_DIR && source venv/bin/activate && PYTHONPATH=$WORK_DIR python3 -m confluence.scripts.drain_outbox >> $LOGS_DIR/email_outbox.log 2>&1" >> "$TEMP_CRON"
+
 # 每天0点执行日志管理（备份当天日志并清理7天前的日志）
 echo "0 0 * * * $WORK_DIR/manage_logs.sh" >> "$TEMP_CRON"
 
@@ -54,6 +58,7 @@ rm "$TEMP_CRON"
 # 显示确认信息
 echo "定时任务已设置："
 echo "1. 每3小时执行一次增量更新"
-echo "2. 每天0点备份日志并清理7天前的日志"
+echo "2. 每10分钟发送发件箱中的邮件"
+echo "3. 每天0点备份日志并清理7天前的日志"
 echo "当前crontab内容："
 crontab -l
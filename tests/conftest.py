@@ -0,0 +1,28 @@
+import os
+import sys
+import importlib.util
+import pytest
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_ROOT)
+
+# 没有部署配置时使用示例配置，目录在各测试中指向临时目录
+try:
+    import confluence.config  # noqa: F401
+except ImportError:
+    spec = importlib.util.spec_from_file_location(
+        'confluence.config', os.path.join(REPO_ROOT, 'confluence', 'config.py.example'))
+    module = importlib.util.module_from_spec(spec)
+    sys.modules['confluence.config'] = module
+    spec.loader.exec_module(module)
+
+
+@pytest.fixture
+def workdir(tmp_path, monkeypatch):
+    """把 DIRS 指向临时目录"""
+    from confluence.config import DIRS
+    for name in ('pdf_dir', 'records_dir', 'logs_dir'):
+        path = tmp_path / name
+        path.mkdir()
+        monkeypatch.setitem(DIRS, name, str(path))
+    return tmp_path
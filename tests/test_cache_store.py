@@ -0,0 +1,76 @@
+from confluence.utils.cache_store import CompressedCacheStore
+
+
+def value(index, size=2000):
+    # 内容各不相同，压缩后仍有一定大小
+    return {'id': index, 'body': ''.join(chr(33 + (index * 7 + i * 13) % 90) for i in range(size))}
+
+
+def test_put_get_and_reload(tmp_path):
+    store = CompressedCacheStore(str(tmp_path))
+    store.put('a', value(1))
+    store.put('b', value(2))
+    store.put('a', value(3))
+    store.close()
+
+    reopened = CompressedCacheStore(str(tmp_path))
+    assert len(reopened) == 2
+    assert reopened.get('a') == value(3)
+    assert reopened.get('b') == value(2)
+    reopened.close()
+
+
+def test_disk_budget_evictions_survive_reload(tmp_path):
+    store = CompressedCacheStore(str(tmp_path))
+    store.put('probe', value(0))
+    frame_size = store.live_size
+    store.close()
+
+    store = CompressedCacheStore(str(tmp_path), disk_budget=int(frame_size * 3.5))
+    for index in range(1, 10):
+        store.put(f"key{index}", value(index))
+    kept = set(store.index)
+    assert store.evictions > 0
+    assert store.live_size <= store.disk_budget
+    store.close()
+
+    # 未压缩的情况下重新打开，被淘汰的条目不能从只追加的索引中恢复
+    reopened = CompressedCacheStore(str(tmp_path), disk_budget=int(frame_size * 3.5))
+    assert set(reopened.index) == kept
+    assert reopened.get('probe') is None
+    assert reopened.get('key1') is None
+    assert reopened.get('key9') == value(9)
+    reopened.close()
+
+
+def test_expired_entries_survive_reload(tmp_path):
+    store = CompressedCacheStore(str(tmp_path))
+    store.put('old', value(1))
+    store.put('new', value(2))
+    store.index['old'].timestamp -= 3600
+    assert store.get('old', max_age=60) is None
+    store.close()
+
+    reopened = CompressedCacheStore(str(tmp_path))
+    assert 'old' not in reopened
+    assert reopened.get('new') == value(2)
+    reopened.close()
+
+
+def test_compaction_drops_evicted_frames(tmp_path):
+    store = CompressedCacheStore(str(tmp_path), compact_ratio=1.0)
+    for index in range(5):
+        store.put(f"key{index}", value(index))
+    for index in range(3):
+        store.put(f"key{index}", value(index + 10))
+    assert store.get('key4', max_age=-1) is None
+    store.compact()
+    # 覆盖前的旧帧和已过期的条目都不再占用数据文件
+    assert store.data_size == store.live_size
+    assert store.get('key0') == value(10)
+    store.close()
+
+    reopened = CompressedCacheStore(str(tmp_path))
+    assert sorted(reopened.index) == ['key0', 'key1', 'key2', 'key3']
+    assert reopened.get('key3') == value(3)
+    reopened.close()
@@ -0,0 +1,54 @@
+import os
+import argparse
+import threading
+import pytest
+
+pytest.importorskip('scrapy')
+
+
+@pytest.fixture
+def fake_server():
+    """在后台线程中运行的模拟 Confluence 服务器（2 个根页面，深度 2）"""
+    from benchmarks.fake_confluence import add_server_arguments, create_server
+    parser = argparse.ArgumentParser()
+    add_server_arguments(parser)
+    server = create_server(parser.parse_args(['--latency', '0', '--pdf-latency', '0']))
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    try:
+        yield server
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
+def test_clean_tree_crawl_reports_finished_and_reconciles(workdir, fake_server, monkeypatch):
+    # reactor 每个进程只能启动一次，完整爬取只在这一个测试中运行
+    monkeypatch.setenv('SCRAPY_SETTINGS_MODULE', 'confluence.settings')
+    from scrapy.utils.project import get_project_settings
+    from confluence.config import DIRS, FILES
+    from confluence.spiders import reconcile
+    from confluence.spiders.orchestrator import CrawlOrchestrator
+
+    with open(os.path.join(DIRS['records_dir'], FILES['father_page_ids']), 'w', encoding='utf-8') as f:
+        for index, page_id in enumerate(fake_server.forest.roots, 1):
+            f.write(f"{page_id} 部门{index} D{index:02d}\n")
+
+    settings = get_project_settings()
+    settings.setdict({
+        'ITEM_PIPELINES': {},
+        'LOG_FILE': os.path.join(DIRS['logs_dir'], 'crawl.log'),
+        'DOWNLOAD_DELAY': 0
+    }, priority='cmdline')
+    orchestrator = CrawlOrchestrator(total_timeout=120, settings=settings)
+    orchestrator.cookies = [{'name': 'JSESSIONID', 'value': 'test'}]
+    orchestrator.add_stage('confluence_page_tree', base_url=fake_server.base_url)
+
+    assert orchestrator.run()
+    assert orchestrator.results == {'confluence_page_tree': 'finished'}
+
+    # full_update 和 incremental_update 在爬取结束后都经由 reconcile_after_crawl 进入清理
+    calls = []
+    monkeypatch.setattr(reconcile, 'perform_reconciliation', lambda: calls.append(True) or {'deleted': []})
+    assert reconcile.reconcile_after_crawl(orchestrator) == {'deleted': []}
+    assert calls == [True]
@@ -0,0 +1,101 @@
+import time
+from email.mime.text import MIMEText
+import pytest
+from confluence.utils.outbox import Outbox, drain, outbox_settings, STATUS_FAILED, STATUS_PENDING
+
+
+class FakeSession:
+    """按预设结果发送的 SMTP 会话，True 表示成功，异常实例表示失败"""
+
+    def __init__(self, outcomes, sent):
+        self.outcomes = outcomes
+        self.sent = sent
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def send(self, msg):
+        outcome = self.outcomes.pop(0) if self.outcomes else True
+        if isinstance(outcome, Exception):
+            raise outcome
+        self.sent.append(msg['Subject'])
+
+    def close(self):
+        pass
+
+
+def message(subject):
+    msg = MIMEText(f"<p>{subject}</p>", 'html', 'utf-8')
+    msg['Subject'] = subject
+    msg['To'] = 'someone@example.com'
+    return msg
+
+
+@pytest.fixture
+def outbox(tmp_path):
+    with Outbox(str(tmp_path / 'outbox.sqlite3')) as box:
+        yield box
+
+
+@pytest.fixture
+def settings():
+    return dict(outbox_settings(), rate_per_minute=0, backoff_base=60, backoff_max=300, max_attempts=3)
+
+
+def test_drain_sends_and_backs_off_failures(outbox, settings):
+    assert outbox.enqueue(message(f"m{index}") for index in range(3)) == 3
+    sent = []
+    outcomes = [True, OSError('connection reset'), True]
+    stats = drain(outbox, session_factory=lambda: FakeSession(outcomes, sent), settings=settings)
+
+    assert sent == ['m0', 'm2']
+    assert stats['sent'] == 2 and stats['failed'] == 1
+    assert stats['outbox'] == {'sent': 2, STATUS_PENDING: 1}
+    # 失败的邮件按退避时间推迟，本轮不会再次发送
+    assert outbox.due(10) == []
+    attempts, next_attempt, error = outbox.conn.execute(
+        "SELECT attempts, next_attempt, last_error FROM outbox WHERE status = ?", (STATUS_PENDING,)).fetchone()
+    assert attempts == 1
+    assert 50 < next_attempt - time.time() <= 60
+    assert 'connection reset' in error
+
+
+def test_backoff_grows_then_gives_up(outbox, settings):
+    outbox.enqueue([message('retry')])
+    (message_id, attempts), = outbox.due(10)
+    delays = []
+    for _ in range(settings['max_attempts']):
+        before = time.time()
+        outbox.mark_failed(message_id, attempts, 'timeout', settings)
+        attempts, next_attempt, status = outbox.conn.execute(
+            "SELECT attempts, next_attempt, status FROM outbox WHERE id = ?", (message_id,)).fetchone()
+        delays.append(round(next_attempt - before))
+    assert delays == [60, 120, 0]
+    assert status == STATUS_FAILED
+    assert outbox.counts() == {STATUS_FAILED: 1}
+
+    assert outbox.retry_failed() == 1
+    sent = []
+    stats = drain(outbox, session_factory=lambda: FakeSession([], sent), settings=settings)
+    assert sent == ['retry'] and stats['sent'] == 1
+
+
+def test_drain_stops_after_consecutive_failures(outbox, settings):
+    outbox.enqueue(message(f"m{index}") for index in range(5))
+    settings['max_consecutive_failures'] = 2
+    outcomes = [OSError('down')] * 5
+    stats = drain(outbox, session_factory=lambda: FakeSession(outcomes, []), settings=settings)
+    assert stats['failed'] == 2
+    assert stats['outbox'] == {STATUS_PENDING: 5}
+
+
+def test_drain_skips_when_another_sender_holds_the_lock(outbox, settings):
+    outbox.enqueue([message('locked')])
+    with outbox.sender_lock() as acquired:
+        assert acquired
+        stats = drain(outbox, session_factory=lambda: FakeSession([], []), settings=settings)
+    assert stats == {'sent': 0, 'failed': 0}
+    assert outbox.counts() == {STATUS_PENDING: 1}
@@ -0,0 +1,78 @@
+from confluence.utils.page_frontier import PageFrontier, walk_frontier
+from confluence.utils.page_queue import PageHandoffQueue
+
+
+def drain(frontier):
+    entries = []
+    while True:
+        entry = frontier.pop()
+        if entry is None:
+            return entries
+        entries.append(entry)
+
+
+def test_frontier_depth_limit_matches_baseline():
+    # max_depth=5 只展开深度 0 至 4 的页面
+    frontier = PageFrontier(max_depth=5)
+    assert frontier.push('1', 'd', 'c', 4)
+    assert not frontier.push('2', 'd', 'c', 5)
+    assert frontier.depth_limited == 1
+    assert not frontier.accepts(5)
+
+
+def test_frontier_space_budget():
+    frontier = PageFrontier(max_pages_per_space=2)
+    assert frontier.push('1', 'd', 'c', 0, space='A')
+    assert frontier.push('2', 'd', 'c', 1, space='A')
+    assert not frontier.push('3', 'd', 'c', 1, space='A')
+    assert frontier.push('4', 'd', 'c', 1, space='B')
+    assert frontier.breadth_limited == 1
+
+
+def test_frontier_spool_keeps_fifo_order(tmp_path):
+    spool = tmp_path / 'frontier.spool'
+    frontier = PageFrontier(max_in_memory=3, spool_path=str(spool))
+    for page_id in range(10):
+        frontier.push(page_id, 'd', 'c', 0, space='S')
+    assert spool.exists()
+    assert len(frontier) == 10
+    first = [frontier.pop().page_id for _ in range(2)]
+    for page_id in range(10, 12):
+        frontier.push(page_id, 'd', 'c', 1, space='S')
+    rest = [entry.page_id for entry in drain(frontier)]
+    assert first + rest == [str(page_id) for page_id in range(12)]
+    frontier.cleanup()
+    assert not spool.exists()
+
+
+def test_walk_frontier_expands_each_page_once():
+    tree = {'1': ['2', '3'], '2': ['4'], '3': ['4', '5'], '4': [], '5': ['6'], '6': []}
+    expanded = []
+
+    def expand(entry):
+        expanded.append(entry.page_id)
+        return [(child, 'S') for child in tree[entry.page_id]]
+
+    frontier = PageFrontier(max_depth=3)
+    frontier.push('1', 'd', 'c', 0, space='S')
+    walk_frontier(frontier, expand, workers=2)
+    # 页面 6 位于深度 3，不再展开
+    assert sorted(expanded) == ['1', '2', '3', '4', '5']
+
+
+def test_handoff_queue_dedupes_excludes_and_spills(tmp_path):
+    spool = tmp_path / 'handoff.spool'
+    page_queue = PageHandoffQueue(maxsize=2, spool_path=str(spool), exclude={99})
+    notified = []
+    page_queue.add_listener(lambda: notified.append(True))
+    for page_id in (1, 2, 3, 2, 99, 4):
+        page_queue.put(page_id, 'd', 'c')
+    assert page_queue.put_count == 4
+    assert len(page_queue) == 4
+    assert [page[0] for page in page_queue.get_batch(3)] == ['1', '2', '3']
+    page_queue.close()
+    assert not page_queue.put(5, 'd', 'c')
+    assert not page_queue.drained
+    assert page_queue.get_batch(10) == [('4', 'd', 'c')]
+    assert page_queue.drained
+    assert len(notified) == 5
@@ -0,0 +1,46 @@
+from confluence.utils.page_ledger import PageLedger
+from confluence.utils.page_registry import PageRegistry
+
+
+def test_registry_add_update_discard():
+    pages = PageRegistry([('3', '部门A', 'A01'), ('1', '部门B', 'B01')])
+    assert len(pages) == 2
+    assert not pages.add('3', '部门A', 'A01')
+    assert pages.add('3', '部门B', 'B01')
+    assert tuple(pages.get(3)) == ('3', '部门B', 'B01')
+    assert ('3', '部门B', 'B01') in pages
+    assert ('3', '部门A', 'A01') not in pages
+    assert '1' in pages
+    assert pages.discard('1')
+    assert not pages.discard('1')
+    assert pages.get(1) is None
+    assert list(pages.iter_sorted()) == [('3', '部门B', 'B01')]
+
+
+def test_registry_difference():
+    old = PageRegistry([(1, 'd', 'c'), (2, 'd', 'c'), (5, 'd', 'c')])
+    new = PageRegistry([(2, 'd', 'c'), (7, 'd', 'c')])
+    assert list(old.difference(new)) == [1, 5]
+    assert list(new.difference(old)) == [7]
+    assert list(old.ids()) == [1, 2, 5]
+
+
+def test_ledger_replays_journal_and_compacts(tmp_path):
+    path = str(tmp_path / 'all_page_ids.txt')
+    ledger = PageLedger(path, compact_threshold=3)
+    ledger.append('10', '部门A', 'A01')
+    ledger.append('11', '部门A', 'A01')
+    assert ledger.flush() == 2
+    ledger.remove('10', '部门A', 'A01')
+    ledger.append('12', '部门B', 'B01')
+    ledger.flush()
+
+    pages = PageLedger(path).load()
+    assert sorted(pages) == [('11', '部门A', 'A01'), ('12', '部门B', 'B01')]
+    assert ledger.needs_compaction
+
+    ledger.compact(pages)
+    assert not (tmp_path / 'all_page_ids.txt.journal').exists()
+    with open(path, encoding='utf-8') as f:
+        assert f.read() == "11\t部门A\tA01\n12\t部门B\tB01\n"
+    assert sorted(PageLedger(path).load()) == sorted(pages)
@@ -0,0 +1,96 @@
+from types import SimpleNamespace
+from contextlib import contextmanager
+from confluence.spiders import reconcile
+from confluence.utils.page_registry import PageRegistry
+
+
+def crawl_result(reason='finished', failed_expansions=0):
+    return SimpleNamespace(
+        results={'confluence_page_tree': reason},
+        stats={'confluence_page_tree': {'page_tree/failed_expansions': failed_expansions}}
+    )
+
+
+def test_gate_opens_only_for_finished_complete_crawl():
+    assert reconcile.tree_crawl_complete(crawl_result())
+    assert not reconcile.tree_crawl_complete(crawl_result('closespider_timeout'))
+    assert not reconcile.tree_crawl_complete(crawl_result(failed_expansions=3))
+    assert not reconcile.tree_crawl_complete(SimpleNamespace(results={}, stats={}))
+
+
+def test_reconcile_after_crawl_skips_incomplete_crawl(monkeypatch):
+    calls = []
+    monkeypatch.setattr(reconcile, 'perform_reconciliation', lambda: calls.append(True))
+    assert reconcile.reconcile_after_crawl(crawl_result(failed_expansions=1)) is None
+    assert calls == []
+
+
+class FakeCursor:
+    def __init__(self, conn):
+        self.conn = conn
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+    def execute(self, sql, params=None):
+        self.conn.executed.append((sql, params))
+
+    def executemany(self, sql, rows):
+        self.conn.executed.append((sql, list(rows)))
+
+    def fetchall(self):
+        return self.conn.rows
+
+
+class FakePool:
+    """数据库中已有 rows 中的页面，记录执行的语句"""
+
+    def __init__(self, rows):
+        self.rows = rows
+        self.executed = []
+
+    def cursor(self):
+        return FakeCursor(self)
+
+    def commit(self):
+        pass
+
+    @contextmanager
+    def connection(self):
+        yield self
+
+
+def stored_pages(count):
+    return [(str(page_id), '部门A', 'A01') for page_id in range(1, count + 1)]
+
+
+def updates(pool):
+    return [sql for sql, _ in pool.executed if sql.lstrip().startswith('UPDATE')]
+
+
+def test_reconciliation_refuses_to_delete_past_safety_cap(workdir, monkeypatch):
+    pool = FakePool(stored_pages(10))
+    monkeypatch.setattr(reconcile, 'get_pool', lambda: pool)
+    live = PageRegistry(stored_pages(6))
+    assert reconcile.perform_reconciliation(live, max_delete_ratio=0.3, verify=False) is None
+    assert updates(pool) == []
+
+
+def test_reconciliation_deletes_and_moves_within_cap(workdir, monkeypatch):
+    pool = FakePool(stored_pages(10))
+    monkeypatch.setattr(reconcile, 'get_pool', lambda: pool)
+    pdf_dir = workdir / 'pdf_dir'
+    (pdf_dir / '标题_部门A_煜象科技_9.pdf').write_bytes(b'%PDF')
+    (pdf_dir / '标题_部门A_煜象科技_3.pdf').write_bytes(b'%PDF')
+    live = PageRegistry(stored_pages(8))
+    live.add('3', '部门B', 'B01')
+
+    result = reconcile.perform_reconciliation(live, max_delete_ratio=0.3, verify=False)
+    assert sorted(result['deleted']) == [9, 10]
+    assert result['moved'] == [('部门B', 'B01', '3')]
+    assert result['pdf_removed'] == 1
+    assert sorted(path.name for path in pdf_dir.iterdir()) == ['标题_部门A_煜象科技_3.pdf']
+    assert len(updates(pool)) == 2
@@ -0,0 +1,42 @@
+from confluence.utils.digest import group_by_department
+from confluence.utils.subscriptions import SubscriptionIndex
+
+UPDATES = [
+    {'page_id': '1', 'department': '研发部', 'code': 'RD01'},
+    {'page_id': '2', 'department': '研发部', 'code': 'RD02'},
+    {'page_id': '3', 'department': '市场部', 'code': 'MK01'},
+    {'page_id': '4', 'department': '财务部', 'code': 'FN01'},
+]
+
+
+def test_fan_out_by_department_and_code():
+    index = SubscriptionIndex.from_config({
+        'recipients': ['all@example.com'],
+        'department_recipients': {'研发部': ['rd@example.com', 'rd2@example.com']},
+        'subscriptions': {
+            'mk@example.com': {'departments': ['市场部'], 'codes': ['FN01']},
+            'rd@example.com': {'codes': ['RD01']},
+        },
+    })
+    groups = group_by_department(UPDATES)
+    result = index.fan_out(groups)
+
+    assert result[0] == (['all@example.com'], groups)
+    selections = {tuple(recipients): selection for recipients, selection in result[1:]}
+    # 订阅内容相同的收件人合并为一封
+    assert set(selections) == {('rd2@example.com', 'rd@example.com'), ('mk@example.com',)}
+    assert [update['page_id'] for update in selections[('rd2@example.com', 'rd@example.com')]['研发部']] == ['1', '2']
+    mk = selections[('mk@example.com',)]
+    assert list(mk) == ['市场部', '财务部']
+    assert [update['page_id'] for update in mk['财务部']] == ['4']
+
+
+def test_fan_out_merges_by_page_id():
+    index = SubscriptionIndex.from_config({
+        'subscriptions': {
+            'a@example.com': {'codes': ['RD01']},
+            'b@example.com': {'codes': ['RD02']},
+        },
+    })
+    result = index.fan_out(group_by_department(UPDATES))
+    assert sorted(recipients for recipients, _ in result) == [['a@example.com'], ['b@example.com']]